@@ -0,0 +1,81 @@
+"""歷史分析：哪些店家/品項/客製最受歡迎、誰常常晚付款
+
+orders 每次關帳都會清空，所以這裡不掃訂單，只讀每日彙總表 (db._m007_daily_rollups)：
+rollup_items / rollup_customs / rollup_people 由 orders 的 trigger 在每次下單、刪單、收款時增量維護，
+一年的資料也只有幾萬列，每個查詢都是主鍵 (day, ...) 的範圍掃描。
+
+    since = analytics.period_start(90)          # 近 90 天；None = 全部
+    analytics.shop_trend(since, "week")         # DataFrame: period, shop, orders, revenue
+    analytics.top_items(since, "主餐")
+    analytics.payment_habits(since)
+"""
+from datetime import date, timedelta
+
+import db
+
+# 期間 -> 天數 (None = 全部)
+PERIODS = {"近 30 天": 30, "近 90 天": 90, "近一年": 365, "全部": None}
+# 趨勢圖的時間粒度 (day 欄位是 'YYYY-MM-DD')
+BUCKETS = {
+    "day": "day",
+    "week": "date(day, '-6 days', 'weekday 1')",  # 該週的星期一
+    "month": "substr(day, 1, 7)",
+}
+TOP_LIMIT = 10
+
+
+def period_start(days):
+    """近 days 天 (含今天) 的第一天；days 為 None 時回傳 None (不限)"""
+    return None if days is None else (date.today() - timedelta(days=days - 1)).isoformat()
+
+def bucket_for(days):
+    # 點數不要太多：一個月內看每天，一季看每週，再長看每月
+    if days is not None and days <= 31: return "day"
+    return "week" if days is not None and days <= 120 else "month"
+
+def _query(query, since, params=()):
+    where = "day >= ?" if since else "1"
+    with db.reading() as conn:
+        return db._frame(conn, query.format(where=where), ((since,) if since else ()) + tuple(params))
+
+
+def totals(since=None):
+    """期間內的總筆數、總營業額、點過餐的人數、未收金額"""
+    with db.reading() as conn: return conn.execute(
+        "SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0), COUNT(DISTINCT name), "
+        "COALESCE(SUM(revenue - paid_revenue), 0) FROM rollup_people WHERE orders > 0"
+        + (" AND day >= ?" if since else ""), (since,) if since else ()).fetchone()
+
+def shop_trend(since=None, bucket="day"):
+    """每期每家店的筆數與營業額 (period, shop, orders, revenue)"""
+    return _query(f"""SELECT g.period, s.name AS shop, g.orders, g.revenue FROM (
+        SELECT {BUCKETS[bucket]} AS period, shop_id, SUM(orders) AS orders, SUM(revenue) AS revenue
+        FROM rollup_items WHERE {{where}} GROUP BY 1, 2 HAVING SUM(orders) > 0
+        ) g LEFT JOIN shops s ON s.id = g.shop_id ORDER BY g.period, shop""", since)
+
+def top_items(since=None, category=None, limit=TOP_LIMIT):
+    """點最多的品項 (item_name, shop, orders, quantity, revenue)"""
+    cat = "" if category is None else f" AND cat = {db.CATEGORY_IDS[category]}"
+    return _query(f"""SELECT g.item_name, s.name AS shop, g.orders, g.quantity, g.revenue FROM (
+        SELECT item_name, shop_id, SUM(orders) AS orders, SUM(quantity) AS quantity, SUM(revenue) AS revenue
+        FROM rollup_items WHERE {{where}}{cat} GROUP BY item_name, shop_id HAVING SUM(orders) > 0
+        ORDER BY quantity DESC LIMIT ?) g LEFT JOIN shops s ON s.id = g.shop_id ORDER BY g.quantity DESC""",
+        since, (limit,))
+
+def top_customs(since=None, category=None, limit=TOP_LIMIT):
+    """最常見的客製化組合 (custom, orders, quantity)；沒有客製的不算"""
+    cat = "" if category is None else f" AND cat = {db.CATEGORY_IDS[category]}"
+    return _query(f"""SELECT c.label AS custom, g.orders, g.quantity FROM (
+        SELECT custom_id, SUM(orders) AS orders, SUM(quantity) AS quantity
+        FROM rollup_customs WHERE {{where}}{cat} GROUP BY custom_id HAVING SUM(orders) > 0
+        ) g JOIN customizations c ON c.id = g.custom_id WHERE c.label != ''
+        ORDER BY g.orders DESC LIMIT ?""", since, (limit,))
+
+def payment_habits(since=None):
+    """每人的付款狀況 (name, orders, unpaid_orders, unpaid, avg_pay_minutes)，未付多的、付得慢的在前。
+    avg_pay_minutes 只算有記到收款時間的訂單，沒有時為 None。"""
+    return _query("""SELECT name, SUM(orders) AS orders, SUM(orders - paid_orders) AS unpaid_orders,
+        SUM(revenue - paid_revenue) AS unpaid,
+        ROUND(SUM(pay_seconds) / 60.0 / NULLIF(SUM(timed_payments), 0), 1) AS avg_pay_minutes
+        FROM rollup_people WHERE {where} GROUP BY name HAVING SUM(orders) > 0
+        ORDER BY unpaid_orders DESC, avg_pay_minutes DESC NULLS LAST, name""", since)
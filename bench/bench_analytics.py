@@ -0,0 +1,151 @@
+"""歷史分析 benchmark：每日彙總表 (analytics.py) vs. 直接掃 orders_archive
+
+用法: python bench/bench_analytics.py [--days 365] [--per-day 120] [--repeat 20]
+
+每天一場 (下單 -> 收款 -> 關帳)，共 days 天。量：
+- 下單時 trigger 維護彙總表的成本 (同樣的 INSERT 有/沒有 rollup trigger)
+- 「全部期間」各個分析查詢的延遲，與同樣結果直接從原始訂單 GROUP BY 的延遲
+開始量之前先檢查 rollup_people：同時改價錢、付款狀態與名字的 UPDATE 之後，要跟原始訂單加總一致
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import db
+
+ITEMS = ["雞腿飯", "排骨飯", "牛肉麵", "咖哩飯", "鍋貼", "水餃", "紅茶", "綠茶", "奶茶", "美式", "拿鐵", "冬瓜茶"]
+CUSTOMS = ["", "微辣", "小辣 | 不要蔥", "L(大杯)/無糖/去冰", "M(中杯)/半糖/少冰 | 加珍珠"]
+SHOPS = ["八方雲集", "池上便當", "麥味登", "五十嵐", "清心福全"]
+
+
+def day_rows(day, n):
+    return [(f"user{random.randrange(80)}", random.choice(db.CATEGORIES), random.choice(ITEMS),
+             random.choice([50, 80, 100, 120]), random.choice(CUSTOMS), random.randint(1, 2),
+             f"{day} 12:{random.randrange(60):02d}", 0) for _ in range(n)]
+
+def insert(conn, rows):
+    conn.executemany("INSERT INTO orders_legacy (name, category, item_name, price, custom, quantity, order_time, "
+                     "is_paid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def seed(days, per_day):
+    random.seed(9)
+    start = date.today() - timedelta(days=days - 1)
+    t = time.perf_counter()
+    for i in range(days):
+        day = start + timedelta(days=i)
+        db.set_shop_name("main", SHOPS[i % 3]); db.set_shop_name("drink", SHOPS[3 + i % 2])
+        rows = day_rows(day, per_day)
+        def one_day(conn):
+            insert(conn, rows)
+            # 大部分人幾分鐘內付款，少數人沒付
+            conn.execute("UPDATE orders SET is_paid = 1, paid_at = ordered_at + abs(random() % 3600) "
+                         "WHERE abs(random() % 10) > 0")
+            db._close_session(conn)
+        db.run_write(one_day)
+    return time.perf_counter() - t
+
+
+def insert_cost(rows):
+    # 同一批 INSERT，拿掉 rollup trigger 前後各量一次 (在 rollback 掉的 transaction 裡)
+    def run(conn):
+        t = time.perf_counter()
+        conn.execute("SAVEPOINT bench")
+        insert(conn, rows)
+        conn.execute("ROLLBACK TO bench"); conn.execute("RELEASE bench")
+        return (time.perf_counter() - t) / len(rows) * 1e6
+    with_rollups = min(db.run_write(run) for _ in range(5))
+    sqls = db.run_write(lambda conn: conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_orders_rollup_%'").fetchall())
+    db.run_write(lambda conn: [conn.execute(f"DROP TRIGGER {name}") for name, _ in sqls])
+    without = min(db.run_write(run) for _ in range(5))
+    db.run_write(lambda conn: [conn.execute(sql) for _, sql in sqls])
+    return with_rollups, without
+
+
+PEOPLE_COLS = "is_paid, price, ordered_at, name, paid_at"
+PEOPLE_RAW = f"""SELECT date(ordered_at, 'unixepoch', 'localtime'), name, COUNT(*), SUM(price), SUM(is_paid != 0),
+    SUM(CASE WHEN is_paid != 0 THEN price ELSE 0 END) FROM (SELECT {PEOPLE_COLS} FROM orders
+    UNION ALL SELECT {PEOPLE_COLS} FROM orders_archive) GROUP BY 1, 2 ORDER BY 1, 2"""
+
+def check_people_rollup(reader):
+    # 一個 UPDATE 同時動到兩個 rollup trigger 的欄位 (price、is_paid、name)，rollup_people 只能被算一次
+    insert_rows = day_rows(date.today(), 40)
+    db.run_write(lambda conn: insert(conn, insert_rows))
+    db.run_write(lambda conn: conn.execute(
+        "UPDATE orders SET price = price + 10, is_paid = 1 - is_paid, paid_at = ordered_at + 60, "
+        "name = name || '_' WHERE id % 3 = 0"))
+    db.run_write(lambda conn: conn.execute("UPDATE orders SET is_paid = 1, price = price - 5 WHERE id % 3 = 1"))
+    rolled = reader.execute("""SELECT day, name, orders, revenue, paid_orders, paid_revenue FROM rollup_people
+        WHERE orders != 0 OR revenue != 0 OR paid_orders != 0 OR paid_revenue != 0 ORDER BY 1, 2""").fetchall()
+    raw = reader.execute(PEOPLE_RAW).fetchall()
+    if rolled != raw:
+        sys.exit(f"rollup_people does not match orders after a mixed UPDATE "
+                 f"({len(set(rolled) ^ set(raw))} rows differ)")
+    print(f"rollup_people matches orders after a mixed UPDATE ({len(raw)} person-days)")
+
+
+RAW = {
+    "shop_trend": """SELECT substr(date(ordered_at, 'unixepoch', 'localtime'), 1, 7) AS period, s.name, COUNT(*),
+        SUM(price) FROM orders_archive o LEFT JOIN shops s ON s.id = o.shop_id GROUP BY 1, 2 ORDER BY 1, 2""",
+    "top_items": """SELECT item_name, shop_id, COUNT(*), SUM(quantity) AS q, SUM(price) FROM orders_archive
+        WHERE cat = 0 GROUP BY item_name, shop_id ORDER BY q DESC LIMIT 10""",
+    "top_customs": """SELECT c.label, COUNT(*) AS n, SUM(quantity) FROM orders_archive o
+        JOIN customizations c ON c.id = o.custom_id WHERE cat = 0 AND c.label != '' GROUP BY o.custom_id
+        ORDER BY n DESC LIMIT 10""",
+    "payment_habits": """SELECT name, COUNT(*), SUM(is_paid = 0), SUM(CASE WHEN is_paid = 0 THEN price END),
+        AVG(paid_at - ordered_at) / 60.0 FROM orders_archive GROUP BY name""",
+}
+ROLLUP = {
+    "shop_trend": lambda: analytics.shop_trend(None, "month"),
+    "top_items": lambda: analytics.top_items(None, "主餐"),
+    "top_customs": lambda: analytics.top_customs(None, "主餐"),
+    "payment_habits": lambda: analytics.payment_habits(None),
+}
+
+
+def timed_ms(fn, repeat):
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat): fn()
+    return (time.perf_counter() - t) / repeat * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--per-day", type=int, default=120)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "analytics.db")
+    db.ensure_schema(lambda: ([], {}))
+    seconds = seed(args.days, args.per_day)
+    reader = db.open_connection(db.get_manager().db_file)
+    count = lambda t: reader.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+    print(f"{count('orders_archive')} archived orders over {args.days} days (seeded in {seconds:.1f} s); rollup rows: "
+          + ", ".join(f"{t} {count(t)}" for t in db.ROLLUP_TABLES))
+
+    check_people_rollup(reader)
+    with_rollups, without = insert_cost(day_rows(date.today(), 200))
+    print(f"insert cost: {without:.1f} µs/order without rollup triggers, {with_rollups:.1f} µs/order with\n")
+
+    print(f"{'query (whole history)':<22}{'raw scan ms':>13}{'rollups ms':>12}")
+    total = 0
+    for name in ROLLUP:
+        raw = timed_ms(lambda: reader.execute(RAW[name]).fetchall(), args.repeat)
+        rolled = timed_ms(ROLLUP[name], args.repeat)
+        total += rolled
+        print(f"{name:<22}{raw:>13.2f}{rolled:>12.2f}")
+    total += timed_ms(lambda: analytics.totals(None), args.repeat)
+    print(f"\nwhole dashboard (all queries incl. totals): {total:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
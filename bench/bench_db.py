@@ -0,0 +1,84 @@
+"""連線層 micro-benchmark：每次查詢都 connect (舊版) vs. 共用長駐連線 (db.py)
+
+用法: python bench/bench_db.py [--seconds 3] [--rows 200]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import db
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, category TEXT, item_name TEXT,
+        price INTEGER, custom TEXT, quantity INTEGER, order_time TEXT, is_paid BOOLEAN)''')
+    conn.executemany(
+        "INSERT INTO orders (name, category, item_name, price, custom, quantity, order_time, is_paid) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+        [(f"user{i % 30}", "主餐" if i % 2 else "飲料", f"item{i % 15}", 100, "", 1, "2024-01-01 12:00") for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+# --- 舊版實作 (每次呼叫都 connect/close) ---
+def legacy_get_db(path, query, params=()):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    return df
+
+def legacy_execute_db(path, query, params=()):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+    conn.execute(query, params)
+    conn.commit()
+    conn.close()
+
+
+def measure(label, fn, seconds):
+    n = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        fn()
+        n += 1
+    qps = n / seconds
+    print(f"{label:<32} {qps:>10.0f} q/s")
+    return qps
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=3)
+    ap.add_argument("--rows", type=int, default=200)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "bench.db")
+    seed(path, args.rows)
+    db.DB_FILE = path  # 讓 db.* helper 指向測試檔案
+
+    point = ("SELECT * FROM orders WHERE id = ?", (1,))
+    full = ("SELECT * FROM orders", ())
+    write = ("UPDATE orders SET is_paid = 1 - is_paid WHERE id = ?", (1,))
+
+    results = {
+        "read_point": (measure("before: get_db (point)", lambda: legacy_get_db(path, *point), args.seconds),
+                       measure("after:  get_db (point)", lambda: db.get_db(*point), args.seconds)),
+        "read_full": (measure("before: get_db (full table)", lambda: legacy_get_db(path, *full), args.seconds),
+                      measure("after:  get_db (full table)", lambda: db.get_db(*full), args.seconds)),
+        "write": (measure("before: execute_db", lambda: legacy_execute_db(path, *write), args.seconds),
+                  measure("after:  execute_db", lambda: db.execute_db(*write), args.seconds)),
+    }
+    print()
+    for k, (before, after) in results.items():
+        print(f"{k:<12} x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
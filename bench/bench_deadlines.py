@@ -0,0 +1,95 @@
+"""點餐截止 benchmark：截止後看板讀送出紀錄 (deadlines.submission) vs. 查訂單 (db.stats_view)
+
+用法: python bench/bench_deadlines.py [--orders 2000] [--repeat 200]
+
+量：
+- 送出 (彙總 + 存成一筆紀錄) 在 writer 上花多久
+- 截止後看板每次重畫拿資料的成本：直接查 / 共用快取 (收款會讓 revision 一直變，快取常常失效) / 送出紀錄
+- trg_orders_cutoff 讓每筆新訂單多花多少時間
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import deadlines
+import orders
+
+ITEMS = ["雞腿飯", "排骨飯", "牛肉麵", "咖哩飯", "紅茶", "綠茶", "奶茶", "美式"]
+CUSTOMS = ["", "微辣", "小辣 | 不要蔥", "L(大杯)/無糖/去冰", "M(中杯)/半糖/少冰 | 加珍珠"]
+
+
+def rows(n):
+    return [(f"user{random.randrange(60)}", random.choice(db.CATEGORIES), random.choice(ITEMS),
+             random.choice([50, 80, 100, 120]), random.choice(CUSTOMS), random.randint(1, 2),
+             "2024-01-01 12:00", 0) for _ in range(n)]
+
+def insert(conn, batch):
+    conn.executemany("INSERT INTO orders_legacy (name, category, item_name, price, custom, quantity, order_time, "
+                     "is_paid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+def timed_us(fn, repeat):
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat): fn()
+    return (time.perf_counter() - t) / repeat * 1e6
+
+def insert_cost(batch):
+    # 同一批 INSERT (rollback 掉)，拿掉 trg_orders_cutoff 前後各量一次
+    def run(conn):
+        t = time.perf_counter()
+        conn.execute("SAVEPOINT bench"); insert(conn, batch)
+        conn.execute("ROLLBACK TO bench"); conn.execute("RELEASE bench")
+        return (time.perf_counter() - t) / len(batch) * 1e6
+    with_trigger = min(db.run_write(run) for _ in range(5))
+    sql = db.run_write(lambda conn: conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'trg_orders_cutoff'").fetchone()[0])
+    db.run_write(lambda conn: conn.execute("DROP TRIGGER trg_orders_cutoff"))
+    without = min(db.run_write(run) for _ in range(5))
+    db.run_write(lambda conn: conn.execute(sql))
+    return with_trigger, without
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "deadlines.db")
+    db.ensure_schema(lambda: ([], {}))
+    random.seed(11)
+    db.run_write(lambda conn: insert(conn, rows(args.orders)))
+    print(f"{args.orders} orders\n")
+
+    with_trigger, without = insert_cost(rows(200))
+    print(f"insert: {without:.1f} µs/order without trg_orders_cutoff, {with_trigger:.1f} µs/order with")
+
+    t = time.perf_counter()
+    deadlines.submit("主餐")
+    print(f"submit (summary + details + payments -> submissions): {(time.perf_counter() - t) * 1000:.1f} ms\n")
+
+    unpaid = [int(i) for i in db.person_totals("主餐", 0)["ids"].explode()]
+    def paying():
+        # 截止後大家陸續付款：每次重畫之前 revision 都變了
+        orders.set_paid([random.choice(unpaid)], random.random() < 0.5)
+    print(f"{'dashboard data per rerun (主餐)':<38}{'µs':>10}")
+    print(f"{'stats_view (query)':<38}{timed_us(lambda: db.stats_view('主餐'), args.repeat):>10.0f}")
+    print(f"{'shared_view, revision unchanged':<38}{timed_us(lambda: db.shared_view(db.stats_view, '主餐'), args.repeat):>10.1f}")
+    def shared_after_payment():
+        paying(); t = time.perf_counter(); db.shared_view(db.stats_view, "主餐"); return time.perf_counter() - t
+    def frozen_after_payment():
+        paying(); t = time.perf_counter(); deadlines.submission("主餐"); return time.perf_counter() - t
+    for label, fn in (("shared_view, after each payment", shared_after_payment),
+                      ("submission, after each payment", frozen_after_payment)):
+        fn()
+        print(f"{label:<38}{sum(fn() for _ in range(args.repeat // 4)) / (args.repeat // 4) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
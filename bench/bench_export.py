@@ -0,0 +1,82 @@
+"""匯出 benchmark：export.stream (cursor 分塊) vs. 先讀成 DataFrame 再 to_csv / to_parquet
+
+用法: python bench/bench_export.py [--orders 100000] [--sessions 50]
+
+訂單分散在多個已關帳的場次 (orders_archive)，匯出整段期間的收款明細；
+peak 是 tracemalloc 量到的 Python 端記憶體高峰 (含 pandas / numpy，不含 SQLite 自己的 page cache)。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import export
+
+ITEMS = ["雞腿飯", "排骨飯", "牛肉麵", "咖哩飯", "紅茶", "綠茶", "奶茶", "美式"]
+CUSTOMS = ["", "微辣", "小辣 | 不要蔥", "L(大杯)/無糖/去冰", "M(中杯)/半糖/少冰 | 加珍珠"]
+
+
+def seed(n, sessions):
+    random.seed(5)
+    per = n // sessions
+    for s in range(sessions):
+        rows = [(f"user{random.randrange(60)}", random.choice(db.CATEGORIES), random.choice(ITEMS),
+                 random.choice([50, 80, 100, 120]), random.choice(CUSTOMS), random.randint(1, 3),
+                 f"2024-{1 + s * 6 // sessions:02d}-{1 + s % 28:02d} 12:00", 1) for _ in range(per)]
+        db.run_write(lambda conn: conn.executemany(
+            "INSERT INTO orders_legacy (name, category, item_name, price, custom, quantity, order_time, is_paid) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows))
+        db.run_write(db._close_session)
+
+
+def measure(fn):
+    # 計時與量記憶體分開跑 (tracemalloc 開著時會慢好幾倍)
+    t = time.perf_counter()
+    size = fn()
+    ms = (time.perf_counter() - t) * 1000
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return ms, peak, size
+
+
+def streamed(fmt):
+    return lambda: sum(len(chunk) for chunk in export.stream("ledger", fmt, archive=True))
+
+def dataframe(fmt):
+    def run():
+        import pandas as pd
+        with db.reading() as conn:
+            df = pd.read_sql_query(export.LEDGER_SQL.format(table="orders_archive", where="1"), conn)
+        df["order_time"] = pd.to_datetime(df["ordered_at"], unit="s")
+        return len(df.to_csv(index=False).encode()) if fmt == "csv" else len(df.to_parquet(compression="zstd"))
+    return run
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=100000)
+    ap.add_argument("--sessions", type=int, default=50)
+    args = ap.parse_args()
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "export.db")
+    db.ensure_schema(lambda: ([], {}))
+    seed(args.orders, args.sessions)
+    print(f"{args.orders} archived orders in {args.sessions} sessions\n")
+    print(f"{'ledger export':<26}{'ms':>10}{'peak MB':>10}{'output KB':>11}")
+    for fmt in ("csv", "parquet", "txt"):
+        for label, fn in (("stream", streamed(fmt)), ("DataFrame", dataframe(fmt) if fmt != "txt" else None)):
+            if fn is None: continue
+            ms, peak, size = measure(fn)
+            print(f"{fmt + ' / ' + label:<26}{ms:>10.0f}{peak:>10.1f}{size / 1024:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
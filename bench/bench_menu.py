@@ -0,0 +1,77 @@
+"""菜單記憶 benchmark：品項建議 / 單價查詢的延遲，以及 trigger 維護 menu_items 的寫入成本
+
+用法: python bench/bench_menu.py [--items 5000] [--orders 20000] [--repeat 2000]
+
+建議/查詢都是記憶體裡的 bisect，跟品項數量幾乎無關；
+新訂單進來後只讀 last_order_id 比上次大的列 (增量更新)，不重建整個索引。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import menu
+import orders
+
+SHOP = "測試便當"
+
+
+def seed(items, n):
+    random.seed(11)
+    names = [f"{random.choice('雞豬牛魚蝦菜')}{random.choice('排腿肉丸捲片')}{i}號飯" for i in range(items)]
+    rows = [(f"user{random.randrange(60)}", "主餐", random.choice(names), random.choice([60, 80, 100]),
+             "", 1, "2024-01-01 12:00", 0) for _ in range(n)]
+    t = time.perf_counter()
+    db.run_write(lambda conn: conn.executemany(
+        "INSERT INTO orders_legacy (name, category, item_name, price, custom, quantity, order_time, is_paid) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows))
+    return names, (time.perf_counter() - t) * 1000
+
+
+def timed_us(fn, args_list, repeat):
+    fn(*args_list[0])
+    t = time.perf_counter()
+    for i in range(repeat): fn(*args_list[i % len(args_list)])
+    return (time.perf_counter() - t) / repeat * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=5000)
+    ap.add_argument("--orders", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "menu.db")
+    db.ensure_schema(lambda: ([], {}))
+    db.set_shop_name("main", SHOP)
+    names, insert_ms = seed(args.items, args.orders)
+    reader = db.open_connection(db.get_manager().db_file)
+    distinct = reader.execute("SELECT COUNT(*) FROM menu_items").fetchone()[0]
+    print(f"{args.orders} orders over {distinct} distinct items, bulk insert (with menu trigger) {insert_ms:.0f} ms\n")
+
+    t = time.perf_counter()
+    menu.suggest("主餐", SHOP)
+    print(f"{'first load (build index)':<30}{(time.perf_counter() - t) * 1000:>10.1f} ms")
+
+    prefixes = [(("主餐", SHOP, n[:k]) for k in (1, 2, 3)) for n in random.sample(names, 50)]
+    prefixes = [p for group in prefixes for p in group]
+    print(f"{'suggest (empty prefix)':<30}{timed_us(menu.suggest, [('主餐', SHOP)], args.repeat):>10.1f} µs")
+    print(f"{'suggest (1-3 char prefix)':<30}{timed_us(menu.suggest, prefixes, args.repeat):>10.1f} µs")
+    lookups = [("主餐", SHOP, n) for n in random.sample(names, 50)]
+    print(f"{'lookup (exact name)':<30}{timed_us(menu.lookup, lookups, args.repeat):>10.1f} µs")
+
+    orders.add_order("user0", "主餐", names[0], 90)
+    t = time.perf_counter()
+    hit = menu.lookup("主餐", SHOP, names[0])
+    print(f"{'refresh after 1 new order':<30}{(time.perf_counter() - t) * 1000:>10.2f} ms")
+    assert hit[1] == 90, hit
+
+
+if __name__ == "__main__":
+    main()
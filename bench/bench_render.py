@@ -0,0 +1,78 @@
+"""畫面渲染 benchmark：用 Streamlit AppTest 跑整個 order.py，量每次 rerun 的時間與送出的 element/block 數
+
+用法: python bench/bench_render.py [--orders 500] [--people 60] [--runs 5] [--app path/to/order.py]
+                                  [--tab 📊 統計看板]
+
+element/block 數大致等於每次 rerun 要送到瀏覽器的 delta 數。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.testing.v1 import AppTest
+
+
+def seed(path, orders, people):
+    random.seed(3)
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, category TEXT, item_name TEXT,
+        price INTEGER, custom TEXT, quantity INTEGER, order_time TEXT, is_paid BOOLEAN)''')
+    conn.executemany(
+        "INSERT INTO orders (name, category, item_name, price, custom, quantity, order_time, is_paid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f"user{random.randrange(people)}", random.choice(["主餐", "飲料"]),
+          random.choice(["雞腿飯", "排骨飯", "牛肉麵", "紅茶", "綠茶", "奶茶"]), random.choice([50, 80, 100]),
+          random.choice(["", "微辣", "小辣 | 不要蔥", "L(大杯)/無糖/去冰 | 加珍珠"]), random.randint(1, 2),
+          "2024-01-01 12:00", int(random.random() < 0.3)) for _ in range(orders)])
+    conn.commit()
+    conn.close()
+
+
+def count_nodes(node):
+    children = getattr(node, "children", None) or {}
+    return 1 + sum(count_nodes(c) for c in children.values())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=500)
+    ap.add_argument("--people", type=int, default=60)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--app", default=os.path.join(ROOT, "order.py"))
+    ap.add_argument("--tab", help="量測時開著的分頁 (分頁是 lazy 的，預設是第一頁)")
+    args = ap.parse_args()
+
+    app = os.path.abspath(args.app)
+    sys.path.insert(0, os.path.dirname(app))
+    os.chdir(tempfile.mkdtemp())
+    seed("lunch.db", args.orders, args.people)
+
+    at = AppTest.from_file(app, default_timeout=120)
+    at.session_state["user_name"] = "user1"
+    at.run()
+    if at.exception: raise SystemExit(at.exception)
+    times = []
+    for _ in range(args.runs):
+        # AppTest 不會記住分頁狀態 (瀏覽器每次 rerun 都會送)，每次都要重設
+        if args.tab: at.session_state["main_tab"] = args.tab
+        t = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - t)
+    print(f"{args.orders} orders / {args.people} people" + (f" / tab {args.tab}" if args.tab else ""))
+    print(f"rerun time      median {statistics.median(times) * 1000:.0f} ms")
+    print(f"elements+blocks {count_nodes(at._tree)}")
+    render = sys.modules.get("render")  # 舊版沒有 render.py / 沒有快取
+    for fn in ("esc", "custom_html"):
+        info = getattr(getattr(render, fn, None), "cache_info", lambda: None)()
+        if info: print(f"{fn + ' cache':<15} {info.currsize} entries, {info.hits} hits / {info.misses} misses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""看板共用快取 benchmark：每個 session 各自查詢彙總 (舊版 cached_view) vs. 整個 process 共用 (db.shared_view)
+
+用法: python bench/bench_shared_views.py [--orders 500] [--sessions 40] [--revisions 20]
+
+模擬午餐時間：每來一筆新訂單 (revision +1)，開著看板/收款頁的每個 session 都要重畫一次，
+各自需要兩類的 stats_view / payment_view 與收款進度。量每個 revision 全部 session 加起來的查詢時間，
+以及每個 session 手上的彙總結果佔多少記憶體 (tracemalloc)。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import orders
+
+ITEMS = ["雞腿飯", "排骨飯", "牛肉麵", "咖哩飯", "紅茶", "綠茶", "奶茶", "美式"]
+VIEWS = [(db.stats_view, "主餐"), (db.stats_view, "飲料"), (db.payment_view, "主餐"), (db.payment_view, "飲料"),
+         (db.payment_progress,)]
+
+
+def add_random_order():
+    orders.add_order(f"user{random.randrange(60)}", random.choice(db.CATEGORIES), random.choice(ITEMS),
+                     random.choice([50, 80, 100, 120]), "", random.randint(1, 2))
+
+def per_session(sessions):
+    # 舊版：每個 session 的快取只有自己用，新 revision 時每個 session 都要重查
+    return [[fn(*args) for fn, *args in VIEWS] for _ in range(sessions)]
+
+def shared(sessions):
+    return [[db.shared_view(fn, *args) for fn, *args in VIEWS] for _ in range(sessions)]
+
+def run(label, fn, sessions, revisions):
+    total = 0.0
+    for _ in range(revisions):
+        add_random_order()
+        t = time.perf_counter()
+        fn(sessions)
+        total += time.perf_counter() - t
+    tracemalloc.start()
+    held = fn(sessions)  # 每個 session 手上留著的彙總結果
+    size = tracemalloc.get_traced_memory()[0] / 1024
+    tracemalloc.stop()
+    del held
+    print(f"{label:<26}{total / revisions * 1000:>14.1f}{size:>16.0f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=500)
+    ap.add_argument("--sessions", type=int, default=40)
+    ap.add_argument("--revisions", type=int, default=20)
+    args = ap.parse_args()
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "shared.db")
+    db.ensure_schema(lambda: ([], {}))
+    random.seed(3)
+    for _ in range(args.orders): add_random_order()
+    print(f"{args.orders} orders, {args.sessions} sessions, {args.revisions} new orders\n")
+    print(f"{'':<26}{'ms / revision':>14}{'resident KB':>16}")
+    run("per-session queries", per_session, args.sessions, args.revisions)
+    run("shared_view", shared, args.sessions, args.revisions)
+    tracemalloc.start()
+    add_random_order(); shared(1)
+    print(f"\nshared cache: {tracemalloc.get_traced_memory()[0] / 1024:.0f} KB per revision, "
+          f"at most {db.VIEW_CACHE_ENTRIES} entries (~{db.VIEW_CACHE_ENTRIES // len(VIEWS)} revisions) kept")
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""統計看板/收款頁彙總 benchmark：SELECT * + pandas groupby (舊版) vs. SQL GROUP BY (db.py)
+
+用法: python bench/bench_stats.py [--orders 10000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import db
+
+ITEMS = ["雞腿飯", "排骨飯", "牛肉麵", "咖哩飯", "紅茶", "綠茶", "奶茶", "美式"]
+CUSTOMS = ["", "微辣", "小辣 | 不要蔥", "L(大杯)/無糖/去冰", "M(中杯)/半糖/少冰 | 加珍珠"]
+
+
+def seed(n):
+    random.seed(42)
+    rows = [(f"user{random.randrange(60)}", random.choice(["主餐", "飲料"]), random.choice(ITEMS),
+             random.choice([50, 80, 100, 120]), random.choice(CUSTOMS), random.randint(1, 3),
+             "2024-01-01 12:00", int(random.random() < 0.4)) for _ in range(n)]
+    db.run_write(lambda conn: conn.executemany(
+        "INSERT INTO orders_legacy (name, category, item_name, price, custom, quantity, order_time, is_paid) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows))
+    # 舊版的讀法要讀舊格式的表 (文字 category / custom)
+    db.run_write(lambda conn: conn.execute("CREATE TABLE legacy_orders AS SELECT * FROM orders_legacy"))
+
+# --- 舊版：整張表讀進 pandas 再篩選/分組 ---
+def legacy_views():
+    with db.reading() as conn: df_all = pd.read_sql_query("SELECT * FROM legacy_orders", conn)
+    paid = df_all[df_all['is_paid'] == 1]['price'].sum()
+    total = df_all['price'].sum()
+    for cat in ("主餐", "飲料"):
+        df = df_all[df_all['category'] == cat]
+        df['quantity'].sum(); df['price'].sum()
+        df.groupby(['item_name', 'custom'])['quantity'].sum().reset_index()
+        for _, g in df.groupby('name'): pass
+        for _, g in df[df['is_paid'] == 0].groupby('name'): g['price'].sum(); g['id'].tolist()
+        for _, g in df[df['is_paid'] == 1].groupby('name'): g['price'].sum(); g['id'].tolist()
+    return paid, total
+
+def legacy_aggregates():
+    """只算彙總 (不含逐筆明細) 的舊版寫法"""
+    with db.reading() as conn: df_all = pd.read_sql_query("SELECT * FROM legacy_orders", conn)
+    paid = df_all[df_all['is_paid'] == 1]['price'].sum()
+    total = df_all['price'].sum()
+    for cat in ("主餐", "飲料"):
+        df = df_all[df_all['category'] == cat]
+        df['quantity'].sum(); df['price'].sum()
+        df.groupby(['item_name', 'custom'])['quantity'].sum().reset_index()
+        for is_paid in (0, 1):
+            for _, g in df[df['is_paid'] == is_paid].groupby('name'): g['price'].sum(); g['id'].tolist()
+    return paid, total
+
+# --- 新版：SQL 彙總 ---
+def sql_views():
+    paid, total = db.payment_progress()
+    for cat in ("主餐", "飲料"):
+        db.stats_view(cat)
+        db.payment_view(cat)
+    return paid, total
+
+def sql_aggregates():
+    with db.reading() as conn:
+        paid, total = db.payment_progress()
+        for cat in ("主餐", "飲料"):
+            cat_id = db.CATEGORY_IDS[cat]
+            conn.execute("SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(price), 0) FROM orders WHERE +cat = ?", (cat_id,)).fetchone()
+            db._frame(conn, "SELECT g.item_name, c.label AS custom, g.quantity FROM ("
+                            "SELECT item_name, custom_id, SUM(quantity) AS quantity FROM orders WHERE +cat = ? "
+                            "GROUP BY item_name, custom_id) g JOIN customizations c ON c.id = g.custom_id "
+                            "ORDER BY g.item_name, c.label", (cat_id,))
+            db.person_totals(cat, 0)
+            db.person_totals(cat, 1)
+    return paid, total
+
+
+def timed(label, fn, repeat):
+    fn()  # warm-up
+    t = time.perf_counter()
+    for _ in range(repeat): result = fn()
+    ms = (time.perf_counter() - t) / repeat * 1000
+    print(f"{label:<34} {ms:8.2f} ms/refresh")
+    return ms, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "stats.db")
+    db.ensure_schema()
+    seed(args.orders)
+    print(f"{args.orders} synthetic orders\n")
+
+    print("-- aggregates only (summary / per-person totals / progress)")
+    agg_before, r1 = timed("before: SELECT * + pandas", legacy_aggregates, args.repeat)
+    agg_after, r2 = timed("after:  SQL GROUP BY + indexes", sql_aggregates, args.repeat)
+    assert tuple(map(int, r1)) == tuple(map(int, r2)), (r1, r2)
+    print("-- full views (aggregates + per-row detail lists)")
+    before, _ = timed("before: SELECT * + pandas", legacy_views, args.repeat)
+    after, _ = timed("after:  stats_view/payment_view", sql_views, args.repeat)
+
+    db.run_write(lambda conn: conn.execute("DROP INDEX idx_orders_cat_paid_name"))
+    db.run_write(lambda conn: conn.execute("DROP INDEX idx_orders_name"))
+    print("-- without the new indexes")
+    agg_no_idx, _ = timed("after:  SQL GROUP BY", sql_aggregates, args.repeat)
+    print(f"\naggregates x{agg_before / agg_after:.2f} (indexes alone x{agg_no_idx / agg_after:.2f}), "
+          f"full views x{before / after:.2f}")
+
+
+if __name__ == "__main__":
+    main()
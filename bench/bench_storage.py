@@ -0,0 +1,104 @@
+"""訂單儲存格式 benchmark：舊版文字欄位 (category / custom / order_time) vs. 整數編碼 (migration 5)
+
+用法: python bench/bench_storage.py [--orders 20000] [--repeat 20]
+
+同一批訂單先用舊 schema (migration 1~4) 寫入，量檔案大小、整表 DataFrame 記憶體、(餐點, 客製) 彙總；
+再跑 migration 5 轉成新格式，量同樣的東西 (也順便量 migration 本身要多久)。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import db
+
+ITEMS = ["雞腿飯", "排骨飯", "牛肉麵", "咖哩飯", "紅茶", "綠茶", "奶茶", "美式"]
+MAIN_CUSTOMS = ["", "微辣", "小辣 | 不要蔥", "中辣 | 加飯, 不要蔥", "少飯"]
+DRINK_CUSTOMS = ["L(大杯)/無糖/去冰", "M(中杯)/半糖/少冰 | 加珍珠", "L(大杯)/微糖/正常冰", "XL(特大杯)/全糖/去冰 | 加椰果"]
+SEED_OPTIONS = {"spicy": ["微辣", "小辣", "中辣"], "tags": ["不要蔥", "加飯", "少飯"], "drink_tags": ["加珍珠", "加椰果"]}
+
+
+def seed(path, n):
+    random.seed(7)
+    conn = sqlite3.connect(path)
+    conn.isolation_level = None
+    for v, m in enumerate(db.MIGRATIONS[:4]):
+        m(conn, lambda: ([f"user{i}" for i in range(60)], SEED_OPTIONS))
+        conn.execute(f"PRAGMA user_version = {v + 1}")
+    rows = []
+    for i in range(n):
+        cat = random.choice(db.CATEGORIES)
+        rows.append((f"user{random.randrange(60)}", cat, random.choice(ITEMS), random.choice([35, 50, 80, 100, 120]),
+                     random.choice(MAIN_CUSTOMS if cat == "主餐" else DRINK_CUSTOMS), random.randint(1, 3),
+                     f"2024-01-{1 + i * 28 // n:02d} 12:{i % 60:02d}", int(random.random() < 0.4)))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO orders (name, category, item_name, price, custom, quantity, order_time, is_paid, "
+                     "session_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)", rows)
+    conn.execute("COMMIT")
+    return conn
+
+
+def file_kb(conn, path):
+    conn.execute("VACUUM")
+    return os.path.getsize(path) / 1024
+
+
+def timed(fn, repeat):
+    fn()
+    t = time.perf_counter()
+    for _ in range(repeat): fn()
+    return (time.perf_counter() - t) / repeat * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "storage.db")
+    conn = seed(path, args.orders)
+    before_kb = file_kb(conn, path)
+    df_before = pd.read_sql_query("SELECT * FROM orders", conn)
+    before_mem = df_before.memory_usage(deep=True).sum() / 1024
+    before_ms = timed(lambda: conn.execute(
+        "SELECT item_name, custom, SUM(quantity) FROM orders WHERE +category = ? "
+        "GROUP BY item_name, custom ORDER BY item_name, custom", ("飲料",)).fetchall(), args.repeat)
+
+    t = time.perf_counter()
+    conn.execute("BEGIN")
+    db.MIGRATIONS[4](conn, None)
+    conn.execute("PRAGMA user_version = 5")
+    conn.execute("COMMIT")
+    migrate_ms = (time.perf_counter() - t) * 1000
+    after_kb = file_kb(conn, path)
+    conn.close()
+
+    db.DB_FILE = path
+    df_after = db.OrderSnapshot().refresh()
+    after_mem = df_after.memory_usage(deep=True).sum() / 1024
+    reader = db.open_connection(db.get_manager().db_file)
+    after_ms = timed(lambda: reader.execute(
+        "SELECT g.item_name, c.label, g.quantity FROM (SELECT item_name, custom_id, SUM(quantity) AS quantity "
+        "FROM orders WHERE +cat = ? GROUP BY item_name, custom_id) g "
+        "JOIN customizations c ON c.id = g.custom_id ORDER BY g.item_name, c.label", (1,)).fetchall(), args.repeat)
+    assert len(df_before) == len(df_after)
+
+    print(f"{args.orders} orders, migration 5 took {migrate_ms:.0f} ms\n")
+    print(f"{'':<28}{'text columns':>14}{'int-coded':>14}")
+    print(f"{'db file (KB, vacuumed)':<28}{before_kb:>14.0f}{after_kb:>14.0f}")
+    print(f"{'orders DataFrame (KB)':<28}{before_mem:>14.0f}{after_mem:>14.0f}")
+    print(f"{'  bytes / row':<28}{before_mem * 1024 / len(df_before):>14.0f}{after_mem * 1024 / len(df_after):>14.0f}")
+    print(f"{'(item, custom) GROUP BY ms':<28}{before_ms:>14.2f}{after_ms:>14.2f}")
+    print("\ndtypes:", ", ".join(f"{c}={t}" for c, t in df_after.dtypes.items()))
+
+
+if __name__ == "__main__":
+    main()
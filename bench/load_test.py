@@ -0,0 +1,132 @@
+"""併發寫入壓力測試：模擬很多人同時按「＋ 加入主餐」
+
+用法: python bench/load_test.py [--threads 30] [--orders 20] [--legacy] [--groups 1]
+
+預設走 orders.add_order (writer 執行緒)；--legacy 會改用舊版「每次 connect + 遇到 locked 睡 0.1 秒重試 5 次」的寫法做對照。
+--groups N 把使用者平均分到 N 個群組 (各自一個資料庫檔案 / writer 執行緒)。
+結束時比對資料表筆數，任何一筆沒寫進去 (或寫到別的群組) 都會列為遺失訂單。
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import orders
+
+INSERT_SQL = ("INSERT INTO orders (name, category, item_name, price, custom, quantity, order_time, is_paid) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, 0)")
+
+
+def create_schema(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, category TEXT, item_name TEXT,
+        price INTEGER, custom TEXT, quantity INTEGER, order_time TEXT, is_paid BOOLEAN)''')
+    conn.commit()
+    conn.close()
+
+# --- 舊版 execute_db (對照組) ---
+def legacy_execute_db(path, query, params=()):
+    for attempt in range(5):
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            conn.execute(query, params)
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e): time.sleep(0.1)
+            else: raise e
+    return False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=30)
+    ap.add_argument("--orders", type=int, default=20, help="每個執行緒送出的訂單數")
+    ap.add_argument("--legacy", action="store_true")
+    ap.add_argument("--groups", type=int, default=1, help="使用者分散到幾個群組")
+    args = ap.parse_args()
+    if args.legacy and args.groups > 1: ap.error("--legacy 只有單一資料庫")
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "load.db")
+    create_schema(path)
+    db.DB_FILE = path
+    db.GROUPS_DIR = os.path.join(workdir, "groups")
+    groups = [db.DEFAULT_GROUP] + [f"team{g}" for g in range(1, args.groups)]
+    if args.legacy:
+        write = lambda params: legacy_execute_db(path, INSERT_SQL, params)
+    else:
+        db.ensure_schema()
+        for g in groups[1:]: db.create_group(g)
+        write = lambda params: orders.add_order(*params[:6]) > 0
+
+    # db.py 第一次用到 pandas 才 import：先在這裡觸發，讀取延遲才不會量到 import (約 0.4 秒)
+    db.get_db("SELECT 1")
+    latencies, failed = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+    stop_readers = threading.Event()
+    read_latencies = []
+
+    def user(i):
+        db.use_group(groups[i % len(groups)])
+        barrier.wait()  # 所有人同一瞬間開始
+        for j in range(args.orders):
+            t = time.perf_counter()
+            ok = write((f"user{i}", "主餐", f"item{j}", 100, "", 1, "2024-01-01 11:50"))
+            dt = time.perf_counter() - t
+            with lock:
+                latencies.append(dt)
+                if not ok: failed.append((i, j))
+
+    def reader(i):
+        db.use_group(groups[i % len(groups)])
+        while not stop_readers.is_set():
+            t = time.perf_counter()
+            db.get_db("SELECT COUNT(*) AS n FROM orders")
+            read_latencies.append(time.perf_counter() - t)
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(4)]
+    users = [threading.Thread(target=user, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in readers + users: t.start()
+    for t in users: t.join()
+    elapsed = time.perf_counter() - start
+    stop_readers.set()
+    for t in readers: t.join()
+
+    expected = args.threads * args.orders
+    got = 0
+    for g, group in enumerate(groups):
+        users_in_group = [f"user{i}" for i in range(g, args.threads, len(groups))]
+        conn = sqlite3.connect(db.group_db_file(group))
+        got += conn.execute(f"SELECT COUNT(*) FROM orders WHERE name IN ({','.join('?' * len(users_in_group))})",
+                            users_in_group).fetchone()[0] if users_in_group else 0
+        conn.close()
+    q = statistics.quantiles(latencies, n=100)
+    print(f"mode            {'legacy' if args.legacy else 'writer-queue'}" + (f" x {len(groups)} groups" if len(groups) > 1 else ""))
+    print(f"orders          {got}/{expected}  (lost {expected - got}, failed calls {len(failed)})")
+    print(f"throughput      {expected / elapsed:.0f} writes/s")
+    print(f"write latency   p50 {q[49]*1000:.1f}ms  p95 {q[94]*1000:.1f}ms  max {max(latencies)*1000:.1f}ms")
+    if read_latencies:
+        print(f"read latency    max {max(read_latencies)*1000:.1f}ms over {len(read_latencies)} reads")
+    if not args.legacy:
+        retries = 0
+        for group in groups:
+            db.use_group(group)
+            retries += db.get_manager().lock_retries
+        print(f"lock retries    {retries}")
+    sys.exit(1 if got != expected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""午餐尖峰模擬：用 Streamlit AppTest 無頭地跑真正的 order.py，模擬全辦公室 11:50 一起點餐
+
+用法: python bench/lunch_rush.py [--users 30] [--procs 4] [--out rush.json] [--compare old.json]
+                                 [--app path/to/order.py] [--tracemalloc] [--group NAME]
+
+每個模擬使用者依序：開頁 → 用 login_dialog 登入 → 填主餐並加入 → 填飲料並加入 → 切到統計看板 → 切到收款管理 → 按收款。
+AppTest 共用 Streamlit 的全域 Runtime，同一個 process 裡不能平行跑，所以使用者分散到 --procs 個
+process，各 process 內輪流推進自己負責的使用者 (模擬同一時間很多 session 交錯 rerun)，
+所有 process 寫同一個資料庫檔案。--group 讓所有使用者都從 ?group=NAME 進來 (群組由預設群組的設定複製)，
+另外檢查訂單都寫進這個群組的資料庫、沒有寫到預設群組。
+
+輸出 (JSON)：每次 rerun 的 p50/p95/p99 延遲、各步驟延遲、每次 rerun 的 SQL 數、
+writer 的 lock 重試次數、峰值記憶體，以及訂單是否全數寫入。--compare 會和舊的結果並列比較。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = ("open", "login_dialog", "login", "main_name", "main_price", "add_main",
+         "drink_name", "drink_price", "add_drink", "stats", "payments", "pay")
+
+
+def _button(at, label, key_suffix=None):
+    buttons = [b for b in at.button if b.label == label]
+    if key_suffix:
+        mine = [b for b in buttons if (b.key or "").endswith(key_suffix)]
+        buttons = mine or buttons
+    return buttons[0] if buttons else None
+
+
+def _user_steps(at, name):
+    """一個使用者的操作流程；每個 yield 之前做的事，會在下一次 at.run() 送出"""
+    yield "open"
+    _button(at, "👤 登入/切換").click()
+    yield "login_dialog"
+    # dialog 只在按下按鈕的那次 rerun 出現：同一次 rerun 裡同時選名字、再按一次按鈕
+    at.button_group[0].select(name)
+    _button(at, "👤 登入/切換").click()
+    yield "login"
+    at.text_input(key="m_name").input("雞腿飯")
+    yield "main_name"
+    at.number_input(key="m_price").set_value(100)
+    yield "main_price"
+    _button(at, "＋ 加入主餐").click()
+    yield "add_main"
+    at.text_input(key="d_name").input("紅茶")
+    yield "drink_name"
+    at.number_input(key="d_price").set_value(35)
+    yield "drink_price"
+    _button(at, "＋ 加入飲料").click()
+    yield "add_drink"
+    # 分頁是 lazy 的；AppTest 不會記住分頁狀態 (瀏覽器每次 rerun 都會送)，每次 rerun 前都要設定
+    at.session_state["main_tab"] = "📊 統計看板"
+    yield "stats"
+    at.session_state["main_tab"] = "💰 收款管理"
+    yield "payments"
+    pay = _button(at, "收款", key_suffix=f"_{name}")
+    if pay is None: return  # 分頁後不在第一頁 / 已被收款
+    at.session_state["main_tab"] = "💰 收款管理"
+    pay.click()
+    yield "pay"
+
+
+def _count_sql():
+    """替之後開的每條 sqlite 連線掛上 trace callback，數 SQL 敘述數量 (新舊版本都適用)"""
+    counter = [0]
+    count = lambda _: counter.__setitem__(0, counter[0] + 1)
+    original = sqlite3.connect
+    def traced(*args, **kwargs):
+        conn = original(*args, **kwargs)
+        conn.set_trace_callback(count)
+        return conn
+    sqlite3.connect = traced
+    # 有 metrics.py 的版本：db.open_connection 會用 metrics.on_statement 換掉上面的 callback
+    # (一條連線只能有一個)，所以把計數串在它前面
+    try: import metrics
+    except ImportError: return counter
+    on_statement = metrics.on_statement
+    def chained(sql):
+        count(sql)
+        on_statement(sql)
+    metrics.on_statement = chained
+    return counter
+
+
+def worker(args):
+    app, workdir, names, use_tracemalloc, group = args
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(app))
+    from streamlit.testing.v1 import AppTest
+    sql = _count_sql()
+    if use_tracemalloc: tracemalloc.start()
+
+    sessions = []
+    for name in names:
+        at = AppTest.from_file(app, default_timeout=120)
+        if group: at.query_params["group"] = group
+        sessions.append((at, _user_steps(at, name)))
+    samples, errors = [], []
+    # 輪流推進每個 session 一步，直到全部走完
+    while sessions:
+        alive = []
+        for at, steps in sessions:
+            try: step = next(steps)
+            except StopIteration: continue
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}"); continue
+            t = time.perf_counter()
+            at.run()
+            samples.append((step, time.perf_counter() - t))
+            if at.exception: errors.append(str(at.exception[0].message)); continue
+            alive.append((at, steps))
+        sessions = alive
+
+    db = sys.modules.get("db")  # 舊版 (沒有 db.py) 就沒有 writer 重試次數
+    mgr = db.get_manager() if hasattr(db, "get_manager") else None
+    return {
+        "samples": samples,
+        "errors": errors,
+        "sql": sql[0],
+        "lock_retries": mgr.lock_retries if mgr else None,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_traced_mb": tracemalloc.get_traced_memory()[1] / 2**20 if use_tracemalloc else None,
+    }
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) < 2: return {"p50": values[0] * 1000 if values else None}
+    q = statistics.quantiles(values, n=100, method="inclusive")  # 預設 exclusive 會外插到超過 max
+    return {"p50": round(q[49] * 1000, 1), "p95": round(q[94] * 1000, 1),
+            "p99": round(q[98] * 1000, 1), "max": round(values[-1] * 1000, 1), "n": len(values)}
+
+
+def db_path(workdir, group=None):
+    return os.path.join(workdir, "groups", f"{group}.db") if group else os.path.join(workdir, "lunch.db")
+
+
+def prepare(app, workdir, users, group=None):
+    """先讓 app 自己建庫 (各版本的 init 都適用)，再把模擬使用者加進人員名單"""
+    subprocess.run([sys.executable, "-c", (
+        "import sys; from streamlit.testing.v1 import AppTest; "
+        f"at = AppTest.from_file({app!r}, default_timeout=120); at.run(); "
+        "sys.exit(1 if at.exception else 0)")],
+        cwd=workdir, check=True, stderr=subprocess.DEVNULL)
+    if group:  # 群組 = groups/ 底下一個資料庫檔案：複製預設群組剛建好的 (還沒有訂單)
+        os.makedirs(os.path.dirname(db_path(workdir, group)))
+        src, dst = sqlite3.connect(db_path(workdir)), sqlite3.connect(db_path(workdir, group))
+        src.backup(dst)
+        src.close(); dst.close()
+    conn = sqlite3.connect(db_path(workdir, group))
+    conn.executemany("INSERT OR IGNORE INTO config_colleagues (name) VALUES (?)", [(u,) for u in users])
+    conn.commit()
+    conn.close()
+
+
+def git_version(app):
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(app),
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=30)
+    ap.add_argument("--procs", type=int, default=4)
+    ap.add_argument("--app", default=os.path.join(ROOT, "order.py"))
+    ap.add_argument("--out", default="lunch_rush.json")
+    ap.add_argument("--compare", help="之前輸出的 JSON，並列比較延遲")
+    ap.add_argument("--tracemalloc", action="store_true", help="另外用 tracemalloc 量 Python 配置的峰值 (較慢)")
+    ap.add_argument("--group", help="所有使用者都從 ?group=NAME 進來")
+    args = ap.parse_args()
+
+    app = os.path.abspath(args.app)
+    out = os.path.abspath(args.out)
+    workdir = tempfile.mkdtemp()
+    users = [f"rush{i:03d}" for i in range(args.users)]
+    prepare(app, workdir, users, args.group)
+
+    chunks = [(app, workdir, users[p::args.procs], args.tracemalloc, args.group) for p in range(args.procs)]
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ctx.Pool(args.procs) as pool:
+        parts = pool.map(worker, chunks)
+    wall = time.perf_counter() - start
+
+    samples = [s for p in parts for s in p["samples"]]
+    count = lambda path: sqlite3.connect(path).execute("SELECT COUNT(*) FROM orders WHERE name LIKE 'rush%'").fetchone()[0]
+    stored = count(db_path(workdir, args.group))
+    misplaced = count(db_path(workdir)) if args.group else 0  # 寫到預設群組去的
+    sql_counts = [p["sql"] for p in parts]
+    result = {
+        "version": git_version(app),
+        "users": args.users,
+        "procs": args.procs,
+        "group": args.group,
+        "wall_s": round(wall, 2),
+        "reruns": len(samples),
+        "rerun_ms": percentiles([dt for _, dt in samples]),
+        "steps_ms": {step: percentiles([dt for s, dt in samples if s == step])
+                     for step in STEPS if any(s == step for s, _ in samples)},
+        "sql_per_rerun": round(sum(sql_counts) / len(samples), 1) if samples else None,
+        "lock_retries": (sum(p["lock_retries"] for p in parts)
+                         if all(p["lock_retries"] is not None for p in parts) else None),
+        "peak_rss_mb": round(max(p["peak_rss_mb"] for p in parts), 1),
+        "peak_traced_mb": (round(max(p["peak_traced_mb"] for p in parts), 1) if args.tracemalloc else None),
+        "orders_expected": args.users * 2,
+        "orders_stored": stored,
+        "orders_misplaced": misplaced,
+        "errors": [e for p in parts for e in p["errors"]][:20],
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    r = result["rerun_ms"]
+    print(f"{args.users} users / {args.procs} procs, {result['reruns']} reruns in {wall:.1f}s  ({result['version']})")
+    print(f"rerun latency   p50 {r['p50']}ms  p95 {r['p95']}ms  p99 {r['p99']}ms  max {r['max']}ms")
+    for step, s in result["steps_ms"].items():
+        print(f"  {step:<13} p50 {s['p50']:>7}ms  p95 {s.get('p95', '-'):>7}ms")
+    print(f"sql/rerun       {result['sql_per_rerun']}")
+    print(f"lock retries    {result['lock_retries']}")
+    print(f"peak memory     {result['peak_rss_mb']} MB RSS / process"
+          + (f", {result['peak_traced_mb']} MB traced" if args.tracemalloc else ""))
+    print(f"orders          {stored}/{result['orders_expected']}  errors {len(result['errors'])}"
+          + (f"  (in group {args.group}; {misplaced} written to the default group)" if args.group else ""))
+    print(f"written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f: old = json.load(f)
+        print(f"\ncompare with {args.compare} ({old.get('version')})")
+        for k in ("p50", "p95", "p99"):
+            a, b = old["rerun_ms"].get(k), r.get(k)
+            if a and b: print(f"  {k}  {a:>8}ms -> {b:>8}ms  (x{a / b:.2f})")
+        for k in ("sql_per_rerun", "lock_retries", "peak_rss_mb"):
+            print(f"  {k:<14} {old.get(k)} -> {result[k]}")
+    sys.exit(1 if stored != result["orders_expected"] or misplaced or result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
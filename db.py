@@ -0,0 +1,1192 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import metrics
+
+# pandas 在用到 DataFrame 的函式裡才 import (第一次約 0.4 秒)：新 session 的第一個畫面 (登入頁) 用不到
+
+# ==========================================
+# 資料庫連線層
+# ==========================================
+# 整個 process 共用一組連線：
+# - 寫入：一條專屬 writer 執行緒，從 queue 取出寫入指令，每一輪 (tick) 合併成一個 transaction，
+#   commit 之後再透過 Future 把結果交回呼叫端。所有寫入天然序列化，不會互搶 lock。
+# - 讀取：連線池。with reading() as conn 借一條、用完還回去，資料庫使用 WAL 模式，讀取不會被寫入擋住。
+#   Streamlit 的 ScriptRunner 執行緒在每次 rerun (含 fragment 的定時 rerun) 結束就會結束，
+#   下一次換一條新的執行緒，所以連線不能綁在執行緒上，否則幾乎每次 rerun 都要重開連線。
+
+DB_FILE = "lunch.db"
+
+# 開啟連線時套用的 PRAGMA (每條連線只做一次)
+CONN_PRAGMAS = (
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",      # 約 8MB page cache
+    "PRAGMA mmap_size = 67108864",    # 64MB memory-mapped I/O
+)
+# 只在 writer 連線套用：WAL 會寫進檔案，之後所有連線都是 WAL
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",    # WAL 下 NORMAL 已可保證一致性
+)
+BUSY_TIMEOUT = 10        # 秒，等同舊版 sqlite3.connect(timeout=10)
+READER_POOL_SIZE = 8     # 連線池最多留幾條閒置的讀取連線 (同時借出更多時另外開，還回來時多的關掉)
+HEALTH_CHECK_EVERY = 30  # 秒，閒置超過這個時間的連線在取用前先 ping 一次
+WRITE_BATCH_MAX = 256    # 每個 transaction 最多合併幾筆寫入指令
+WRITE_TIMEOUT = 15       # 秒，呼叫端等待寫入結果的上限
+COMMIT_RETRIES = 5       # 其他 process 佔住 lock 時，整批 commit 的重試次數
+EXTERNAL_SYNC_EVERY = 10 # 秒，多久回資料庫確認一次 revision (抓其他 process 寫入的資料)
+
+
+def open_connection(db_file, pragmas=CONN_PRAGMAS):
+    conn = sqlite3.connect(db_file, check_same_thread=False, timeout=BUSY_TIMEOUT)
+    for p in pragmas:
+        conn.execute(p)
+    conn.set_trace_callback(metrics.on_statement)  # 每個 SQL 記到目前執行緒這次 rerun 的計數
+    return conn
+
+
+class WriteJob:
+    __slots__ = ("fn", "future", "in_txn")
+
+    def __init__(self, fn, in_txn=True):
+        self.fn = fn
+        self.future = Future()
+        self.in_txn = in_txn
+
+
+class RevisionNotifier:
+    """process 內共用的 orders revision：writer 每次 commit 後發布最新的 revision。
+    畫面只要比對手上的 revision 跟 current() 是否相同，就知道要不要重新讀資料。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.revision = None
+        self._synced = 0.0
+
+    def publish(self, rev):
+        # current() 可能在讀取連線上查到比 writer 剛發布的還舊的版本：revision 只能往前，不能倒退
+        with self._lock:
+            self._synced = time.monotonic()
+            self.revision = rev if self.revision is None else max(self.revision, rev)
+
+    def current(self, load):
+        """目前的 revision；只有在太久沒同步時才呼叫 load() 回資料庫查一次"""
+        if self.revision is None or time.monotonic() - self._synced > EXTERNAL_SYNC_EVERY:
+            self.publish(load())
+        return self.revision
+
+
+class ConnectionManager:
+    """管理單一資料庫檔案的長駐連線 (一條 writer 執行緒 + 讀取連線池)"""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._idle = queue.LifoQueue(maxsize=READER_POOL_SIZE)  # (conn, 上次使用時間)；LIFO：常用的連線一直是熱的
+        self._held = threading.local()  # 只在 with reading() 期間有值：同一執行緒巢狀借用拿到同一條
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_used = 0.0
+        self.lock_retries = 0
+        self.schema_version = None  # ensure_schema() 檢查過後記下版本，之後不再碰 DDL
+        self.config_generation = 0  # 設定寫入時 +1，讓 load_config() 的快取失效
+        self.config_cache = (-1, None)
+        self.notifier = RevisionNotifier()
+        self.views = ViewCache()  # 看板彙總結果，所有 session 共用 (shared_view)
+        self._thread = threading.Thread(target=self._writer_loop, name=f"db-writer:{db_file}", daemon=True)
+        self._thread.start()
+
+    def _healthy(self, conn, last_used):
+        if conn is None: return False
+        if time.monotonic() - last_used < HEALTH_CHECK_EVERY: return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            try: conn.close()
+            except sqlite3.Error: pass
+            return False
+
+    def _checkout(self):
+        while True:
+            try: conn, used = self._idle.get_nowait()
+            except queue.Empty: return open_connection(self.db_file)
+            if self._healthy(conn, used): return conn
+
+    def _checkin(self, conn):
+        try: self._idle.put_nowait((conn, time.monotonic()))
+        except queue.Full: conn.close()
+
+    @contextmanager
+    def reading(self):
+        """從連線池借一條讀取連線，離開 with 時還回去。with 裡面再借 (例如查詢函式裡呼叫其他查詢函式)
+        拿到的是同一條，所以外層 BEGIN 之後的查詢都看到同一個版本。查詢出錯時這條連線直接關掉不還"""
+        conn = getattr(self._held, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._held.conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+        except sqlite3.Error:
+            broken = True
+            raise
+        finally:
+            self._held.conn = None
+            if broken:
+                try: conn.close()
+                except sqlite3.Error: pass
+            else:
+                if conn.in_transaction: conn.rollback()
+                self._checkin(conn)
+
+    def read_revision(self):
+        with self.reading() as conn: return order_revision(conn)
+
+    # --- 寫入 ---
+    def submit(self, fn, in_txn=True):
+        """排入一筆寫入指令，回傳 Future。fn(conn) 在 writer 執行緒上執行，不可自行 commit。
+        in_txn=False 的指令 (例如 VACUUM) 會在 transaction 外單獨執行。"""
+        job = WriteJob(fn, in_txn)
+        self._queue.put(job)
+        return job.future
+
+    def close(self):
+        """停止 writer (已排入的寫入會先做完) 並關掉所有連線；之後不能再使用這個 manager"""
+        self._queue.put(None)
+        self._thread.join(timeout=WRITE_TIMEOUT)
+        while True:
+            try: conn, _ = self._idle.get_nowait()
+            except queue.Empty: break
+            conn.close()
+
+    def _writer_conn(self):
+        if not self._healthy(self._writer, self._writer_used):
+            self._writer = open_connection(self.db_file, CONN_PRAGMAS + WRITER_PRAGMAS)
+            self._writer.isolation_level = None  # 由 writer 自行管理 BEGIN/COMMIT
+        self._writer_used = time.monotonic()
+        return self._writer
+
+    def _writer_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                if self._writer is not None: self._writer.close()  # 最後一條連線關掉時 SQLite 會做 checkpoint
+                return
+            batch = [job]
+            while len(batch) < WRITE_BATCH_MAX:
+                try: job = self._queue.get_nowait()
+                except queue.Empty: break
+                if job is None:
+                    self._queue.put(None)  # 先把這批做完再結束
+                    break
+                batch.append(job)
+
+            pending = []
+            for job in batch:
+                if job.in_txn:
+                    pending.append(job)
+                    continue
+                self._run_batch(pending); pending = []
+                self._run_alone(job)
+            self._run_batch(pending)
+
+    def _run_alone(self, job):
+        try: job.future.set_result(job.fn(self._writer_conn()))
+        except BaseException as e: job.future.set_exception(e)
+
+    def _publish_revision(self, conn):
+        try: self.notifier.publish(order_revision(conn))
+        except sqlite3.Error: pass  # orders 還沒建立 (migration 之前)
+
+    def _run_batch(self, jobs):
+        if not jobs: return
+        for attempt in range(COMMIT_RETRIES):
+            results = []
+            try: conn = self._writer_conn()
+            except sqlite3.Error as e:  # 例如檔案損毀：這批都回報失敗，writer 執行緒不能因此結束
+                results = [(False, e)] * len(jobs)
+                break
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for i, job in enumerate(jobs):
+                    # 每筆指令包在 SAVEPOINT 裡，單筆失敗不會拖累同一批的其他寫入
+                    conn.execute("SAVEPOINT job")
+                    try:
+                        results.append((True, job.fn(conn)))
+                        conn.execute("RELEASE job")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO job")
+                        conn.execute("RELEASE job")
+                        results.append((False, e))
+                conn.execute("COMMIT")
+                self._publish_revision(conn)
+                break
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction: conn.execute("ROLLBACK")
+                if "locked" in str(e) and attempt < COMMIT_RETRIES - 1:
+                    self.lock_retries += 1
+                    time.sleep(0.05 * (attempt + 1))
+                    continue
+                results = [(False, e)] * len(jobs)
+                break
+            except BaseException as e:
+                if conn.in_transaction: conn.execute("ROLLBACK")
+                results = [(False, e)] * len(jobs)
+                break
+        for job, (ok, value) in zip(jobs, results):
+            if ok: job.future.set_result(value)
+            else: job.future.set_exception(value)
+
+
+@st.cache_resource
+def _manager_for(db_file):
+    return ConnectionManager(db_file)
+
+# ==========================================
+# 群組 (每個群組一個資料庫檔案)
+# ==========================================
+# 每個群組 (樓層/團隊) 有自己的人員、選項、店家與訂單，各自一個 SQLite 檔案，
+# 也就各自有一個 ConnectionManager：writer 執行緒與 lock、設定快取、revision 都是分開的，
+# 一個群組的午餐尖峰不會卡到其他群組的寫入。預設群組沿用 DB_FILE，其他群組放在 GROUPS_DIR/<群組>.db。
+# 目前的群組記在 Streamlit 的 session 上 (session_state["group"])：ScriptRunner 執行緒每次 rerun 都換一條，
+# 但同一個 session 的 rerun、fragment、on_click callback 都看得到；API / 排程等不在 session 裡的執行緒記在執行緒上。
+# 所以 db.* / orders.* 的函式都不用多帶一個參數；沒呼叫過 use_group() 的就是預設群組。
+
+DEFAULT_GROUP = "default"
+GROUPS_DIR = "groups"
+GROUP_NAME_RE = re.compile(r"[A-Za-z0-9_-]{1,32}")  # 會變成檔名，只允許安全的字元
+
+GROUP_STATE_KEY = "group"
+_tls = threading.local()
+_managers = {}  # 資料庫檔案 -> ConnectionManager
+
+def group_db_file(group):
+    if group == DEFAULT_GROUP: return DB_FILE
+    if not GROUP_NAME_RE.fullmatch(str(group)): raise ValueError(f"群組名稱只能使用英數字、- 與 _ (最多 32 字): {group}")
+    return os.path.join(GROUPS_DIR, f"{group}.db")
+
+def group_exists(group):
+    if group == DEFAULT_GROUP: return True  # 第一次開啟時才會建立
+    return bool(GROUP_NAME_RE.fullmatch(str(group))) and os.path.exists(group_db_file(group))
+
+def list_groups():
+    """預設群組 + GROUPS_DIR 底下已建立的群組"""
+    try: files = os.listdir(GROUPS_DIR)
+    except FileNotFoundError: files = []
+    names = sorted(f[:-3] for f in files if f.endswith(".db"))
+    return [DEFAULT_GROUP] + [n for n in names if n != DEFAULT_GROUP and GROUP_NAME_RE.fullmatch(n)]
+
+def use_group(group):
+    """之後在目前 session (不在 Streamlit session 裡時為目前執行緒) 的資料庫操作都走 group 的資料庫"""
+    group_db_file(group)  # 檢查名稱
+    if get_script_run_ctx(suppress_warning=True) is not None: st.session_state[GROUP_STATE_KEY] = group
+    else: _tls.group = group
+
+def current_group():
+    if get_script_run_ctx(suppress_warning=True) is not None: return st.session_state.get(GROUP_STATE_KEY, DEFAULT_GROUP)
+    return getattr(_tls, "group", DEFAULT_GROUP)
+
+def create_group(group, seed=None):
+    """建立新群組並寫入預設人員/選項 (seed 同 ensure_schema)"""
+    if group_exists(group): raise ValueError(f"群組已存在: {group}")
+    os.makedirs(GROUPS_DIR, exist_ok=True)
+    prev = current_group()
+    use_group(group)
+    try: ensure_schema(seed)
+    finally: use_group(prev)
+    return group
+
+def get_manager():
+    # st.cache_resource 每次查表約數十 µs，熱路徑上先查 process 共用的 dict
+    db_file = group_db_file(current_group())
+    mgr = _managers.get(db_file)
+    if mgr is None: mgr = _managers[db_file] = _manager_for(db_file)
+    return mgr
+
+def reading():
+    """with reading() as conn：從目前群組的連線池借一條讀取連線"""
+    return get_manager().reading()
+
+def close_all():
+    """關閉所有群組的 writer 與連線 (process 結束前呼叫)"""
+    while _managers:
+        _, mgr = _managers.popitem()
+        mgr.close()
+    _manager_for.clear()
+
+# ==========================================
+# 訂單欄位編碼
+# ==========================================
+# orders 一列只存小整數 + 兩個文字欄 (name, item_name)：
+# - cat：CATEGORIES 的 index (0 主餐 / 1 飲料)
+# - ordered_at：unix epoch 秒
+# - custom_id：customizations 的 id。每一種 (尺寸, 甜度, 冰塊, 辣度, 標籤, 手寫備註) 組合只存一次，
+#   label 是組好的顯示字串 (格式同舊版 custom 欄位)，也是去重用的 key，
+#   所以「(餐點, 客製) 彙總」是 (item_name, custom_id) 的 GROUP BY。
+# 選項文字存在 custom_options (只增不刪)，管理員之後改名/刪除設定選項不會影響歷史訂單。
+
+CATEGORIES = ("主餐", "飲料")
+CATEGORY_IDS = {c: i for i, c in enumerate(CATEGORIES)}
+SHOP_KEYS = ("main", "drink")  # 每個類別在 config_shop 的 key，順序同 CATEGORIES
+SHOP_KEY_SQL = "CASE {} " + " ".join(f"WHEN {i} THEN '{k}'" for i, k in enumerate(SHOP_KEYS)) + " END"
+DRINK_SIZES = ("M(中杯)", "L(大杯)", "XL(特大杯)")
+CUSTOM_KINDS = ("size", "sugar", "ice", "spice")  # customizations 的 {kind}_id 欄位
+
+
+class Customization:
+    """一筆訂單的客製化；label() 組出顯示字串：辣度 | 尺寸/甜度/冰塊 | 標籤, 備註"""
+    __slots__ = ("size", "sugar", "ice", "spice", "tags", "note")
+
+    def __init__(self, size=None, sugar=None, ice=None, spice=None, tags=(), note=""):
+        self.size, self.sugar, self.ice, self.spice = size or None, sugar or None, ice or None, spice or None
+        self.tags = tuple(t for t in tags if t)
+        self.note = str(note or "").strip()
+
+    def label(self):
+        heads = [self.spice] if self.spice else []
+        if self.size or self.sugar or self.ice:
+            heads.append("/".join(v or "" for v in (self.size, self.sugar, self.ice)))
+        extras = [*self.tags, self.note] if self.note else list(self.tags)
+        if extras: heads.append(", ".join(extras))
+        return " | ".join(heads)
+
+    @classmethod
+    def parse(cls, text, cat, known=None):
+        """舊版 custom 字串 → Customization。known = {"spice": 辣度選項, "tags": 標籤選項}。
+        組不回一模一樣的字串時，整串當成手寫備註 (顯示不變，只是沒有結構)。"""
+        text = str(text or "").strip()
+        if not text: return cls()
+        known = known or {}
+        parts, fields = text.split(" | "), {}
+        if cat == "飲料" and parts[0].count("/") == 2:
+            fields = dict(zip(("size", "sugar", "ice"), parts.pop(0).split("/")))
+        elif cat == "主餐" and parts[0] in known.get("spice", ()):
+            fields["spice"] = parts.pop(0)
+        tags, notes = [], []
+        if len(parts) == 1:
+            for piece in parts[0].split(", "):
+                # 畫面上標籤一定在手寫備註前面
+                (tags if not notes and piece in known.get("tags", ()) else notes).append(piece)
+        cz = cls(tags=tags, note=", ".join(notes), **fields)
+        return cz if len(parts) <= 1 and cz.label() == text else cls(note=text)
+
+
+def _option_id(conn, kind, label):
+    if not label: return None
+    row = conn.execute("SELECT id FROM custom_options WHERE kind = ? AND label = ?", (kind, label)).fetchone()
+    if row: return row[0]
+    return conn.execute("INSERT INTO custom_options (kind, label) VALUES (?, ?)", (kind, label)).lastrowid
+
+def intern_customization(conn, cz):
+    """客製化組合 → customizations.id；在 writer 的 transaction 內呼叫，同樣的組合只存一次"""
+    label = cz.label()
+    row = conn.execute("SELECT id FROM customizations WHERE label = ?", (label,)).fetchone()
+    if row: return row[0]
+    ids = [_option_id(conn, kind, getattr(cz, kind)) for kind in CUSTOM_KINDS]
+    cid = conn.execute("INSERT INTO customizations (size_id, sugar_id, ice_id, spice_id, note, label) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (*ids, cz.note, label)).lastrowid
+    tag_ids = [_option_id(conn, "tag", t) for t in cz.tags]
+    conn.executemany("INSERT OR IGNORE INTO customization_tags (custom_id, tag_id) VALUES (?, ?)",
+                     [(cid, t) for t in tag_ids])
+    return cid
+
+# 給人看的訂單欄位 (同舊版 orders 的欄位)：orders_legacy view、封存查詢、API 用
+LEGACY_COLUMNS_SQL = (
+    "o.id, o.session_id, o.name, CASE o.cat " + " ".join(f"WHEN {i} THEN '{c}'" for i, c in enumerate(CATEGORIES))
+    + " END AS category, o.item_name, o.price, c.label AS custom, o.quantity, "
+    "strftime('%Y-%m-%d %H:%M', o.ordered_at, 'unixepoch', 'localtime') AS order_time, o.is_paid")
+
+# ==========================================
+# Schema Migration
+# ==========================================
+# 版本號記在 PRAGMA user_version。新增資料表/欄位時在 MIGRATIONS 尾端加一個函式即可，
+# 已上線的 migration 不要再改。每個 migration 與版本號在同一個 transaction 內完成。
+
+DEFAULT_SHOPS = {"main": "吃什麼？", "drink": "喝什麼？"}
+
+def _m001_base_schema(conn, seed):
+    """基本資料表；預設人員/選項只寫進這次才新建的設定表"""
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.execute('''CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, category TEXT, item_name TEXT,
+        price INTEGER, custom TEXT, quantity INTEGER, order_time TEXT, is_paid BOOLEAN)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS config_colleagues (name TEXT PRIMARY KEY)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS config_options (
+        category TEXT, option_value TEXT, PRIMARY KEY (category, option_value))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS config_shop (
+        category TEXT PRIMARY KEY, shop_name TEXT)''')
+    conn.executemany("INSERT OR IGNORE INTO config_shop (category, shop_name) VALUES (?, ?)", DEFAULT_SHOPS.items())
+    if not seed or {"config_colleagues", "config_options"} <= existing: return
+    colleagues, options = seed()
+    if "config_colleagues" not in existing:
+        conn.executemany("INSERT OR IGNORE INTO config_colleagues (name) VALUES (?)", [(n,) for n in colleagues])
+    if "config_options" not in existing:
+        conn.executemany("INSERT OR IGNORE INTO config_options (category, option_value) VALUES (?, ?)",
+                         [(cat, opt) for cat, opts in options.items() for opt in opts])
+
+def _m002_order_changelog(conn, seed):
+    """orders 的異動紀錄：每次 insert/update/delete 都記一筆，rev 就是全域遞增的版本號"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS order_changes (
+        rev INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER NOT NULL)''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_orders_ins AFTER INSERT ON orders
+        BEGIN INSERT INTO order_changes (order_id) VALUES (NEW.id); END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_orders_upd AFTER UPDATE ON orders
+        BEGIN INSERT INTO order_changes (order_id) VALUES (NEW.id); END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_orders_del AFTER DELETE ON orders
+        BEGIN INSERT INTO order_changes (order_id) VALUES (OLD.id); END''')
+
+def _m003_order_indexes(conn, seed):
+    """統計看板/收款頁的 GROUP BY 查詢用；多帶 price 讓每人合計/收款進度只讀 index 就算得出來"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_cat_paid_name ON orders (category, is_paid, name, price)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_name ON orders (name)")
+
+def _m004_order_sessions(conn, seed):
+    """點餐場次：orders 只放目前場次，關帳時整批搬到 orders_archive (依 session_id 分區)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS order_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, opened_at TEXT NOT NULL, closed_at TEXT,
+        order_count INTEGER, total INTEGER)''')
+    conn.execute("ALTER TABLE orders ADD COLUMN session_id INTEGER")
+    # 以 (session_id, id) 為主鍵：同一場的訂單存在一起，查某一場只讀那一段
+    conn.execute('''CREATE TABLE IF NOT EXISTS orders_archive (
+        session_id INTEGER NOT NULL, id INTEGER NOT NULL, name TEXT, category TEXT, item_name TEXT,
+        price INTEGER, custom TEXT, quantity INTEGER, order_time TEXT, is_paid BOOLEAN,
+        PRIMARY KEY (session_id, id)) WITHOUT ROWID''')
+    sid = conn.execute("INSERT INTO order_sessions (opened_at) VALUES (datetime('now', 'localtime'))").lastrowid
+    conn.execute("UPDATE orders SET session_id = ?", (sid,))
+
+def _epoch(text):
+    try: return int(datetime.strptime(text, '%Y-%m-%d %H:%M').timestamp())
+    except (TypeError, ValueError): return 0
+
+def _m005_compact_orders(conn, seed):
+    """orders / orders_archive 改成整數編碼 (見「訂單欄位編碼」)，舊的 custom 字串拆回結構化欄位"""
+    conn.execute('''CREATE TABLE custom_options (
+        id INTEGER PRIMARY KEY, kind TEXT NOT NULL, label TEXT NOT NULL, UNIQUE (kind, label))''')
+    conn.execute('''CREATE TABLE customizations (
+        id INTEGER PRIMARY KEY, size_id INTEGER, sugar_id INTEGER, ice_id INTEGER, spice_id INTEGER,
+        note TEXT NOT NULL DEFAULT '', label TEXT NOT NULL UNIQUE)''')
+    conn.execute('''CREATE TABLE customization_tags (
+        custom_id INTEGER NOT NULL, tag_id INTEGER NOT NULL, PRIMARY KEY (custom_id, tag_id)) WITHOUT ROWID''')
+    cols = '''session_id INTEGER{}, cat INTEGER NOT NULL, is_paid INTEGER NOT NULL DEFAULT 0,
+        price INTEGER NOT NULL, quantity INTEGER NOT NULL, custom_id INTEGER NOT NULL, ordered_at INTEGER NOT NULL,
+        name TEXT NOT NULL, item_name TEXT NOT NULL'''
+    conn.execute(f"CREATE TABLE orders_new (id INTEGER PRIMARY KEY AUTOINCREMENT, {cols.format('')})")
+    conn.execute(f'''CREATE TABLE orders_archive_new (id INTEGER NOT NULL, {cols.format(' NOT NULL')},
+        PRIMARY KEY (session_id, id)) WITHOUT ROWID''')
+
+    known = {"spice": set(), "tags": set()}
+    for cat, value in conn.execute("SELECT category, option_value FROM config_options"):
+        if cat == "spicy": known["spice"].add(value)
+        elif cat in ("tags", "drink_tags"): known["tags"].add(value)
+    custom_ids = {}
+    def convert(row):
+        id_, sid, name, cat, item, price, custom, qty, order_time, paid = row
+        key = (custom or "", cat)
+        if key not in custom_ids: custom_ids[key] = intern_customization(conn, Customization.parse(custom, cat, known))
+        return (id_, sid, CATEGORY_IDS.get(cat, 0), int(paid or 0), price or 0, qty or 1, custom_ids[key],
+                _epoch(order_time), name or "", item or "")
+    legacy = "id, session_id, name, category, item_name, price, custom, quantity, order_time, is_paid"
+    compact = "id, session_id, cat, is_paid, price, quantity, custom_id, ordered_at, name, item_name"
+    for table in ("orders", "orders_archive"):
+        rows = [convert(r) for r in conn.execute(f"SELECT {legacy} FROM {table}").fetchall()]
+        conn.executemany(f"INSERT INTO {table}_new ({compact}) VALUES ({', '.join('?' * 10)})", rows)
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'orders'").fetchone()
+    for table in ("orders", "orders_archive"):
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    # 刪掉的訂單 id 不能再被用到 (封存與異動紀錄都用 id 對應)
+    if seq:
+        conn.execute("DELETE FROM sqlite_sequence WHERE name IN ('orders', 'orders_new')")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', ?)", seq)
+    _m002_order_changelog(conn, seed)  # DROP TABLE 時 trigger 一起刪掉了，重建
+    conn.execute("CREATE INDEX idx_orders_cat_paid_name ON orders (cat, is_paid, name, price)")
+    conn.execute("CREATE INDEX idx_orders_name ON orders (name)")
+
+    # 相容舊欄位的 view：外部工具/舊腳本照舊讀寫，寫入的客製化字串直接存成備註
+    conn.execute(f'''CREATE VIEW orders_legacy AS SELECT {LEGACY_COLUMNS_SQL}
+        FROM orders o JOIN customizations c ON c.id = o.custom_id''')
+    conn.execute('''CREATE TRIGGER trg_orders_legacy_ins INSTEAD OF INSERT ON orders_legacy BEGIN
+        INSERT OR IGNORE INTO customizations (note, label) VALUES (COALESCE(NEW.custom, ''), COALESCE(NEW.custom, ''));
+        INSERT INTO orders (id, session_id, cat, is_paid, price, quantity, custom_id, ordered_at, name, item_name)
+        VALUES (NEW.id, COALESCE(NEW.session_id, (SELECT MAX(id) FROM order_sessions)),
+            CASE NEW.category WHEN '飲料' THEN 1 ELSE 0 END, COALESCE(NEW.is_paid, 0), NEW.price,
+            COALESCE(NEW.quantity, 1), (SELECT id FROM customizations WHERE label = COALESCE(NEW.custom, '')),
+            COALESCE(strftime('%s', NEW.order_time, 'utc'), strftime('%s', 'now')), NEW.name, NEW.item_name);
+        END''')
+
+def _m006_menu_items(conn, seed):
+    """菜單記憶：每個 (類別, 店家, 品項) 最近一次的單價與點過幾次，由 orders 的 INSERT trigger 維護"""
+    conn.execute('''CREATE TABLE menu_items (
+        cat INTEGER NOT NULL, shop TEXT NOT NULL, item_name TEXT NOT NULL, unit_price INTEGER NOT NULL,
+        uses INTEGER NOT NULL, last_order_id INTEGER NOT NULL,
+        PRIMARY KEY (cat, shop, item_name)) WITHOUT ROWID''')
+    # menu.py 的索引只讀 last_order_id 比上次大的列 (增量更新)
+    conn.execute("CREATE INDEX idx_menu_items_last_order ON menu_items (last_order_id)")
+    shop_of = lambda cat: f"COALESCE((SELECT shop_name FROM config_shop WHERE category = {SHOP_KEY_SQL.format(cat)}), '')"
+    # 舊訂單沒有記店家，算在建表當下設定的店家；單價取每個品項最後一筆 (SQLite 的 MAX() 會帶出同一列的其他欄位)
+    conn.execute(f'''INSERT INTO menu_items (cat, shop, item_name, unit_price, uses, last_order_id)
+        SELECT cat, {shop_of("cat")}, item_name, price / MAX(quantity, 1), COUNT(*), MAX(id)
+        FROM (SELECT id, cat, item_name, price, quantity FROM orders
+              UNION ALL SELECT id, cat, item_name, price, quantity FROM orders_archive)
+        GROUP BY cat, item_name''')
+    conn.execute(f'''CREATE TRIGGER trg_orders_menu AFTER INSERT ON orders BEGIN
+        INSERT INTO menu_items (cat, shop, item_name, unit_price, uses, last_order_id)
+        VALUES (NEW.cat, {shop_of("NEW.cat")}, NEW.item_name, NEW.price / MAX(NEW.quantity, 1), 1, NEW.id)
+        ON CONFLICT (cat, shop, item_name) DO UPDATE
+        SET unit_price = excluded.unit_price, uses = uses + 1, last_order_id = excluded.last_order_id;
+        END''')
+
+# 訂單當下設定的店家 (shops.id)；{} 是類別 (cat) 的 SQL 運算式
+CURRENT_SHOP_SQL = ("(SELECT s.id FROM config_shop cs JOIN shops s ON s.name = cs.shop_name "
+                    "WHERE cs.category = " + SHOP_KEY_SQL + ")")
+ROLLUP_TABLES = ("rollup_items", "rollup_customs", "rollup_people")
+# 每張彙總表的主鍵與累加欄位
+ROLLUP_KEYS = {"rollup_items": "day, cat, shop_id, item_name", "rollup_customs": "day, cat, custom_id",
+               "rollup_people": "name, day"}
+ROLLUP_SUMS = {"rollup_items": ("orders", "quantity", "revenue"), "rollup_customs": ("orders", "quantity"),
+               "rollup_people": ("orders", "revenue", "paid_orders", "paid_revenue", "timed_payments", "pay_seconds")}
+
+def _rollup_sql(row, sign, tables=ROLLUP_TABLES):
+    # 把一筆訂單 (trigger 的 NEW / OLD) 加進 (+1) 或扣出 (-1) 每日彙總
+    day = f"date({row}.ordered_at, 'unixepoch', 'localtime')"
+    shop = f"COALESCE({row}.shop_id, {CURRENT_SHOP_SQL.format(row + '.cat')}, 0)"
+    paid = f"({row}.is_paid != 0)"
+    values = {
+        "rollup_items": f"{day}, {row}.cat, {shop}, {row}.item_name, {sign}, {sign} * {row}.quantity, {sign} * {row}.price",
+        "rollup_customs": f"{day}, {row}.cat, {row}.custom_id, {sign}, {sign} * {row}.quantity",
+        "rollup_people": f"{day}, {row}.name, {sign}, {sign} * {row}.price, {sign} * {paid}, {sign} * {paid} * {row}.price, "
+                         f"{sign} * ({paid} AND {row}.paid_at IS NOT NULL), "
+                         f"{sign} * CASE WHEN {paid} THEN COALESCE({row}.paid_at - {row}.ordered_at, 0) ELSE 0 END",
+    }
+    return "".join(f"INSERT INTO {t} VALUES ({values[t]}) ON CONFLICT ({ROLLUP_KEYS[t]}) DO UPDATE SET "
+                   + ", ".join(f"{c} = {c} + excluded.{c}" for c in ROLLUP_SUMS[t]) + ";\n" for t in tables)
+
+def _m007_daily_rollups(conn, seed):
+    """每日彙總 (analytics.py 用)：品項/客製/每人的份數、金額與付款時間，由 orders 的 trigger 增量維護，關帳後也保留"""
+    # 店家名稱編號；設定的店家一改名就多一筆，訂單記下當時的店家
+    conn.execute("CREATE TABLE shops (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    conn.execute("INSERT OR IGNORE INTO shops (name) SELECT shop_name FROM config_shop")
+    conn.execute('''CREATE TRIGGER trg_config_shop_ins AFTER INSERT ON config_shop
+        BEGIN INSERT OR IGNORE INTO shops (name) VALUES (NEW.shop_name); END''')
+    conn.execute('''CREATE TRIGGER trg_config_shop_upd AFTER UPDATE OF shop_name ON config_shop
+        BEGIN INSERT OR IGNORE INTO shops (name) VALUES (NEW.shop_name); END''')
+    for table in ("orders", "orders_archive"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN shop_id INTEGER")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN paid_at INTEGER")  # 收款時間 (epoch)，舊訂單不知道
+        conn.execute(f"UPDATE {table} SET shop_id = {CURRENT_SHOP_SQL.format('cat')}")  # 舊訂單算在目前的店家
+
+    conn.execute('''CREATE TABLE rollup_items (
+        day TEXT NOT NULL, cat INTEGER NOT NULL, shop_id INTEGER NOT NULL, item_name TEXT NOT NULL,
+        orders INTEGER NOT NULL, quantity INTEGER NOT NULL, revenue INTEGER NOT NULL,
+        PRIMARY KEY (day, cat, shop_id, item_name)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE rollup_customs (
+        day TEXT NOT NULL, cat INTEGER NOT NULL, custom_id INTEGER NOT NULL, orders INTEGER NOT NULL,
+        quantity INTEGER NOT NULL, PRIMARY KEY (day, cat, custom_id)) WITHOUT ROWID''')
+    # timed_payments / pay_seconds 只算知道收款時間的訂單，平均付款時間 = pay_seconds / timed_payments。
+    # 主鍵以 name 開頭：每人彙總直接照主鍵順序 GROUP BY，不用另外排序 (一年約兩萬列，整表掃描也只要幾 ms)
+    conn.execute('''CREATE TABLE rollup_people (
+        day TEXT NOT NULL, name TEXT NOT NULL, orders INTEGER NOT NULL, revenue INTEGER NOT NULL,
+        paid_orders INTEGER NOT NULL, paid_revenue INTEGER NOT NULL, timed_payments INTEGER NOT NULL,
+        pay_seconds INTEGER NOT NULL, PRIMARY KEY (name, day)) WITHOUT ROWID''')
+
+    cols = "cat, is_paid, price, quantity, custom_id, ordered_at, name, item_name, shop_id"
+    history = f"SELECT {cols} FROM orders UNION ALL SELECT {cols} FROM orders_archive"
+    day = "date(ordered_at, 'unixepoch', 'localtime')"
+    conn.execute(f'''INSERT INTO rollup_items SELECT {day}, cat, COALESCE(shop_id, 0), item_name,
+        COUNT(*), SUM(quantity), SUM(price) FROM ({history}) GROUP BY 1, 2, 3, 4''')
+    conn.execute(f'''INSERT INTO rollup_customs SELECT {day}, cat, custom_id, COUNT(*), SUM(quantity)
+        FROM ({history}) GROUP BY 1, 2, 3''')
+    conn.execute(f'''INSERT INTO rollup_people SELECT {day}, name, COUNT(*), SUM(price), SUM(is_paid != 0),
+        SUM(CASE WHEN is_paid != 0 THEN price ELSE 0 END), 0, 0 FROM ({history}) GROUP BY 1, 2''')
+
+    conn.execute(f"CREATE TRIGGER trg_orders_rollup_ins AFTER INSERT ON orders BEGIN {_rollup_sql('NEW', 1)} END")
+    # 關帳時 DELETE FROM orders 的訂單已經搬進 orders_archive，不是真的刪單，彙總保持不變
+    conn.execute(f'''CREATE TRIGGER trg_orders_rollup_del AFTER DELETE ON orders
+        WHEN NOT EXISTS (SELECT 1 FROM orders_archive
+                         WHERE session_id = COALESCE(OLD.session_id, {CURRENT_SESSION_SQL}) AND id = OLD.id)
+        BEGIN {_rollup_sql('OLD', -1)} END''')
+    # 收款/撤銷只動到每人彙總
+    conn.execute(f'''CREATE TRIGGER trg_orders_rollup_paid AFTER UPDATE OF is_paid, paid_at ON orders
+        BEGIN {_rollup_sql('OLD', -1, ("rollup_people",))}{_rollup_sql('NEW', 1, ("rollup_people",))} END''')
+    conn.execute(f'''CREATE TRIGGER trg_orders_rollup_upd
+        AFTER UPDATE OF cat, price, quantity, custom_id, ordered_at, name, item_name, shop_id ON orders
+        BEGIN {_rollup_sql('OLD', -1)}{_rollup_sql('NEW', 1)} END''')
+
+# 現在時間 (epoch 秒)
+NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+PAYMENT_COLUMNS = "session_id, name, kind, amount, order_ids, upto_rev, created_at"
+
+def _payment_sql(row, kind, amount):
+    # trigger 用：不是經過收款紀錄 (orders.settle) 改到的已收金額，補記一筆
+    return (f"INSERT INTO payments ({PAYMENT_COLUMNS}) VALUES (COALESCE({row}.session_id, {CURRENT_SESSION_SQL}), "
+            f"{row}.name, '{kind}', {amount}, {row}.id, NULL, {NOW_SQL});")
+
+def _m008_payment_ledger(conn, seed):
+    """收款紀錄：每次收款/撤銷記一筆 (誰、金額、涵蓋哪些訂單、時間)，收款進度的已收金額直接加總這張表"""
+    # amount 收款為正、撤銷/退款為負；order_ids 為逗號分隔的訂單 id；upto_rev 是收款當時畫面讀到的 revision
+    conn.execute('''CREATE TABLE payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, session_id INTEGER NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,
+        amount INTEGER NOT NULL, order_ids TEXT NOT NULL, upto_rev INTEGER, created_at INTEGER NOT NULL)''')
+    conn.execute("CREATE INDEX idx_payments_session ON payments (session_id, amount)")  # 加總只讀 index
+    # 最後一次改變這筆訂單付款狀態的收款紀錄 (trigger 靠它分辨是不是經過收款紀錄的寫入)
+    conn.execute("ALTER TABLE orders ADD COLUMN payment_id INTEGER")
+    # 目前場次已經付過的訂單：每人補一筆期初紀錄
+    conn.execute(f'''INSERT INTO payments ({PAYMENT_COLUMNS})
+        SELECT COALESCE(session_id, {CURRENT_SESSION_SQL}), name, 'opening', SUM(price), GROUP_CONCAT(id), NULL, {NOW_SQL}
+        FROM orders WHERE is_paid != 0 GROUP BY 1, 2''')
+
+    # 其他程式直接改 orders (舊版 view、HTTP 以外的腳本) 也要讓已收金額對得上：收款紀錄沒記到的差額由 trigger 補記
+    paid = "(({0}.is_paid != 0) * {0}.price)"
+    conn.execute(f'''CREATE TRIGGER trg_orders_payment_ins AFTER INSERT ON orders WHEN NEW.is_paid != 0
+        BEGIN {_payment_sql('NEW', 'direct', 'NEW.price')} END''')
+    conn.execute(f'''CREATE TRIGGER trg_orders_payment_upd AFTER UPDATE OF is_paid, price ON orders
+        WHEN NEW.payment_id IS OLD.payment_id AND {paid.format('NEW')} != {paid.format('OLD')}
+        BEGIN {_payment_sql('NEW', 'direct', paid.format('NEW') + ' - ' + paid.format('OLD'))} END''')
+    # 刪掉已付款的訂單 = 退款；關帳搬進 orders_archive 的不算 (同 trg_orders_rollup_del)
+    conn.execute(f'''CREATE TRIGGER trg_orders_payment_del AFTER DELETE ON orders
+        WHEN OLD.is_paid != 0 AND NOT EXISTS (SELECT 1 FROM orders_archive
+            WHERE session_id = COALESCE(OLD.session_id, {CURRENT_SESSION_SQL}) AND id = OLD.id)
+        BEGIN {_payment_sql('OLD', 'refund', '-OLD.price')} END''')
+
+CUTOFF_ERROR = "已截止點餐"  # trg_orders_cutoff 擋下新訂單時的錯誤訊息 (sqlite3.IntegrityError)
+
+def _m009_order_cutoffs(conn, seed):
+    """點餐截止：每家店 (config_shop) 可設每天的截止時間，到了就把這場的彙總與應收明細存成一筆送出紀錄
+    (deadlines.py)，之後這家店不再接受新訂單"""
+    conn.execute("ALTER TABLE config_shop ADD COLUMN cutoff TEXT")  # 'HH:MM'；NULL = 不截止
+    # summary / details / payments 是送出當下的 JSON (欄位見 deadlines.SUBMISSION_COLUMNS)；
+    # reopened_at 不是 NULL 表示管理員重新開放，這場不會再自動送出
+    conn.execute('''CREATE TABLE submissions (
+        session_id INTEGER NOT NULL, cat INTEGER NOT NULL, shop_id INTEGER, deadline_at INTEGER,
+        submitted_at INTEGER NOT NULL, reopened_at INTEGER, order_count INTEGER NOT NULL, quantity INTEGER NOT NULL,
+        total INTEGER NOT NULL, summary TEXT NOT NULL, details TEXT NOT NULL, payments TEXT NOT NULL,
+        PRIMARY KEY (session_id, cat)) WITHOUT ROWID''')
+    # 擋在資料庫裡：HTTP 介面、舊版 view、其他程式的新訂單也一樣進不來
+    conn.execute(f'''CREATE TRIGGER trg_orders_cutoff BEFORE INSERT ON orders
+        WHEN EXISTS (SELECT 1 FROM submissions WHERE session_id = COALESCE(NEW.session_id, {CURRENT_SESSION_SQL})
+                     AND cat = NEW.cat AND reopened_at IS NULL)
+        BEGIN SELECT RAISE(ABORT, '{CUTOFF_ERROR}'); END''')
+
+def _m010_rollup_owners(conn, seed):
+    """每張彙總表只由一個 UPDATE trigger 維護：_m007 的兩個 trigger 都會改 rollup_people，
+    同時改到價錢與付款狀態的 UPDATE 會算兩次。重建兩個 trigger，並從訂單重算 rollup_people。"""
+    conn.execute("DROP TRIGGER trg_orders_rollup_paid")
+    conn.execute("DROP TRIGGER trg_orders_rollup_upd")
+    people = ("rollup_people",)
+    items = tuple(t for t in ROLLUP_TABLES if t not in people)
+    conn.execute(f'''CREATE TRIGGER trg_orders_rollup_paid
+        AFTER UPDATE OF is_paid, paid_at, price, name, ordered_at ON orders
+        BEGIN {_rollup_sql('OLD', -1, people)}{_rollup_sql('NEW', 1, people)} END''')
+    conn.execute(f'''CREATE TRIGGER trg_orders_rollup_upd
+        AFTER UPDATE OF cat, price, quantity, custom_id, ordered_at, item_name, shop_id ON orders
+        BEGIN {_rollup_sql('OLD', -1, items)}{_rollup_sql('NEW', 1, items)} END''')
+    # orders_archive 從不刪除，可以從頭算回正確的值
+    cols = "is_paid, price, ordered_at, name, paid_at"
+    day = "date(ordered_at, 'unixepoch', 'localtime')"
+    conn.execute("DELETE FROM rollup_people")
+    conn.execute(f'''INSERT INTO rollup_people SELECT {day}, name, COUNT(*), SUM(price),
+        SUM(is_paid != 0), SUM(CASE WHEN is_paid != 0 THEN price ELSE 0 END),
+        SUM(is_paid != 0 AND paid_at IS NOT NULL),
+        SUM(CASE WHEN is_paid != 0 THEN COALESCE(paid_at - ordered_at, 0) ELSE 0 END)
+        FROM (SELECT {cols} FROM orders UNION ALL SELECT {cols} FROM orders_archive) GROUP BY 1, 2''')
+
+MIGRATIONS = [
+    _m001_base_schema,
+    _m002_order_changelog,
+    _m003_order_indexes,
+    _m004_order_sessions,
+    _m005_compact_orders,
+    _m006_menu_items,
+    _m007_daily_rollups,
+    _m008_payment_ledger,
+    _m009_order_cutoffs,
+    _m010_rollup_owners,
+]
+
+def migrate(conn, seed=None):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for v in range(version, len(MIGRATIONS)):
+        MIGRATIONS[v](conn, seed)
+        conn.execute(f"PRAGMA user_version = {v + 1}")
+    return len(MIGRATIONS)
+
+def ensure_schema(seed=None):
+    """確保資料庫是最新版本；每個 process (每個資料庫檔案) 只會真的檢查一次。
+    seed() 回傳 (colleagues, options)，只在第一次建庫時被呼叫。"""
+    mgr = get_manager()
+    if mgr.schema_version is None:
+        mgr.schema_version = run_write(lambda conn: migrate(conn, seed))
+    return mgr.schema_version
+
+# ==========================================
+# 共用查詢 Helper
+# ==========================================
+def run_write(fn, in_txn=True):
+    """把 fn(conn) 交給 writer 執行緒並等待結果 (失敗時直接丟出例外)。
+    在 track_changes() 裡呼叫時，順便記下這筆寫入造成的訂單異動 (OrderDelta)"""
+    mgr = get_manager()
+    changes = getattr(_tls, "changes", None)
+    if changes is not None and in_txn: fn = OrderDelta.capture(fn, changes)
+    retries = mgr.lock_retries
+    try:
+        return mgr.submit(fn, in_txn).result(timeout=WRITE_TIMEOUT)
+    finally:
+        metrics.add_write(mgr.lock_retries - retries)  # 同時間其他人的重試也會算進來，僅供參考
+
+def execute_db(query, params=()):
+    try:
+        run_write(lambda conn: conn.execute(query, params).rowcount,
+                  in_txn=not query.lstrip().upper().startswith("VACUUM"))
+        return True
+    except (sqlite3.OperationalError, TimeoutError):
+        st.error("⚠️ 系統忙碌 (Database Locked)，請稍後再試")
+        return False
+
+def ui_call(fn, *args, **kwargs):
+    """畫面用：呼叫寫入函式 (例如 orders.add_order)，資料庫忙碌時顯示錯誤並回傳 None"""
+    try:
+        return fn(*args, **kwargs)
+    except (sqlite3.OperationalError, TimeoutError):
+        st.error("⚠️ 系統忙碌 (Database Locked)，請稍後再試")
+        return None
+
+def get_db(query, params=()):
+    import pandas as pd
+    mgr = get_manager()
+    try:
+        with mgr.reading() as conn: df = pd.read_sql_query(query, conn, params=params)
+        metrics.add_rows(len(df))
+        return df
+    except Exception:
+        return pd.DataFrame()
+
+# ==========================================
+# 訂單增量讀取
+# ==========================================
+# orders 每次異動都會由 trigger 寫進 order_changes，rev 只增不減。
+# OrderSnapshot 記住上次讀到的 rev，refresh() 只撈這之後有變動的訂單，
+# 所以畫面刷新的成本跟「異動筆數」成正比，而不是整張表的大小。
+
+def order_revision(conn):
+    """目前 orders 的版本號 (沒有任何異動時為 0)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'order_changes'").fetchone()
+    return row[0] if row else 0
+
+
+SNAPSHOT_SQL = """SELECT o.id, o.name, o.cat, o.item_name, o.price, o.quantity, c.label AS custom, o.ordered_at, o.is_paid
+    FROM orders o JOIN customizations c ON c.id = o.custom_id"""
+SNAPSHOT_DTYPES = {"id": "int64", "cat": "int8", "price": "int32", "quantity": "int32",
+                   "ordered_at": "int64", "is_paid": "bool"}
+
+
+class OrderSnapshot:
+    """某個 revision 時 orders 全表的 DataFrame (index = 訂單 id)；
+    category 是只有 CATEGORIES 兩個值的 Categorical，增量合併時型別不會跑掉"""
+
+    def __init__(self):
+        self.rev = -1
+        self.df = None
+
+    @staticmethod
+    def _typed(df):
+        import pandas as pd
+        df = df.astype(SNAPSHOT_DTYPES)
+        df.insert(2, "category", pd.Categorical.from_codes(df.pop("cat"), categories=CATEGORIES))
+        return df.set_index('id', drop=False).rename_axis(None)
+
+    def _full_load(self, conn):
+        return self._typed(_frame(conn, SNAPSHOT_SQL + " ORDER BY o.id"))
+
+    def refresh(self):
+        """套用上次之後的異動並回傳 DataFrame；沒有異動時直接回傳同一個物件 (呼叫端不可修改)"""
+        mgr = get_manager()
+        cur = mgr.notifier.current(mgr.read_revision)
+        if cur == self.rev and self.df is not None: return self.df
+        with mgr.reading() as conn: self._apply_changes(conn, cur)
+        return self.df
+
+    def _apply_changes(self, conn, cur):
+        min_rev = conn.execute("SELECT MIN(rev) FROM order_changes").fetchone()[0]
+        if self.df is None or min_rev is None or min_rev > self.rev + 1:
+            # 第一次載入，或異動紀錄已被清掉 (接不上)：整表重讀
+            self.df = self._full_load(conn)
+        else:
+            window = (self.rev, cur)
+            changed = [r[0] for r in conn.execute(
+                "SELECT DISTINCT order_id FROM order_changes WHERE rev > ? AND rev <= ?", window)]
+            fresh = self._typed(_frame(conn,
+                SNAPSHOT_SQL + " WHERE o.id IN (SELECT order_id FROM order_changes WHERE rev > ? AND rev <= ?) ORDER BY o.id",
+                window))
+            self._merge(changed, fresh)
+        self.rev = cur
+
+    def _merge(self, changed, fresh):
+        import pandas as pd
+        kept = self.df.drop(index=changed, errors='ignore')
+        if fresh.empty: self.df = kept
+        elif kept.empty: self.df = fresh
+        else: self.df = pd.concat([kept, fresh]).sort_index()
+
+    def apply(self, delta):
+        """直接套用自己剛寫入的異動，不用等下次 refresh 回資料庫查。
+        中間夾著別人的異動 (before 跟快照的 revision 接不上) 時只換掉這幾筆，revision 留給下次 refresh 補齊。"""
+        if self.df is None: return
+        import pandas as pd
+        self._merge(delta.ids, self._typed(pd.DataFrame.from_records(delta.rows, columns=delta.columns)))
+        if delta.before == self.rev: self.rev = delta.after
+
+
+class OrderDelta:
+    """一筆寫入造成的訂單異動：revision 從 before 變成 after，ids 是動到的訂單，
+    rows 是它們寫入後的樣子 (SNAPSHOT_SQL 的欄位；刪掉的訂單不在 rows 裡)"""
+    __slots__ = ("before", "after", "ids", "columns", "rows")
+
+    def __init__(self, before, after, ids, columns, rows):
+        self.before, self.after, self.ids, self.columns, self.rows = before, after, ids, columns, rows
+
+    @staticmethod
+    def capture(fn, changes):
+        # 包裝寫入指令：在同一個 transaction 裡順便讀出異動。整批 commit 失敗重試時會再跑一次，
+        # 所以每次執行都覆寫自己的那一格，不會重複記錄
+        slot = []
+        changes.append(slot)
+        def job(conn):
+            slot.clear()
+            before = order_revision(conn)
+            result = fn(conn)
+            after = order_revision(conn)
+            if after != before:
+                window = (before, after)
+                ids = [r[0] for r in conn.execute(
+                    "SELECT DISTINCT order_id FROM order_changes WHERE rev > ? AND rev <= ?", window)]
+                cur = conn.execute(SNAPSHOT_SQL + " WHERE o.id IN (SELECT order_id FROM order_changes "
+                                   "WHERE rev > ? AND rev <= ?) ORDER BY o.id", window)
+                slot.append(OrderDelta(before, after, ids, [d[0] for d in cur.description], cur.fetchall()))
+            return result
+        return job
+
+
+class track_changes:
+    """with track_changes() as deltas: ... 區塊內 (目前執行緒) 的 run_write 都會把訂單異動記進 deltas"""
+
+    def __enter__(self):
+        self.prev = getattr(_tls, "changes", None)
+        self.slots = _tls.changes = []
+        return self
+
+    def __exit__(self, *exc):
+        _tls.changes = self.prev
+
+    def __iter__(self):
+        return (delta for slot in self.slots for delta in slot)
+
+
+# ==========================================
+# 點餐場次 (每天一場)
+# ==========================================
+# orders 永遠只有目前這一場的訂單，看板/收款的查詢只碰這份小資料。
+# 關帳 = 把這場的訂單搬進 orders_archive、開下一場，成本跟這場的筆數成正比，
+# 不再需要 DELETE 全表 + VACUUM 重寫整個檔案，歷史訂單也都留著。
+
+# 新訂單的 session_id：目前開著的場次一定是 id 最大的那一場
+CURRENT_SESSION_SQL = "(SELECT MAX(id) FROM order_sessions)"
+
+def _close_session(conn):
+    sid = conn.execute(f"SELECT {CURRENT_SESSION_SQL}").fetchone()[0]
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(price), 0) FROM orders").fetchone()
+    # 其他程式直接寫入、沒帶 session_id 的訂單也算在這一場
+    conn.execute('''INSERT INTO orders_archive
+        (session_id, id, cat, is_paid, price, quantity, custom_id, ordered_at, name, item_name, shop_id, paid_at)
+        SELECT COALESCE(session_id, ?), id, cat, is_paid, price, quantity, custom_id, ordered_at, name, item_name,
+            shop_id, paid_at
+        FROM orders''', (sid,))
+    conn.execute('''UPDATE order_sessions SET closed_at = datetime('now', 'localtime'), order_count = ?, total = ?
+        WHERE id = ?''', (count, total, sid))
+    # 要在開新場次之前刪：trg_orders_rollup_del 靠 (場次, id) 認出已經封存的訂單
+    conn.execute("DELETE FROM orders")
+    conn.execute("INSERT INTO order_sessions (opened_at) VALUES (datetime('now', 'localtime'))")
+    # 舊場次的異動紀錄用不到了；OrderSnapshot 發現接不上時會整表重讀 (此時 orders 是空的)
+    conn.execute("DELETE FROM order_changes")
+    return sid, count, total
+
+def close_session():
+    """關帳：目前場次的訂單封存到 orders_archive 並開新場次，整個動作在同一個 transaction 內完成。
+    回傳 (關閉的場次 id, 訂單數, 總金額)；資料庫忙碌時回傳 None。"""
+    try:
+        closed = run_write(_close_session)
+    except (sqlite3.OperationalError, TimeoutError):
+        st.error("⚠️ 系統忙碌 (Database Locked)，請稍後再試")
+        return None
+    invalidate_config()  # 新場次還沒有送出紀錄 (截止狀態)
+    return closed
+
+def session_history(limit=30):
+    """已關帳的場次 (新的在前)"""
+    with reading() as conn: return _frame(conn,
+        "SELECT id, opened_at, closed_at, order_count, total FROM order_sessions "
+        "WHERE closed_at IS NOT NULL ORDER BY id DESC LIMIT ?", (limit,))
+
+def archived_orders(session_id):
+    """某個已關帳場次的訂單 (欄位同舊版 orders 表)"""
+    with reading() as conn: return _frame(conn,
+        f"SELECT {LEGACY_COLUMNS_SQL} FROM orders_archive o JOIN customizations c ON c.id = o.custom_id "
+        "WHERE o.session_id = ? ORDER BY o.id", (session_id,))
+
+
+# ==========================================
+# 統計查詢 (SQL 彙總)
+# ==========================================
+# 彙總都在 SQLite 裡用 GROUP BY 算完，每個函式只回傳畫面真的會畫的欄位。
+
+def _frame(conn, query, params=()):
+    # 比 pd.read_sql_query 少一層轉換，幾千筆時快約三成
+    import pandas as pd
+    cur = conn.execute(query, params)
+    rows = cur.fetchall()
+    metrics.add_rows(len(rows))
+    return pd.DataFrame.from_records(rows, columns=[d[0] for d in cur.description])
+
+# 明細列：客製化顯示字串從 customizations 查 (依主鍵，每列一次 lookup)
+DETAIL_SQL = ("SELECT o.name, o.item_name, o.quantity, o.price, c.label AS custom "
+              "FROM orders o JOIN customizations c ON c.id = o.custom_id WHERE o.cat = ?")
+
+# (餐點, 客製) 彙總：先用整數 key (item_name, custom_id) 分組，只有分組結果才去查顯示字串。
+# cat 只有兩種值，走 index 反而要逐筆回表；用 +cat 讓查詢直接掃表
+SUMMARY_SQL = ("SELECT g.item_name, c.label AS custom, g.quantity FROM ("
+               "SELECT item_name, custom_id, SUM(quantity) AS quantity FROM orders WHERE +cat = ? GROUP BY item_name, custom_id"
+               ") g JOIN customizations c ON c.id = g.custom_id ORDER BY g.item_name, c.label")
+
+def stats_view(cat):
+    """統計看板某一區：總份數/總額、(餐點, 客製) 彙總、每人明細"""
+    cat_id = CATEGORY_IDS[cat]
+    with reading() as conn:
+        qty, price = conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(price), 0) FROM orders WHERE +cat = ?", (cat_id,)).fetchone()
+        summary = _frame(conn, SUMMARY_SQL, (cat_id,))
+        details = _frame(conn, DETAIL_SQL + " ORDER BY o.name, o.id", (cat_id,))
+    return {"qty": qty, "price": price, "summary": summary, "details": details}
+
+def person_totals(cat, is_paid):
+    """每人合計金額與訂單 id (收款/撤銷用)"""
+    with reading() as conn: df = _frame(conn,
+        "SELECT name, SUM(price) AS price, GROUP_CONCAT(id) AS ids FROM orders "
+        "WHERE cat = ? AND is_paid = ? GROUP BY name ORDER BY name", (CATEGORY_IDS[cat], is_paid))
+    df['ids'] = [[int(i) for i in ids.split(',')] for ids in df['ids']]
+    return df
+
+def payment_view(cat):
+    """收款頁某一區：待收款/已付款的每人合計 + 待收款明細"""
+    with reading() as conn:
+        unpaid_items = _frame(conn, DETAIL_SQL + " AND o.is_paid = 0 ORDER BY o.name, o.id", (CATEGORY_IDS[cat],))
+    return {"unpaid": person_totals(cat, 0), "paid": person_totals(cat, 1), "unpaid_items": unpaid_items}
+
+def order_count():
+    """這一場的訂單筆數 (看板/收款頁判斷有沒有訂單)"""
+    with reading() as conn: return conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+def payment_progress():
+    """(已收金額, 總金額)；已收金額是這一場收款紀錄的加總 (只讀 idx_payments_session)，不用掃訂單"""
+    with reading() as conn: return conn.execute(
+        f"SELECT (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE session_id = {CURRENT_SESSION_SQL}), "
+        "(SELECT COALESCE(SUM(price), 0) FROM orders)").fetchone()
+
+PAYMENT_KINDS = {"pay": "收款", "undo": "撤銷", "refund": "刪單退款", "direct": "其他程式", "opening": "期初"}
+
+def payment_ledger(limit=200):
+    """這一場的收款紀錄 (新的在前)：id, time, name, kind, amount, orders"""
+    with reading() as conn: df = _frame(conn,
+        "SELECT id, strftime('%H:%M:%S', created_at, 'unixepoch', 'localtime') AS time, name, kind, amount, "
+        "length(order_ids) - length(replace(order_ids, ',', '')) + 1 AS orders "
+        f"FROM payments WHERE session_id = {CURRENT_SESSION_SQL} ORDER BY id DESC LIMIT ?", (limit,))
+    df['kind'] = df['kind'].map(PAYMENT_KINDS)
+    return df
+
+
+# ==========================================
+# 看板共用快取 (整個 process 共用)
+# ==========================================
+# 同一個 revision 的彙總結果對每個 session 都一樣：第一個看到新 revision 的 session 查一次，
+# 其他 session (幾十個人同時開著看板) 直接拿同一個物件，不必各自查詢、各自存一份。
+# 快取掛在 ConnectionManager 上 (每個資料庫一份)，命中時只是一次 dict 查詢；
+# st.cache_data 每次命中都要 unpickle 出一份新的 DataFrame，st.cache_resource 光是雜湊參數就要約 0.3 ms。
+VIEW_CACHE_ENTRIES = 48  # (revision, 查詢) 組合；一個 revision 約 7 份 (看板/收款各兩類、訂單筆數、收款進度、收款紀錄)
+
+
+class ViewCache:
+    """依 (revision, 查詢函式, 參數) 保存彙總結果；revision 只增不減，超過上限時丟掉最早放進來的"""
+
+    def __init__(self):
+        self._entries = {}
+        self._building = {}  # key -> Lock：新 revision 時同時重畫的 session 只有一個去查，其他人等結果
+        self._lock = threading.Lock()
+
+    def get(self, rev, fn, args):
+        key = (rev, fn.__name__) + args
+        hit = self._entries.get(key)
+        if hit is not None: return hit
+        with self._lock: build = self._building.setdefault(key, threading.Lock())
+        with build:
+            hit = self._entries.get(key)
+            if hit is None:
+                try:
+                    hit = self._build(fn, args)
+                    with self._lock:
+                        self._entries[key] = hit
+                        while len(self._entries) > VIEW_CACHE_ENTRIES: del self._entries[next(iter(self._entries))]
+                finally:
+                    with self._lock: self._building.pop(key, None)  # 查詢失敗也要拿掉，不然 lock 會一直留著
+        return hit
+
+    @staticmethod
+    def _build(fn, args):
+        with reading() as conn:
+            conn.execute("BEGIN")  # 同一個查詢函式裡的幾個 SELECT 看到同一個版本 (fn 裡的 reading() 拿到同一條連線)
+            try: return fn(*args)
+            finally: conn.execute("COMMIT")
+
+
+def current_revision():
+    """目前的 orders revision (同 shared_view 用的版本)；多半直接讀記憶體，不查資料庫"""
+    mgr = get_manager()
+    return mgr.notifier.current(mgr.read_revision)
+
+def shared_view(fn, *args):
+    """fn(*args) 在目前 revision 的結果 (例如 shared_view(stats_view, "主餐"))，所有 session 共用同一個物件，
+    呼叫端不可修改回傳的 DataFrame。revision 沒變時不查資料庫"""
+    return get_manager().views.get(current_revision(), fn, args)
+
+
+# ==========================================
+# 設定快取 (人員 / 選項 / 店家)
+# ==========================================
+# 設定一天大概只改一次，所以整包放在記憶體：一次查詢讀完所有 config_* 表，
+# 之後每次 rerun 都直接讀快取。任何設定寫入都會把 generation +1，下次讀取時才重新載入。
+
+CONFIG_SQL = """
+    SELECT 'colleagues' AS kind, '' AS category, name AS value, rowid AS ord FROM config_colleagues
+    UNION ALL SELECT 'options', category, option_value, rowid FROM config_options
+    UNION ALL SELECT 'shop', category, shop_name, rowid FROM config_shop
+    UNION ALL SELECT 'cutoff', category, cutoff, rowid FROM config_shop WHERE cutoff IS NOT NULL
+    ORDER BY kind, category, ord"""
+# 目前場次與它的送出紀錄 (截止狀態)；送出/重新開放/關帳時跟設定一起失效
+SESSION_SQL = f"""SELECT s.id, s.opened_at, sub.cat, sub.deadline_at, sub.submitted_at, sub.reopened_at
+    FROM order_sessions s LEFT JOIN submissions sub ON sub.session_id = s.id WHERE s.id = {CURRENT_SESSION_SQL}"""
+
+def _load_session_state(conn):
+    session, submissions = None, {}
+    for sid, opened_at, cat, deadline_at, submitted_at, reopened_at in conn.execute(SESSION_SQL):
+        session = (sid, opened_at)
+        if cat is not None: submissions[cat] = (deadline_at, submitted_at, reopened_at)
+    return session, submissions
+
+def _load_config_snapshot(conn):
+    colleagues, options, shops, cutoffs = [], {}, {}, {}
+    rows = conn.execute(CONFIG_SQL).fetchall()
+    metrics.add_rows(len(rows))
+    for kind, cat, value, _ in rows:
+        if kind == 'colleagues': colleagues.append(value)
+        elif kind == 'options': options.setdefault(cat, []).append(value)
+        elif kind == 'cutoff': cutoffs[cat] = value
+        else: shops[cat] = value
+    session, submissions = _load_session_state(conn)
+    return {
+        "colleagues": tuple(colleagues),
+        "options": {cat: tuple(v) for cat, v in options.items()},
+        "shops": shops,
+        "cutoffs": cutoffs,      # 店家 key -> 'HH:MM'
+        "session": session,      # (目前場次 id, 開始時間)
+        "submissions": submissions,  # cat -> (截止時間, 送出時間, 重新開放時間)，只有目前場次
+    }
+
+def load_config():
+    """回傳目前的設定快照 (dict)；快取有效時完全不碰資料庫"""
+    mgr = get_manager()
+    gen, snap = mgr.config_cache
+    if gen != mgr.config_generation or snap is None:
+        gen = mgr.config_generation  # 先記下版本再查，查詢途中有寫入的話下次會再重載
+        with mgr.reading() as conn: snap = _load_config_snapshot(conn)
+        mgr.config_cache = (gen, snap)
+    return snap
+
+def invalidate_config():
+    get_manager().config_generation += 1
+
+def get_config_list(table, col, cat=None):
+    cfg = load_config()
+    if table == "config_colleagues": values = cfg["colleagues"]
+    else: values = cfg["options"].get(cat, ())
+    import pandas as pd
+    return pd.DataFrame({col: list(values)})
+
+# 可以用 update_config_list 修改的設定表：table -> (欄位, 是否以 category 分組)
+CONFIG_TABLES = {
+    "config_colleagues": ("name", False),
+    "config_options": ("option_value", True),
+}
+
+def _config_diff(conn, table, col, values, cat):
+    where, params = (" WHERE category = ?", (cat,)) if cat else ("", ())
+    current = [r[0] for r in conn.execute(f"SELECT {col} FROM {table}{where} ORDER BY rowid", params)]
+    current_set, wanted = set(current), set(values)
+    removed = [v for v in current if v not in wanted]
+    added = [v for v in values if v not in current_set]
+    kept = [v for v in current if v in wanted]
+    # 顯示順序就是 rowid 順序：保留的值順序沒變、新增的都接在最後，才能只做差異更新
+    if kept + added != values:
+        removed, added = current, values
+    if cat:
+        conn.executemany(f"DELETE FROM {table} WHERE category = ? AND {col} = ?", [(cat, v) for v in removed])
+        conn.executemany(f"INSERT INTO {table} (category, {col}) VALUES (?, ?)", [(cat, v) for v in added])
+    else:
+        conn.executemany(f"DELETE FROM {table} WHERE {col} = ?", [(v,) for v in removed])
+        conn.executemany(f"INSERT INTO {table} ({col}) VALUES (?)", [(v,) for v in added])
+    return len(added), len(removed)
+
+def update_config_list(table, col, new_df, cat=None):
+    """把設定表改成 new_df[col] 的內容。只刪掉被移除的值、插入新增的值，
+    整個差異在同一個 transaction 內套用，讀取端不會看到清空到一半的名單。
+    回傳 (新增數, 刪除數)；資料庫忙碌時回傳 None。"""
+    if CONFIG_TABLES.get(table) != (col, cat is not None):
+        raise ValueError(f"不支援的設定表: {table}.{col}")
+    values = new_df[col].dropna().astype(str).str.strip()
+    values = values[values != ""].drop_duplicates().tolist()
+    try:
+        result = run_write(lambda conn: _config_diff(conn, table, col, values, cat))
+    except (sqlite3.OperationalError, TimeoutError):
+        st.error("⚠️ 系統忙碌 (Database Locked)，請稍後再試")
+        return None
+    invalidate_config()
+    return result
+
+def get_shop_name(cat):
+    return load_config()["shops"].get(cat, "未設定")
+
+def set_shop_name(cat, name):
+    execute_db("UPDATE config_shop SET shop_name = ? WHERE category = ?", (name, cat))
+    invalidate_config()
+
+def get_cutoff(cat):
+    """店家每天的截止時間 'HH:MM'，沒設定時為 None"""
+    return load_config()["cutoffs"].get(cat)
+
+def cutoff_state():
+    """直接從資料庫讀 (截止時間, 目前場次, 送出紀錄)，格式同 load_config() 的 cutoffs / session / submissions。
+    排程用它判斷設定快取是不是被其他 process 改過"""
+    with reading() as conn:
+        cutoffs = dict(conn.execute("SELECT category, cutoff FROM config_shop WHERE cutoff IS NOT NULL"))
+        return (cutoffs, *_load_session_state(conn))
+
+def set_cutoff(cat, cutoff):
+    execute_db("UPDATE config_shop SET cutoff = ? WHERE category = ?", (cutoff, cat))
+    invalidate_config()
@@ -0,0 +1,198 @@
+"""點餐截止：每家店到了截止時間就自動「送出」，之後不再接受新訂單
+
+管理員在側邊欄設定每家店每天的截止時間 (config_shop.cutoff，'HH:MM')；實際截止的時刻是這一場開始之後
+第一次到達的那個時間。到了之後，背景排程 (start()，整個 process 一條執行緒，不需要外部 cron) 在同一個
+transaction 裡把這家店這一場的彙總表、每人明細與每人應付金額存成一筆送出紀錄 (submissions)，
+之後這家店的新訂單由 trg_orders_cutoff 擋下 (db._m009_order_cutoffs)。
+送出之後看板直接畫這筆紀錄 (解析一次就留在記憶體)，不再查訂單。
+
+    deadlines.status("主餐")        # Status：截止時間、送出時間、是否已截止
+    deadlines.submission("主餐")    # 已截止時的 Submission (view 同 db.stats_view，另有 payments)
+    deadlines.submit("主餐")        # 立即截止送出
+    deadlines.reopen("主餐")        # 重新開放 (這一場不會再自動送出)
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+
+log = logging.getLogger(__name__)
+
+CHECK_EVERY = 30  # 秒，排程最長多久醒來一次 (抓其他 process 改的設定)；這個 process 改設定時會立刻叫醒
+# 送出紀錄裡各個 JSON 欄位的欄名
+SUBMISSION_COLUMNS = {
+    "summary": ("item_name", "custom", "quantity"),
+    "details": ("name", "item_name", "quantity", "price", "custom"),
+    "payments": ("name", "orders", "amount"),
+}
+PAYMENTS_SQL = "SELECT name, COUNT(*), SUM(price) FROM orders WHERE +cat = ? GROUP BY name ORDER BY name"
+
+
+def deadline_for(cutoff, opened_at):
+    """場次開始 (opened_at，'YYYY-mm-dd HH:MM:SS') 之後第一次到 cutoff ('HH:MM') 的時刻 (epoch)"""
+    opened = datetime.fromisoformat(opened_at)
+    due = datetime.combine(opened.date(), datetime.strptime(cutoff, "%H:%M").time())
+    if due <= opened: due += timedelta(days=1)
+    return int(due.timestamp())
+
+
+class Status:
+    """某家店在目前場次的截止狀態 (時間皆為 epoch，沒有時為 None)"""
+    __slots__ = ("cutoff", "deadline_at", "submitted_at", "reopened_at")
+
+    def __init__(self, cutoff, deadline_at, submitted_at, reopened_at):
+        self.cutoff, self.deadline_at, self.submitted_at, self.reopened_at = cutoff, deadline_at, submitted_at, reopened_at
+
+    @property
+    def frozen(self):
+        return self.submitted_at is not None and self.reopened_at is None
+
+def status(category):
+    """從設定快取算出來 (不查資料庫)；送出/重新開放/關帳時快取會失效"""
+    cfg = db.load_config()
+    cutoff = cfg["cutoffs"].get(db.SHOP_KEYS[db.CATEGORY_IDS[category]])
+    sub = cfg["submissions"].get(db.CATEGORY_IDS[category])
+    if sub is not None: return Status(cutoff, *sub)
+    deadline_at = deadline_for(cutoff, cfg["session"][1]) if cutoff and cfg["session"] else None
+    return Status(cutoff, deadline_at, None, None)
+
+
+class Submission:
+    """一筆送出紀錄：view 的格式同 db.stats_view (看板直接拿來畫)，payments 是每人應付金額"""
+    __slots__ = ("session_id", "shop", "deadline_at", "submitted_at", "order_count", "view", "payments")
+
+    def __init__(self, session_id, shop, deadline_at, submitted_at, order_count, quantity, total, summary, details, payments):
+        import pandas as pd  # 只有已截止時才用到，不在 import 時載入 (見 db.py)
+        frame = lambda kind, data: pd.DataFrame(json.loads(data), columns=list(SUBMISSION_COLUMNS[kind]))
+        self.session_id, self.shop, self.deadline_at, self.submitted_at = session_id, shop, deadline_at, submitted_at
+        self.order_count = order_count
+        self.view = {"qty": quantity, "price": total, "summary": frame("summary", summary),
+                     "details": frame("details", details)}
+        self.payments = frame("payments", payments)
+
+# (資料庫, cat) -> Submission：送出紀錄不會再變 (重新送出時送出時間會不同)，解析一次之後一直用
+_loaded = {}
+
+def submission(category):
+    """已截止時回傳這一場的 Submission，否則 None (呼叫端不可修改裡面的 DataFrame)"""
+    s = status(category)
+    if not s.frozen: return None
+    mgr, cat = db.get_manager(), db.CATEGORY_IDS[category]
+    sid = db.load_config()["session"][0]
+    hit = _loaded.get((mgr.db_file, cat))
+    if hit is None or (hit.session_id, hit.submitted_at) != (sid, s.submitted_at):
+        with mgr.reading() as conn: row = conn.execute(
+            "SELECT sub.session_id, s.name, sub.deadline_at, sub.submitted_at, sub.order_count, sub.quantity, sub.total, "
+            "sub.summary, sub.details, sub.payments FROM submissions sub LEFT JOIN shops s ON s.id = sub.shop_id "
+            "WHERE sub.session_id = ? AND sub.cat = ?", (sid, cat)).fetchone()
+        if row is None: return None  # 快取還沒更新 (剛關帳)
+        hit = _loaded[(mgr.db_file, cat)] = Submission(*row)
+    return hit
+
+
+# ==========================================
+# 送出 / 重新開放
+# ==========================================
+def _submit(conn, cat, cutoff, force):
+    # 彙總與新增送出紀錄在同一個 transaction：送出之後 trg_orders_cutoff 立刻生效，不會有訂單漏在中間。
+    # 截止時刻用資料庫裡目前的場次重算，設定快取過期 (其他 process 剛關帳) 也不會提早送出
+    sid, opened_at = conn.execute(
+        f"SELECT id, opened_at FROM order_sessions WHERE id = {db.CURRENT_SESSION_SQL}").fetchone()
+    deadline_at = deadline_for(cutoff, opened_at) if cutoff else None
+    if not force:
+        if deadline_at is None or deadline_at > time.time(): return False
+        if conn.execute("SELECT 1 FROM submissions WHERE session_id = ? AND cat = ?", (sid, cat)).fetchone():
+            return False  # 已經送出過 (或被重新開放)，可能是另一個 process 的排程先做了
+    count, qty, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(price), 0) "
+                                     "FROM orders WHERE +cat = ?", (cat,)).fetchone()
+    as_json = lambda query: json.dumps(conn.execute(query, (cat,)).fetchall(), ensure_ascii=False)
+    shop_id = conn.execute(f"SELECT {db.CURRENT_SHOP_SQL.format('?')}", (cat,)).fetchone()[0]
+    conn.execute(f'''INSERT OR REPLACE INTO submissions (session_id, cat, shop_id, deadline_at, submitted_at, reopened_at,
+        order_count, quantity, total, summary, details, payments) VALUES (?, ?, ?, ?, {db.NOW_SQL}, NULL, ?, ?, ?, ?, ?, ?)''',
+        (sid, cat, shop_id, deadline_at, count, qty, total, as_json(db.SUMMARY_SQL),
+         as_json(db.DETAIL_SQL + " ORDER BY o.name, o.id"), as_json(PAYMENTS_SQL)))
+    return True
+
+def submit(category, force=True):
+    """截止並送出這家店這一場的訂單；force=False 時只在截止時間已到、這一場還沒送出過時才送出。
+    回傳是否有新的送出紀錄"""
+    cat = db.CATEGORY_IDS[category]
+    cutoff = db.get_cutoff(db.SHOP_KEYS[cat])
+    try: return db.run_write(lambda conn: _submit(conn, cat, cutoff, force))
+    finally: db.invalidate_config()
+
+def reopen(category):
+    """重新開放這家店 (送出紀錄留著，這一場不會再自動截止)；回傳是否有改到"""
+    cat = db.CATEGORY_IDS[category]
+    try:
+        return db.run_write(lambda conn: conn.execute(
+            f"UPDATE submissions SET reopened_at = {db.NOW_SQL} WHERE session_id = {db.CURRENT_SESSION_SQL} "
+            "AND cat = ? AND reopened_at IS NULL", (cat,)).rowcount) > 0
+    finally: db.invalidate_config()
+
+
+# ==========================================
+# 排程 (背景執行緒)
+# ==========================================
+_wake = threading.Event()
+_stop = threading.Event()
+
+def run_due(now=None):
+    """目前群組裡到了截止時間、這一場還沒送出過的店家現在送出。
+    回傳 (這次送出的類別, 下一個還沒到的截止時間 epoch 或 None)"""
+    now = now or time.time()
+    submitted, upcoming = [], []
+    for category in db.CATEGORIES:
+        s = status(category)
+        if s.deadline_at is None or s.submitted_at is not None: continue
+        if s.deadline_at > now: upcoming.append(s.deadline_at)
+        elif submit(category, force=False): submitted.append(category)
+    return submitted, min(upcoming, default=None)
+
+def _refresh_config():
+    # 其他 process 改了截止時間、關帳或送出時才讓設定快取失效 (失效會讓這個群組所有 session 重讀設定)
+    cfg = db.load_config()
+    if db.cutoff_state() != (cfg["cutoffs"], cfg["session"], cfg["submissions"]): db.invalidate_config()
+
+def _loop():
+    while not _stop.is_set():
+        wait = CHECK_EVERY
+        for group in db.list_groups():
+            try:
+                db.use_group(group)
+                db.ensure_schema()
+                _refresh_config()
+                _, upcoming = run_due()
+            except (sqlite3.Error, TimeoutError):
+                wait = 1  # 資料庫忙碌：等一下再試
+                continue
+            except Exception:  # 其他錯誤也不能讓排程執行緒結束，不然要重開 process 才會再自動送出
+                log.exception("deadline scheduler failed for group %s", group)
+                continue
+            if upcoming is not None: wait = min(wait, max(upcoming - time.time(), 0))
+        _wake.wait(wait)
+        _wake.clear()
+
+_thread = None
+
+def start():
+    """啟動排程執行緒 (每個 process 一次，order.py 用 st.cache_resource 包起來)"""
+    global _thread
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="deadline-scheduler", daemon=True)
+    _thread.start()
+    return _thread
+
+def stop(timeout=None):
+    """停止排程執行緒 (正在送出的那一輪會先做完)"""
+    _stop.set()
+    _wake.set()
+    if _thread is not None: _thread.join(timeout)
+
+def wake():
+    """截止時間設定改了：讓排程馬上重新檢查"""
+    _wake.set()
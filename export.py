@@ -0,0 +1,225 @@
+"""匯出：店家彙總表 / 每人收款明細，輸出 CSV、Parquet 或列印用純文字
+
+    for chunk in export.stream("summary", "txt", category="主餐"):          # bytes，一塊一塊產生
+        ...
+    export.stream("ledger", "parquet", archive=True, since="2024-01-01", until="2024-06-30")
+
+直接從 SQLite cursor 每次 fetchmany(CHUNK_ROWS) 筆、轉好格式就往外送，不先組成 DataFrame，
+匯出好幾個月的歷史場次時記憶體也不會跟著筆數長大 (排序交給 SQLite，必要時用暫存檔)。
+每次匯出開一條自己的唯讀連線，匯出到一半也不會卡住畫面用的讀取連線。
+
+- summary：(類別, 品項, 客製) 的總份數與金額，就是看板上的「彙總表 (店家用)」
+- ledger：每筆訂單依姓名排序，純文字版會附上每人小計 (已付 / 未付)
+"""
+import csv
+import io
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+
+import db
+
+CHUNK_ROWS = 2000  # 每次從 cursor 取幾筆
+# 匯出專用連線：大量排序時用暫存檔而不是記憶體 (一般連線是 temp_store = MEMORY)
+EXPORT_PRAGMAS = ("PRAGMA temp_store = FILE", "PRAGMA query_only = 1")
+
+REPORTS = ("summary", "ledger")
+# 格式 -> (MIME, 副檔名, 按鈕文字)
+FORMATS = {
+    "txt": ("text/plain; charset=utf-8", "txt", "🖨️ 列印版"),
+    "csv": ("text/csv; charset=utf-8", "csv", "📄 CSV"),
+    "parquet": ("application/vnd.apache.parquet", "parquet", "📦 Parquet"),
+}
+COLUMNS = {
+    "summary": ("category", "item_name", "custom", "quantity", "price"),
+    "ledger": ("name", "category", "item_name", "custom", "quantity", "price", "is_paid", "order_time", "session_id"),
+}
+
+SUMMARY_SQL = """SELECT g.cat, g.item_name, c.label, g.quantity, g.price FROM (
+    SELECT cat, item_name, custom_id, SUM(quantity) AS quantity, SUM(price) AS price FROM {table} o
+    WHERE {where} GROUP BY cat, item_name, custom_id
+) g JOIN customizations c ON c.id = g.custom_id ORDER BY g.cat, g.item_name, c.label"""
+LEDGER_SQL = f"""SELECT o.name, o.cat, o.item_name, c.label, o.quantity, o.price, o.is_paid, o.ordered_at,
+    COALESCE(o.session_id, {db.CURRENT_SESSION_SQL})
+    FROM {{table}} o JOIN customizations c ON c.id = o.custom_id WHERE {{where}} ORDER BY o.name, o.ordered_at, o.id"""
+
+
+def _where(category, since, until):
+    # since / until 為 'YYYY-MM-DD' 或 date，含頭含尾；格式錯誤時丟 ValueError
+    clauses, params = [], []
+    if category is not None:
+        clauses.append("o.cat = ?"); params.append(db.CATEGORY_IDS[category])
+    if since:
+        clauses.append("o.ordered_at >= ?"); params.append(_day_start(since))
+    if until:
+        clauses.append("o.ordered_at < ?"); params.append(_day_start(until, days=1))
+    return " AND ".join(clauses) or "1", params
+
+def _day_start(day, days=0):
+    d = date.fromisoformat(str(day)) + timedelta(days=days)
+    return int(datetime(d.year, d.month, d.day).timestamp())
+
+def _local_time(epoch):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(epoch))
+
+def _width(text):
+    # 中文字在等寬字型裡佔兩格
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+
+def _pad(text, width):
+    return text + " " * max(width - _width(text), 0)
+
+
+def file_name(report, fmt, category=None, archive=False, since=None, until=None):
+    scope = f"{since or ''}~{until or ''}" if archive else datetime.now().strftime("%Y%m%d")
+    return f"{report}_{category or 'all'}_{scope}.{FORMATS[fmt][1]}"
+
+def _prepare(report, fmt, category=None, archive=False, since=None, until=None):
+    # 參數在這裡就檢查完 (錯誤丟 ValueError / KeyError)，資料庫檔案 (群組) 與店家名稱也在這裡決定，
+    # 之後在哪條執行緒上讀取都一樣
+    if report not in REPORTS: raise ValueError(f"未知的報表: {report}")
+    if fmt not in FORMATS: raise ValueError(f"未知的格式: {fmt}")
+    where, params = _where(category, since, until)
+    query = (SUMMARY_SQL if report == "summary" else LEDGER_SQL).format(
+        table="orders_archive" if archive else "orders", where=where)
+    shops = None if archive else [db.get_shop_name(k) for k in db.SHOP_KEYS]  # 歷史訂單沒有記店家
+    scope = f"歷史訂單 {since or ''} ~ {until or ''}" if archive else "本場訂單"
+    return db.get_manager().db_file, report, fmt, query, params, shops, scope
+
+def stream(report, fmt, **kwargs):
+    """匯出內容的 bytes iterator (參數同 file_name)"""
+    return _chunks(*_prepare(report, fmt, **kwargs))
+
+def deferred(report, fmt, **kwargs):
+    """給 st.download_button(data=...)：按下按鈕時 (在另一條執行緒) 才查詢並組出檔案。
+    Streamlit 要拿到整個檔案才能送出，所以這裡會把 chunk 接起來；HTTP 介面則是邊讀邊送。"""
+    args = _prepare(report, fmt, **kwargs)
+    return lambda: b"".join(_chunks(*args))
+
+def _chunks(db_file, report, fmt, query, params, shops, scope):
+    conn = db.open_connection(db_file, db.CONN_PRAGMAS + EXPORT_PRAGMAS)
+    try:
+        cur = conn.execute(query, params)
+        batches = iter(lambda: cur.fetchmany(CHUNK_ROWS), [])
+        title = f"{scope} · 匯出於 {datetime.now():%Y-%m-%d %H:%M}"
+        if fmt == "csv": yield from _csv(report, batches)
+        elif fmt == "parquet": yield from _parquet(report, batches)
+        elif report == "summary": yield from _summary_text(batches, shops, title)
+        else: yield from _ledger_text(batches, title)
+    finally:
+        conn.close()
+
+def _plain_rows(report, batch):
+    # 類別轉回文字、時間轉成當地時間字串 (CSV / 列印用)
+    cats = db.CATEGORIES
+    if report == "summary":
+        return [(cats[cat], *rest) for cat, *rest in batch]
+    return [(name, cats[cat], item, custom, qty, price, paid, _local_time(at), sid)
+            for name, cat, item, custom, qty, price, paid, at, sid in batch]
+
+
+# ==========================================
+# CSV
+# ==========================================
+def _csv(report, batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")  # BOM：Excel 才會用 UTF-8 開
+    writer.writerow(COLUMNS[report])
+    for batch in batches:
+        writer.writerows(_plain_rows(report, batch))
+        yield buf.getvalue().encode()
+        buf.seek(0); buf.truncate()
+    if buf.tell(): yield buf.getvalue().encode()
+
+
+# ==========================================
+# Parquet (pyarrow 是 Streamlit 的相依套件；用到時才載入，不拖慢冷啟動)
+# ==========================================
+class _Sink(io.RawIOBase):
+    """ParquetWriter 的輸出端：收到的 bytes 先暫存，每寫完一個 row group 就被取走送出"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.pos = 0
+
+    def writable(self): return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self): return self.pos
+
+    def drain(self):
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+def _arrow_schema(pa, report):
+    text = pa.string()
+    if report == "summary":
+        return pa.schema([("category", pa.dictionary(pa.int8(), text)), ("item_name", text), ("custom", text),
+                          ("quantity", pa.int64()), ("price", pa.int64())])
+    return pa.schema([("name", text), ("category", pa.dictionary(pa.int8(), text)), ("item_name", text),
+                      ("custom", text), ("quantity", pa.int32()), ("price", pa.int64()), ("is_paid", pa.bool_()),
+                      ("order_time", pa.timestamp("s")), ("session_id", pa.int64())])
+
+def _parquet(report, batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(pa, report)
+    categories = pa.array(db.CATEGORIES)
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in batches:
+            cols = list(zip(*batch))
+            ci = schema.get_field_index("category")
+            cols[ci] = pa.DictionaryArray.from_arrays(pa.array(cols[ci], pa.int8()), categories)
+            if report == "ledger":
+                cols[6] = [bool(v) for v in cols[6]]
+                cols[7] = [datetime.fromtimestamp(t) for t in cols[7]]  # 當地時間
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [c if isinstance(c, pa.Array) else pa.array(c, f.type) for c, f in zip(cols, schema)], schema=schema))
+            yield sink.drain()
+    yield sink.drain()  # footer
+
+
+# ==========================================
+# 列印用純文字 (等寬字型排版，可以直接貼給店家或印出來)
+# ==========================================
+def _summary_text(batches, shops, title):
+    yield f"📦 彙總表 (店家用)\n{title}\n".encode()
+    cat, qty, price = None, 0, 0
+    for batch in batches:
+        lines = []
+        for c, item, custom, q, p in batch:
+            if c != cat:
+                if cat is not None: lines.append(f"{'-' * 60}\n  小計 {qty} 份  ${price}\n")
+                cat, qty, price = c, 0, 0
+                shop = f" · {shops[c]}" if shops else ""
+                lines.append(f"\n==== {db.CATEGORIES[c]}{shop} ====\n")
+            qty += q; price += p
+            lines.append(f"  {_pad(item, 20)} {_pad(custom or '-', 30)} x{q:>3} {'$' + str(p):>7}\n")
+        yield "".join(lines).encode()
+    yield (f"{'-' * 60}\n  小計 {qty} 份  ${price}\n" if cat is not None else "\n(無訂單)\n").encode()
+
+def _ledger_text(batches, title):
+    yield f"💰 收款明細\n{title}\n".encode()
+    name, paid, unpaid = None, 0, 0
+    subtotal = lambda: f"  小計 ${paid + unpaid} (已付 ${paid} / 未付 ${unpaid})\n"
+    for batch in batches:
+        lines = []
+        for row in _plain_rows("ledger", batch):
+            n, cat, item, custom, q, p, is_paid, at = row[:8]
+            if n != name:
+                if name is not None: lines.append(subtotal())
+                name, paid, unpaid = n, 0, 0
+                lines.append(f"\n==== {n} ====\n")
+            if is_paid: paid += p
+            else: unpaid += p
+            item_text = f"{item} ({custom})" if custom else item
+            lines.append(f"  {at}  {cat}  {_pad(item_text, 36)} x{q:>2} {'$' + str(p):>6}  {'已付' if is_paid else '未付'}\n")
+        yield "".join(lines).encode()
+    yield (subtotal() if name is not None else "\n(無訂單)\n").encode()
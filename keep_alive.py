@@ -1,31 +1,58 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+"""喚醒 Streamlit app：只用 HTTP 打健康檢查端點，不需要瀏覽器 / Selenium
+
+用法: python keep_alive.py [--url https://...] [--timeout 120]
+
+輪詢 <url>/_stcore/health，回應 "ok" (伺服器已經起來、可以接連線) 就印出耗時並結束；
+超過 --timeout 秒還沒好就以 exit code 1 結束 (GitHub Actions 上會顯示失敗)。
+Streamlit Community Cloud 的 app 實際掛在 /~/+/ 底下，兩個位置都會試。
+"""
+import argparse
+import os
 import time
+import urllib.error
+import urllib.request
+
+# 可以用環境變數 APP_URL 覆寫 (GitHub Actions 的 repository variable)
+DEFAULT_URL = "https://orderpy-3huwovakwtk5iepop2kuxv.streamlit.app"
+HEALTH_PATHS = ("/_stcore/health", "/~/+/_stcore/health")
+REQUEST_TIMEOUT = 15  # 秒，單一個 request 的上限
+
 
-def wake_up():
-    # 設定 Chrome 瀏覽器選項
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # 無頭模式（不顯示視窗）
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    
-    # 啟動瀏覽器
-    driver = webdriver.Chrome(options=chrome_options)
-    
-    # 【重要】請將下方網址替換成你的 Streamlit App 實際網址
-    app_url = "https://orderpy-3huwovakwtk5iepop2kuxv.streamlit.app"
-    
+def check(url):
+    """回傳 (是否 ready, 說明)"""
     try:
-        print(f"開始造訪：{app_url}")
-        driver.get(app_url)
-        
-        # 等待 20 秒，確保 WebSocket 連線成功並完全載入
-        time.sleep(20) 
-        print("喚醒成功！頁面標題為：", driver.title)
-    except Exception as e:
-        print(f"發生錯誤：{e}")
-    finally:
-        driver.quit()
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as resp:
+            body = resp.read(64).decode(errors="replace").strip()
+            return resp.status == 200 and body == "ok", f"{resp.status} {body[:20]!r}"
+    except urllib.error.HTTPError as e:
+        return False, f"{e.code}"
+    except (urllib.error.URLError, OSError) as e:
+        return False, type(e).__name__
+
+
+def wake_up(app_url, timeout=120):
+    app_url = app_url.rstrip("/")
+    start = time.monotonic()
+    delay = 1.0
+    while True:
+        for path in HEALTH_PATHS:
+            ok, info = check(app_url + path)
+            elapsed = time.monotonic() - start
+            print(f"[{elapsed:5.1f}s] {path} -> {info}")
+            if ok:
+                print(f"喚醒成功！{elapsed:.1f} 秒後 ready")
+                return True
+        if time.monotonic() - start + delay > timeout:
+            print(f"{timeout} 秒內沒有回應 ok")
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 10)  # 伺服器重新啟動要一點時間，逐步拉長間隔
+
 
 if __name__ == "__main__":
-    wake_up()
+    ap = argparse.ArgumentParser(description="喚醒 Streamlit app (HTTP 健康檢查)")
+    ap.add_argument("--url", default=os.environ.get("APP_URL") or DEFAULT_URL)
+    ap.add_argument("--timeout", type=float, default=120, help="最多等幾秒")
+    args = ap.parse_args()
+    print(f"開始造訪：{args.url}")
+    raise SystemExit(0 if wake_up(args.url, args.timeout) else 1)
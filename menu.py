@@ -0,0 +1,102 @@
+"""菜單記憶：從歷史訂單自動累積的 (店家, 品項, 單價, 點過幾次)，給點餐表單做建議與帶入單價
+
+menu_items 由 orders 的 INSERT trigger 維護 (db._m006_menu_items)，API / orders_legacy 寫入的訂單也算在內。
+每個資料庫 (群組) 在記憶體裡有一份索引，依 (類別, 店家) 分開，各自是一個排序好的名稱陣列，
+前綴查詢用 bisect 找到起點後往後掃，幾千個品項也只要幾 µs：
+
+    suggest("主餐", "八方雲集", "鍋")   -> [("鍋貼", 6, 12), ...]   (品項, 單價, 點過幾次)
+    lookup("主餐", "八方雲集", "鍋貼")  -> ("鍋貼", 6, 12) 或 None
+
+訂單 revision 改變時只讀 last_order_id 比上次大的列，不重建整個索引。
+"""
+import bisect
+import heapq
+import threading
+import unicodedata
+
+import streamlit as st
+
+import db
+
+SUGGEST_LIMIT = 6
+
+
+def _norm(name):
+    # 全形/半形、大小寫視為同一個品項
+    return unicodedata.normalize("NFKC", str(name)).strip().casefold()
+
+
+class ShopMenu:
+    """單一 (類別, 店家) 的品項；keys 是排序好的正規化名稱，items 是 key -> (品項, 單價, 次數)"""
+    __slots__ = ("keys", "items", "_top")
+
+    def __init__(self):
+        self.keys = []
+        self.items = {}
+        self._top = None  # 空白前綴 (最常點) 的結果，有異動時清掉
+
+    def upsert(self, name, price, uses):
+        key = _norm(name)
+        if key not in self.items: bisect.insort(self.keys, key)
+        self.items[key] = (name, price, uses)
+        self._top = None
+
+    def suggest(self, prefix, limit):
+        prefix = _norm(prefix)
+        if not prefix:
+            if self._top is None or len(self._top) < limit:
+                self._top = heapq.nlargest(limit, self.items.values(), key=lambda it: it[2])
+            return self._top[:limit]
+        i = bisect.bisect_left(self.keys, prefix)
+        hits = []
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            hits.append(self.items[self.keys[i]])
+            i += 1
+        return heapq.nlargest(limit, hits, key=lambda it: it[2])
+
+
+class MenuIndex:
+    """一個資料庫的所有 ShopMenu，key 為 (cat, shop)"""
+
+    def __init__(self):
+        self.menus = {}
+        self.last_order_id = 0
+        self.rev = None
+        self._lock = threading.Lock()
+
+    def refresh(self, conn, rev):
+        if rev == self.rev: return
+        with self._lock:
+            if rev == self.rev: return
+            rows = conn.execute(
+                "SELECT cat, shop, item_name, unit_price, uses, last_order_id FROM menu_items "
+                "WHERE last_order_id > ? ORDER BY last_order_id", (self.last_order_id,)).fetchall()
+            for cat, shop, name, price, uses, order_id in rows:
+                menu = self.menus.get((cat, shop))
+                if menu is None: menu = self.menus[(cat, shop)] = ShopMenu()
+                menu.upsert(name, price, uses)
+                self.last_order_id = order_id
+            self.rev = rev
+
+
+@st.cache_resource
+def _index_for(db_file):
+    return MenuIndex()
+
+def _index():
+    mgr = db.get_manager()
+    index = _index_for(mgr.db_file)
+    rev = mgr.notifier.current(mgr.read_revision)
+    if rev != index.rev:
+        with mgr.reading() as conn: index.refresh(conn, rev)
+    return index
+
+def suggest(category: str, shop: str, prefix: str = "", limit: int = SUGGEST_LIMIT) -> list:
+    """這家店名稱以 prefix 開頭的品項，點過越多次的越前面；prefix 空白時回傳最常點的"""
+    menu = _index().menus.get((db.CATEGORY_IDS[category], shop))
+    return menu.suggest(prefix, limit) if menu else []
+
+def lookup(category: str, shop: str, name: str):
+    """完全符合的品項 (品項, 單價, 次數)，沒有時回傳 None"""
+    menu = _index().menus.get((db.CATEGORY_IDS[category], shop))
+    return menu.items.get(_norm(name)) if menu and name else None
@@ -0,0 +1,203 @@
+"""熱路徑量測：每次 rerun 各區段耗時、SQL 數、讀取筆數、寫入與 lock 重試
+
+用法 (order.py)：
+    metrics.begin("rerun")              腳本開頭
+    with metrics.section("config"): ... 量一段程式
+    @metrics.timed("stats")             fragment 單獨 rerun 時算一次獨立的紀錄，整頁 rerun 時算一個區段
+    metrics.end()                       腳本結尾 / st.stop() 之前
+
+process 的第一次整頁 rerun 另外記成冷啟動 (cold_start_ms)：order.py 在載入其他模組之前就 begin()，
+所以包含 import、建庫檢查與第一次讀設定。
+
+量測資料放在目前執行緒上 (Streamlit 每個 session 的腳本都在自己的執行緒跑)，
+db.py 的 reader 連線用 sqlite trace callback 數 SQL，所以不需要改每一個查詢。
+最近 RING_SIZE 次紀錄放在 process 共用的 ring buffer，管理員面板從這裡讀。
+
+設定環境變數 METRICS_EXPORT 可以另外輸出到檔案：
+    *.jsonl  每次 rerun 追加一行 JSON
+    其他     Prometheus text format (整個檔案覆寫，最多每秒一次)
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+RING_SIZE = 500
+EXPORT_PATH = os.environ.get("METRICS_EXPORT")
+PROM_WRITE_EVERY = 1.0  # 秒
+
+_local = threading.local()
+_ring = deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+_totals = {"runs": 0, "queries": 0, "rows": 0, "writes": 0, "lock_retries": 0, "seconds": 0.0}
+_prom_written = 0.0
+_cold_start = None  # 這個 process 第一次整頁 rerun 的耗時 (秒)
+
+
+class RunMetrics:
+    """一次 rerun (或 fragment rerun) 的量測結果"""
+    __slots__ = ("kind", "started_at", "start", "last", "sections", "queries", "rows", "writes", "lock_retries")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started_at = time.time()
+        self.start = self.last = time.perf_counter()
+        self.sections = {}
+        self.queries = self.rows = self.writes = self.lock_retries = 0
+
+    def as_dict(self):
+        return {
+            "kind": self.kind, "at": round(self.started_at, 3), "total_ms": round((self.last - self.start) * 1000, 2),
+            "sections_ms": {k: round(v * 1000, 2) for k, v in self.sections.items()},
+            "queries": self.queries, "rows": self.rows, "writes": self.writes, "lock_retries": self.lock_retries,
+        }
+
+
+def current():
+    return getattr(_local, "run", None)
+
+def begin(kind="rerun"):
+    """開始一次新的紀錄。上一次若被 st.rerun() 中斷沒結算，以它最後一個區段結束的時間結算"""
+    prev = current()
+    if prev is not None: _record(prev)
+    _local.run = RunMetrics(kind)
+
+def end():
+    run = current()
+    if run is None: return
+    _local.run = None
+    run.last = time.perf_counter()
+    _record(run)
+
+@contextmanager
+def section(name):
+    run = current()
+    if run is None:
+        yield
+        return
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        if current() is run:  # 區段內已經 end() (例如 st.stop() 之前) 就不再記
+            now = time.perf_counter()
+            run.sections[name] = run.sections.get(name, 0.0) + now - t
+            run.last = now
+
+def timed(name):
+    """fragment 用：自己單獨 rerun 時記成一筆 fragment:name，整頁 rerun 時記成一個區段"""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current() is not None:
+                with section(name): return fn(*args, **kwargs)
+            begin(f"fragment:{name}")
+            try:
+                with section(name): return fn(*args, **kwargs)
+            finally:
+                end()
+        return wrapper
+    return deco
+
+# --- 由 db.py 呼叫 ---
+def on_statement(_sql):
+    """sqlite trace callback：每執行一個 SQL 敘述呼叫一次"""
+    run = current()
+    if run is not None: run.queries += 1
+
+def add_rows(n):
+    run = current()
+    if run is not None: run.rows += n
+
+def add_write(lock_retries=0):
+    run = current()
+    if run is not None:
+        run.writes += 1
+        run.lock_retries += lock_retries
+
+# ==========================================
+# 彙總 / 輸出
+# ==========================================
+def _record(run):
+    global _prom_written, _cold_start
+    with _lock:
+        if _cold_start is None and run.kind == "rerun": _cold_start = run.last - run.start
+        _ring.append(run)
+        _totals["runs"] += 1
+        _totals["queries"] += run.queries
+        _totals["rows"] += run.rows
+        _totals["writes"] += run.writes
+        _totals["lock_retries"] += run.lock_retries
+        _totals["seconds"] += run.last - run.start
+        write_prom = EXPORT_PATH and not EXPORT_PATH.endswith(".jsonl") and run.last - _prom_written > PROM_WRITE_EVERY
+        if write_prom: _prom_written = run.last
+    if not EXPORT_PATH: return
+    try:
+        if EXPORT_PATH.endswith(".jsonl"):
+            with open(EXPORT_PATH, "a", encoding="utf-8") as f: f.write(json.dumps(run.as_dict()) + "\n")
+        elif write_prom:
+            tmp = EXPORT_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f: f.write(prometheus_text())
+            os.replace(tmp, EXPORT_PATH)
+    except OSError:
+        pass  # 量測輸出失敗不能影響畫面
+
+def recent(n=50):
+    """最近 n 筆紀錄 (新的在前)"""
+    with _lock: runs = list(_ring)[-n:]
+    return [r.as_dict() for r in reversed(runs)]
+
+def _pct(values, p):
+    if len(values) == 1: return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+def _group():
+    with _lock: runs = list(_ring)
+    kinds, sections = {}, {}
+    for r in runs:
+        kinds.setdefault(r.kind, []).append(r)
+        for name, sec in r.sections.items(): sections.setdefault(name, []).append(sec * 1000)
+    return kinds, sections
+
+def summary():
+    """ring buffer 內每種紀錄與每個區段的 p50/p95 (ms)，以及每次平均的 SQL 數與讀取筆數"""
+    kinds, sections = _group()
+    rows = []
+    for kind, rs in sorted(kinds.items()):
+        durations = [(r.last - r.start) * 1000 for r in rs]
+        rows.append({"name": kind, "count": len(rs), "p50_ms": round(_pct(durations, 50), 2),
+                     "p95_ms": round(_pct(durations, 95), 2),
+                     "queries": round(sum(r.queries for r in rs) / len(rs), 1),
+                     "rows": round(sum(r.rows for r in rs) / len(rs), 1)})
+    for name, values in sorted(sections.items()):
+        rows.append({"name": f"  └ {name}", "count": len(values), "p50_ms": round(_pct(values, 50), 2),
+                     "p95_ms": round(_pct(values, 95), 2), "queries": None, "rows": None})
+    return rows
+
+def totals():
+    with _lock:
+        t = dict(_totals)
+        t["cold_start_ms"] = round(_cold_start * 1000, 1) if _cold_start is not None else None
+    return t
+
+def prometheus_text():
+    t = totals()
+    lines = [
+        "# TYPE office_eats_runs_total counter", f"office_eats_runs_total {t['runs']}",
+        "# TYPE office_eats_run_seconds_total counter", f"office_eats_run_seconds_total {t['seconds']:.6f}",
+        "# TYPE office_eats_queries_total counter", f"office_eats_queries_total {t['queries']}",
+        "# TYPE office_eats_rows_total counter", f"office_eats_rows_total {t['rows']}",
+        "# TYPE office_eats_writes_total counter", f"office_eats_writes_total {t['writes']}",
+        "# TYPE office_eats_lock_retries_total counter", f"office_eats_lock_retries_total {t['lock_retries']}",
+    ]
+    if t["cold_start_ms"] is not None:
+        lines += ["# TYPE office_eats_cold_start_seconds gauge", f"office_eats_cold_start_seconds {t['cold_start_ms'] / 1000:.4f}"]
+    lines.append("# TYPE office_eats_section_ms summary")
+    for name, values in sorted(_group()[1].items()):
+        for q in (50, 95):
+            lines.append(f'office_eats_section_ms{{section="{name}",quantile="{q / 100}"}} {_pct(values, q):.3f}')
+    return "\n".join(lines) + "\n"
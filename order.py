@@ -1,9 +1,23 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
-import time
 import os
-from datetime import datetime
+import sqlite3
+import threading
+from datetime import datetime, time as clock
+
+import metrics
+metrics.begin("rerun")  # 在載入其他模組之前開始計時：process 的第一次 rerun 就是冷啟動時間
+
+import analytics
+import deadlines
+import export
+import menu
+import orders
+import render
+from db import (ui_call, track_changes, get_config_list, update_config_list,
+                get_shop_name, set_shop_name, get_cutoff, set_cutoff, ensure_schema, load_config,
+                OrderSnapshot, current_revision, shared_view, order_count, stats_view, payment_view, payment_progress, payment_ledger,
+                close_session, session_history, archived_orders, Customization, DRINK_SIZES, CATEGORIES, SHOP_KEYS,
+                DEFAULT_GROUP, use_group, group_exists, list_groups, create_group)
 
 # ==========================================
 # 0. 系統設定區
@@ -14,8 +28,6 @@ try:
 except Exception:
     ADMIN_PASSWORD = "3345678"  # Fallback 預設密碼
 
-DB_FILE = "lunch.db"
-
 # ==========================================
 # 1. 頁面設定與 CSS (視覺核心)
 # ==========================================
@@ -94,6 +106,15 @@ custom_css = """
         border-right: 1px solid rgba(255,255,255,0.1);
     }
 
+    /* 批次渲染的卡片 (外觀比照 st.container(border=True)) */
+    .card-box {
+        border: 1px solid rgba(128,128,128,0.3); border-radius: 0.5rem;
+        padding: 12px 16px; margin-bottom: 10px;
+    }
+    .summary-card { display: flex; align-items: stretch; gap: 12px; }
+    .summary-card .qty-badge { flex: 0 0 20%; }
+    .pay-row { display: flex; justify-content: space-between; align-items: center; }
+
     /* 分隔線與自動刷新文字 */
     hr { margin: 1.5em 0; }
     .refresh-text { color: gray; font-size: 0.8rem; margin-bottom: 5px; text-align: right;}
@@ -136,118 +157,178 @@ def get_defaults_from_secrets():
         
     return colleagues, options
 
-# 獲取實際要使用的預設值
-DEFAULT_COLLEAGUES, DEFAULT_OPTIONS = get_defaults_from_secrets()
+# 群組：網址的 ?group= 優先，其次是這個 session 上次的群組
+group = st.query_params.get("group") or st.session_state.get("group") or DEFAULT_GROUP
+if not group_exists(group):
+    st.toast(f"⚠️ 找不到群組「{group}」，改用預設群組")
+    st.query_params.pop("group", None)
+    group = DEFAULT_GROUP
+if st.session_state.get("group") not in (None, group):
+    # 換群組：訂單快照、登入的人都是上一個群組的 (彙總快取以資料庫檔案區分，不用清)
+    for k in ("orders_snapshot", "orders_seen_rev", "orders_changed_at", "user_name"): st.session_state.pop(k, None)
+use_group(group)  # 記在 session_state["group"]：之後的 rerun、fragment、callback 的資料庫操作都走這個群組
 
 def init_db():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    c = conn.cursor()
-    try:
-        c.execute('''CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, category TEXT, item_name TEXT,
-            price INTEGER, custom TEXT, quantity INTEGER, order_time TEXT, is_paid BOOLEAN)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS config_colleagues (name TEXT PRIMARY KEY)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS config_options (
-            category TEXT, option_value TEXT, PRIMARY KEY (category, option_value))''')
-        c.execute('''CREATE TABLE IF NOT EXISTS config_shop (
-            category TEXT PRIMARY KEY, shop_name TEXT)''')
-
-        # 這裡會使用從 Secrets 讀取到的 DEFAULT_COLLEAGUES
-        for n in DEFAULT_COLLEAGUES:
-            c.execute("INSERT OR IGNORE INTO config_colleagues (name) VALUES (?)", (n,))
-        
-        # 這裡會使用從 Secrets 讀取到的 DEFAULT_OPTIONS
-        for cat, options in DEFAULT_OPTIONS.items():
-            for opt in options:
-                c.execute("INSERT OR IGNORE INTO config_options (category, option_value) VALUES (?, ?)", (cat, opt))
-        
-        c.execute("INSERT OR IGNORE INTO config_shop (category, shop_name) VALUES (?, ?)", ("main", "吃什麼？"))
-        c.execute("INSERT OR IGNORE INTO config_shop (category, shop_name) VALUES (?, ?)", ("drink", "喝什麼？"))
-        conn.commit()
-    finally:
-        conn.close()
-
-def execute_db(query, params=()):
-    max_retries = 5
-    for attempt in range(max_retries):
+    # Schema 版本記在 PRAGMA user_version，每個 process 只檢查一次；預設人員/選項只在第一次建庫時寫入
+    ensure_schema(seed=get_defaults_from_secrets)
+
+with metrics.section("init_db"): init_db()
+
+WARM_UP_DELAY = 1.0  # 秒
+
+def _warm_up():
+    __import__("pandas")
+    for g in list_groups():
         try:
-            conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-            c = conn.cursor()
-            c.execute(query, params)
-            conn.commit()
-            conn.close()
-            return True
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e): time.sleep(0.1)
-            else: raise e
-    st.error("⚠️ 系統忙碌 (Database Locked)，請稍後再試")
-    return False
+            use_group(g)
+            ensure_schema()
+            load_config()
+        except (sqlite3.Error, TimeoutError): pass  # 只是預熱，第一次用到時還會再做
 
-def get_db(query, params=()):
-    try:
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
-    except Exception: return pd.DataFrame()
-
-def get_config_list(table, col, cat=None):
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    try:
-        if cat:
-            q = f"SELECT {col} FROM {table} WHERE category = ? ORDER BY rowid"
-            p = (cat,)
-        else:
-            q = f"SELECT {col} FROM {table} ORDER BY rowid"
-            p = ()
-        df = pd.read_sql_query(q, conn, params=p)
-        return df
-    finally:
-        conn.close()
-
-def update_config_list(table, col, new_df, cat=None):
-    execute_db(f"DELETE FROM {table}" + (f" WHERE category = '{cat}'" if cat else ""))
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    c = conn.cursor()
-    try:
-        if cat:
-            data = [(cat, row[col]) for _, row in new_df.iterrows() if row[col]]
-            c.executemany(f"INSERT INTO {table} (category, {col}) VALUES (?, ?)", data)
-        else:
-            data = [(row[col],) for _, row in new_df.iterrows() if row[col]]
-            c.executemany(f"INSERT INTO {table} ({col}) VALUES (?)", data)
-        conn.commit()
-    finally:
-        conn.close()
+@st.cache_resource
+def warm_up():
+    # 每個 process 一次，在第一個 session 的第一次 rerun 觸發 (/_stcore/health 不會執行腳本，所以這一次本身還是冷的)。
+    # 等第一個畫面送出後在背景 import pandas (登入頁用不到，db.py 延後載入)，並把每個群組的連線、schema 檢查與設定快取載好，
+    # 之後登入、開看板、其他群組的第一個 session 都不用再等
+    t = threading.Timer(WARM_UP_DELAY, _warm_up)
+    t.daemon = True
+    t.start()
+
+warm_up()
 
-def get_shop_name(cat):
-    df = get_db("SELECT shop_name FROM config_shop WHERE category = ?", (cat,))
-    if not df.empty: return df.iloc[0]['shop_name']
-    return "未設定"
+@st.cache_resource
+def start_order_api(port):
+    # 跟畫面同一個 process：API 寫入走同一條 writer 執行緒，看板會立即同步
+    return orders.serve(port=port, block=False)
 
-def set_shop_name(cat, name):
-    execute_db("UPDATE config_shop SET shop_name = ? WHERE category = ?", (name, cat))
+if os.environ.get("ORDER_API_PORT"): start_order_api(int(os.environ["ORDER_API_PORT"]))
 
-init_db()
+@st.cache_resource
+def start_deadline_scheduler():
+    # 每個 process 一條：店家到了截止時間就自動送出 (deadlines.py)，不需要外部 cron
+    return deadlines.start()
+
+start_deadline_scheduler()
 
 # 讀取設定
-df_colleagues = get_config_list("config_colleagues", "name")
-colleagues_list = df_colleagues["name"].tolist() if not df_colleagues.empty else ["請新增人員"]
-df_spicy = get_config_list("config_options", "option_value", "spicy")
-spicy_levels = ["無"] + df_spicy["option_value"].tolist()
-df_ice = get_config_list("config_options", "option_value", "ice")
-ice_levels = df_ice["option_value"].tolist()
-df_sugar = get_config_list("config_options", "option_value", "sugar")
-sugar_levels = df_sugar["option_value"].tolist()
-df_tags = get_config_list("config_options", "option_value", "tags")
-custom_tags_main = df_tags["option_value"].tolist() 
-df_drink_tags = get_config_list("config_options", "option_value", "drink_tags")
-custom_tags_drink = df_drink_tags["option_value"].tolist()
+with metrics.section("config"): cfg = load_config()  # 記憶體快取，設定沒變時不查資料庫
+colleagues_list = list(cfg["colleagues"]) or ["請新增人員"]
+opts = cfg["options"]
+spicy_levels = ["無"] + list(opts.get("spicy", ()))
+ice_levels = list(opts.get("ice", ()))
+sugar_levels = list(opts.get("sugar", ()))
+custom_tags_main = list(opts.get("tags", ()))
+custom_tags_drink = list(opts.get("drink_tags", ()))
+
+# 看板/收款的自動同步間隔；每次只比對記憶體中的 revision，有新訂單才會查資料庫
+LIVE_REFRESH_EVERY = 3
+
+def load_orders():
+    # 點餐頁用：每個 session 各自保留一份訂單快照，之後只套用上次讀取之後的異動
+    if 'orders_snapshot' not in st.session_state: st.session_state['orders_snapshot'] = OrderSnapshot()
+    with metrics.section("orders"): return st.session_state['orders_snapshot'].refresh()
+
+def notify(message, icon=None):
+    # callback 裡不能直接畫元件 (fragment 重跑時會被放到頁面最上面)，先記下來，由 fragment 開頭的 show_notifications() 顯示
+    st.session_state.setdefault('pending_toasts', []).append((message, icon))
+
+def show_notifications():
+    for message, icon in st.session_state.pop('pending_toasts', ()): st.toast(message, icon=icon)
+
+def write_orders(fn, *args):
+    # 寫入後把自己造成的異動直接套進這個 session 的快照 (OrderSnapshot.apply)，接著的 rerun 不必再查訂單
+    with track_changes() as deltas:
+        try: result = fn(*args)
+        except (sqlite3.OperationalError, TimeoutError):
+            notify("⚠️ 系統忙碌 (Database Locked)，請稍後再試"); return None
+        except ValueError as e:  # 例如店家剛截止
+            notify(f"🚫 {e}", icon="⚠️"); return None
+    snap = st.session_state.get('orders_snapshot')
+    if snap is not None:
+        for delta in deltas: snap.apply(delta)
+    return result
+
+# --- 按鈕的 on_click：callback 在 (fragment) 重跑之前執行，按一下就是一次小範圍的 rerun，不需要再 st.rerun() ---
+def settle_person(name, cat, rev, paid, shown):
+    # rev 是畫面顯示時的 revision：頁面過期時只結清畫面上看得到的訂單，連按兩次也不會重複收款
+    result = write_orders(orders.settle, name, cat, rev, paid)
+    if result is None: return
+    amount = abs(result["amount"])
+    if not result["order_ids"]: notify(f"⚠️ {name} 的訂單剛有異動，請確認後再按一次"); return
+    notify(f"💰 已收: {name} (${amount})" if paid else f"↩️ 已撤銷: {name} (${amount})")
+    if amount != shown: notify(f"⚠️ {name} 的訂單剛有異動，實際{'收款' if paid else '撤銷'} ${amount}", icon="⚠️")
+
+def settle_everyone(cat, rev):
+    settled = write_orders(orders.settle_all, cat, rev)
+    if settled: notify(f"💰 已收: {len(settled)} 人 (${sum(s['amount'] for s in settled)})")
+    elif settled is not None: notify("⚠️ 沒有可收的款項 (訂單剛有異動)")
+
+def delete_order(order_id, user_name):
+    if write_orders(orders.remove_order, order_id, user_name): notify("✅ 已刪除")
+
+def clear_custom(prefix):
+    st.session_state[f"{prefix}_custom_tags"] = []
+    st.session_state[f"{prefix}_custom_manual"] = ""
+
+def submit_order(category):
+    ss, prefix = st.session_state, "m" if category == "主餐" else "d"
+    name, unit, qty = ss.get(f"{prefix}_name"), ss.get(f"{prefix}_price") or 0, ss.get(f"{prefix}_qty") or 1
+    if unit == 0: notify("🚫 無法加入：請輸入金額！", icon="⚠️"); return
+    if not name: notify(f"⚠️ 請輸入{category}名稱"); return
+    tags, note = ss.get(f"{prefix}_custom_tags", []), ss.get(f"{prefix}_custom_manual", "")
+    if category == "主餐":
+        spicy = ss.get("m_spicy")
+        cust = Customization(spice=spicy if spicy != "無" else None, tags=tags, note=note)
+    else:
+        cust = Customization(size=ss.get("d_size"), sugar=ss.get("d_sugar"), ice=ss.get("d_ice"), tags=tags, note=note)
+    if write_orders(orders.add_order, ss['user_name'], category, name, unit * qty, cust, qty):
+        clear_custom("m"); clear_custom("d")
+        notify(f"✅ 已加入：{name} x{qty}")
+
+PAGE_SIZE = 20  # 人員清單超過這個數量就分頁
+
+def paginate(names, key):
+    # 回傳目前頁面要顯示的名字；只有一頁時不顯示分頁控制
+    pages = (len(names) + PAGE_SIZE - 1) // PAGE_SIZE
+    if pages <= 1: return list(names)
+    page = st.segmented_control("頁數", list(range(1, pages + 1)), default=1, key=key,
+                                format_func=lambda p: f"第 {p} 頁", label_visibility="collapsed") or 1
+    return list(names[(page - 1) * PAGE_SIZE: page * PAGE_SIZE])
+
+def render_sync_status(rev):
+    # 看板/收款頁不保留訂單：每個 session 只記上次看到的 revision 與時間
+    if st.session_state.get('orders_seen_rev') != rev:
+        st.session_state['orders_seen_rev'] = rev
+        st.session_state['orders_changed_at'] = datetime.now().strftime("%H:%M:%S")
+    changed_at = st.session_state['orders_changed_at']
+    st.markdown(f'<div class="refresh-text">🟢 自動同步中 | 最後異動 {changed_at}</div>', unsafe_allow_html=True)
+
+def hhmm(epoch):
+    return datetime.fromtimestamp(epoch).strftime("%H:%M")
+
+def cutoff_notice(cat):
+    # 點餐表單上的截止提示；回傳是否已截止 (狀態在設定快取裡，不查資料庫)
+    s = deadlines.status(cat)
+    if s.frozen: st.warning(f"🔒 已於 {hhmm(s.submitted_at)} 截止送出，無法再加點"); return True
+    if s.deadline_at: st.caption(f"⏰ {hhmm(s.deadline_at)} 截止")
+    return False
+
+def export_buttons(report, key, **kwargs):
+    # 按下時才在另一條執行緒查詢並組出檔案 (export.deferred)；平常 rerun 只是多畫幾個按鈕
+    for col, (fmt, (mime, _, label)) in zip(st.columns(len(export.FORMATS)), export.FORMATS.items()):
+        col.download_button(label, export.deferred(report, fmt, **kwargs), key=f"dl_{key}_{fmt}", mime=mime,
+                            file_name=export.file_name(report, fmt, **kwargs), on_click="ignore", width="stretch")
 
 # ==========================================
 # 3. 側邊欄
 # ==========================================
-with st.sidebar:
+with st.sidebar, metrics.section("sidebar"):
+    groups = list_groups()
+    if len(groups) > 1:
+        picked = st.selectbox("🏢 群組", groups, index=groups.index(group))
+        if picked != group:
+            st.query_params["group"] = picked
+            st.rerun()
     st.header("⚙️ 開團管理")
     st.subheader("1. 今日店家")
     db_main_shop = get_shop_name("main")
@@ -263,200 +344,297 @@ with st.sidebar:
         set_shop_name("drink", new_drink_shop)
         st.rerun()
 
+    st.subheader("2. 截止時間")
+    st.caption("每天到了截止時間自動送出彙總表，之後這家店不能再加點")
+    for shop_key, cat in zip(SHOP_KEYS, CATEGORIES):
+        saved = get_cutoff(shop_key)
+        c_time, c_act = st.columns([3, 2], vertical_alignment="bottom")
+        picked = c_time.time_input(f"{cat}截止", value=clock.fromisoformat(saved) if saved else None, step=300)
+        picked = picked.strftime("%H:%M") if picked else None
+        if picked != saved:
+            set_cutoff(shop_key, picked)
+            deadlines.wake()
+            st.rerun()
+        s = deadlines.status(cat)
+        if s.frozen:
+            st.caption(f"🔒 {hhmm(s.submitted_at)} 已送出")
+            if c_act.button("🔓 重新開放", key=f"reopen_{shop_key}", width="stretch"):
+                if ui_call(deadlines.reopen, cat): st.rerun()
+        else:
+            if s.deadline_at: st.caption(f"⏰ {datetime.fromtimestamp(s.deadline_at):%m/%d %H:%M} 截止")
+            if c_act.button("📤 立即送出", key=f"submit_{shop_key}", width="stretch"):
+                if ui_call(deadlines.submit, cat): st.rerun()
+
     st.divider()
-    st.subheader("2. 資料重置")
+    st.subheader("3. 關帳 (開新的一場)")
     if "confirm_reset" not in st.session_state: st.session_state.confirm_reset = False
     
-    if st.button("🗑️ 清空資料庫", type="secondary"): 
+    if st.button("🗑️ 關帳並清空訂單", type="secondary"): 
         st.session_state.confirm_reset = True
     
     if st.session_state.confirm_reset:
-        st.warning("⚠️ 確定清空？此動作無法復原。")
+        st.warning("⚠️ 確定關帳？目前的訂單會封存到歷史紀錄，畫面上將清空。")
         c1, c2 = st.columns(2)
         if c1.button("✅ 確定"):
-            execute_db("DELETE FROM orders")
-            execute_db("VACUUM")
+            closed = close_session()
             st.session_state.confirm_reset = False
-            st.toast("🗑️ 資料庫已重置完成！")
-            st.rerun()
+            if closed:
+                st.toast(f"🗑️ 已關帳！封存 {closed[1]} 筆訂單 (${closed[2]})")
+                st.rerun()
         if c2.button("❌ 取消"):
             st.session_state.confirm_reset = False
             st.rerun()
+
+    # 側邊欄的 expander / 分頁都用 on_change="rerun"：收合時裡面的查詢與 widget 完全不執行
+    history_panel = st.expander("📜 歷史場次", key="exp_history", on_change="rerun")
+    with history_panel:
+        if not history_panel.open: pass
+        elif (history := session_history()).empty: st.caption("尚無已關帳的場次")
+        else:
+            st.dataframe(history, hide_index=True, width="stretch",
+                column_config={"id": "場次", "opened_at": "開始", "closed_at": "關帳", "order_count": "筆數", "total": "總額"})
+            labels = {int(sid): f"#{sid} ({opened[:16]})" for sid, opened in zip(history["id"], history["opened_at"])}
+            picked = st.selectbox("查看場次訂單", list(labels), index=None, key="history_session", format_func=labels.get,
+                                  placeholder="選擇場次查看當時的訂單", label_visibility="collapsed")
+            if picked is not None:
+                st.dataframe(archived_orders(picked), hide_index=True, width="stretch",
+                    column_config={"id": None, "session_id": None, "name": "姓名", "category": "類別", "item_name": "品項",
+                                   "price": st.column_config.NumberColumn("金額", format="$%d"), "custom": "客製",
+                                   "quantity": "數量", "order_time": "時間", "is_paid": st.column_config.CheckboxColumn("已付")})
+            st.caption("匯出歷史訂單")
+            days = st.date_input("期間", value=(), key="export_days", label_visibility="collapsed")
+            report = st.segmented_control("報表", export.REPORTS, default="ledger", key="export_report",
+                                          format_func={"summary": "彙總表", "ledger": "收款明細"}.get) or "ledger"
+            since, until = (list(days) + [None, None])[:2]
+            export_buttons(report, "archive", archive=True, since=since, until=until or since)
     st.divider()
 
-    with st.expander("🔧 進階設定"):
-        pwd_input = st.text_input("輸入管理員密碼", type="password", key="admin_pwd")
-        # 修改：比對變數現在來自 Secrets
-        if pwd_input == ADMIN_PASSWORD:
-            st.success("🔓 已解鎖")
-            st.write("**👥 人員名單**")
-            edited_colleagues = st.data_editor(df_colleagues, num_rows="dynamic", 
-                column_config={"name": st.column_config.TextColumn("姓名", required=True)},
-                key="ed_col", width="stretch", hide_index=True)
-            if st.button("💾 儲存人員"):
-                update_config_list("config_colleagues", "name", edited_colleagues)
-                st.toast("✅ 已更新"); time.sleep(0.5); st.rerun()
-            st.divider()
-            st.write("**🛠️ 菜單選項**")
-            t1, t2, t3, t4, t5 = st.tabs(["辣度", "冰塊", "甜度", "🍱主餐客製", "🥤飲料客製"])
-            def render_opt(tab, cat, df, lbl):
-                with tab:
-                    ed = st.data_editor(df, num_rows="dynamic",
-                        column_config={"option_value": st.column_config.TextColumn(lbl, required=True)},
-                        key=f"ed_{cat}", width="stretch", hide_index=True)
-                    if st.button(f"儲存{lbl}", key=f"btn_{cat}"):
-                        update_config_list("config_options", "option_value", ed, cat)
-                        st.toast("✅ 已更新"); time.sleep(0.5); st.rerun()
-            render_opt(t1, "spicy", get_config_list("config_options", "option_value", "spicy"), "辣度")
-            render_opt(t2, "ice", get_config_list("config_options", "option_value", "ice"), "冰塊")
-            render_opt(t3, "sugar", get_config_list("config_options", "option_value", "sugar"), "甜度")
-            render_opt(t4, "tags", get_config_list("config_options", "option_value", "tags"), "主餐客製")
-            render_opt(t5, "drink_tags", get_config_list("config_options", "option_value", "drink_tags"), "飲料客製")
-        elif pwd_input: st.error("🚫 密碼錯誤")
-        else: st.caption("修改人員或菜單需驗證")
+    admin_panel = st.expander("🔧 進階設定", key="exp_admin", on_change="rerun")
+    with admin_panel:
+        if admin_panel.open:
+            pwd_input = st.text_input("輸入管理員密碼", type="password", key="admin_pwd")
+            # 修改：比對變數現在來自 Secrets
+            if pwd_input == ADMIN_PASSWORD:
+                st.success("🔓 已解鎖")
+                st.write("**👥 人員名單**")
+                edited_colleagues = st.data_editor(get_config_list("config_colleagues", "name"), num_rows="dynamic", 
+                    column_config={"name": st.column_config.TextColumn("姓名", required=True)},
+                    key="ed_col", width="stretch", hide_index=True)
+                if st.button("💾 儲存人員"):
+                    res = update_config_list("config_colleagues", "name", edited_colleagues)
+                    if res: st.toast(f"✅ 已更新 (新增 {res[0]} / 移除 {res[1]})"); st.rerun()
+                st.divider()
+                st.write("**🛠️ 菜單選項**")
+                t1, t2, t3, t4, t5 = st.tabs(["辣度", "冰塊", "甜度", "🍱主餐客製", "🥤飲料客製"], key="admin_opt_tab", on_change="rerun")
+                def render_opt(tab, cat, lbl):
+                    with tab:
+                        if not tab.open: return
+                        ed = st.data_editor(get_config_list("config_options", "option_value", cat), num_rows="dynamic",
+                            column_config={"option_value": st.column_config.TextColumn(lbl, required=True)},
+                            key=f"ed_{cat}", width="stretch", hide_index=True)
+                        if st.button(f"儲存{lbl}", key=f"btn_{cat}"):
+                            res = update_config_list("config_options", "option_value", ed, cat)
+                            if res: st.toast(f"✅ 已更新 (新增 {res[0]} / 移除 {res[1]})"); st.rerun()
+                render_opt(t1, "spicy", "辣度")
+                render_opt(t2, "ice", "冰塊")
+                render_opt(t3, "sugar", "甜度")
+                render_opt(t4, "tags", "主餐客製")
+                render_opt(t5, "drink_tags", "飲料客製")
+                st.divider()
+                st.write("**🏢 群組**")
+                st.caption("每個群組有自己的人員、選項、店家與訂單 (各自一個資料庫檔案)")
+                c_g, c_b = st.columns([3, 1])
+                new_group = c_g.text_input("新群組代號", placeholder="英數字、- 或 _", key="new_group",
+                                           label_visibility="collapsed").strip()
+                if c_b.button("➕ 建立", key="btn_new_group") and new_group:
+                    try:
+                        if ui_call(create_group, new_group, seed=get_defaults_from_secrets):
+                            st.query_params["group"] = new_group
+                            st.rerun()
+                    except ValueError as e: st.error(f"🚫 {e}")
+                st.divider()
+                st.write("**📈 效能監控**")
+                t = metrics.totals()
+                st.caption(f"累計 {t['runs']} 次 rerun / {t['queries']} 個 SQL / {t['rows']} 筆資料 / "
+                           f"{t['writes']} 次寫入 / lock 重試 {t['lock_retries']} 次 / 冷啟動 {t['cold_start_ms']} ms "
+                           f"(最近 {metrics.RING_SIZE} 次的分佈如下)")
+                st.dataframe(metrics.summary(), hide_index=True, width="stretch")
+                recent_panel = st.expander("最近 20 次", key="exp_metrics_recent", on_change="rerun")
+                with recent_panel:
+                    recent = metrics.recent(20) if recent_panel.open else []
+                    for r in recent:
+                        r['at'] = datetime.fromtimestamp(r['at']).strftime("%H:%M:%S")
+                        r['sections_ms'] = ", ".join(f"{k} {v}" for k, v in r['sections_ms'].items())
+                    if recent: st.dataframe(recent, hide_index=True, width="stretch")
+            elif pwd_input: st.error("🚫 密碼錯誤")
+            else: st.caption("修改人員或菜單需驗證")
 
 # ==========================================
 # 4. 統計看板 (Visual Optimized)
 # ==========================================
-# 修正：移除 run_every=10，避免 "Fragment does not exist" 錯誤
-@st.fragment
+# 定時 rerun 這個 fragment；沒有新異動時只比對記憶體中的 revision，彙總直接用共用快取 (shared_view)，不查資料庫
+@st.fragment(run_every=LIVE_REFRESH_EVERY)
+@metrics.timed("stats")
 def render_stats_section():
-    # 新增手動刷新按鈕
-    c_ref_text, c_ref_btn = st.columns([6, 1])
-    with c_ref_text:
-        st.markdown(f'<div class="refresh-text">最後更新 | {datetime.now().strftime("%H:%M:%S")}</div>', unsafe_allow_html=True)
-    with c_ref_btn:
-        if st.button("🔄", help="手動刷新", key="btn_refresh_stats"):
-            st.rerun()
-
+    render_sync_status(current_revision())
     r_name = get_shop_name("main")
     d_name = get_shop_name("drink")
-    df_all = get_db("SELECT * FROM orders")
-    if df_all.empty: st.info("📦 目前尚無訂單，等待第一筆資料..."); return
-
-    def show_stats_optimized(df_source, title, icon_class):
-        total_qty = df_source['quantity'].sum() if not df_source.empty else 0
-        st.markdown(f'<div class="section-header {icon_class}"><div>{title}</div><div>共 {total_qty} 份</div></div>', unsafe_allow_html=True)
-        if df_source.empty: st.caption("無資料"); return
+    if not shared_view(order_count): st.info("📦 目前尚無訂單，等待第一筆資料..."); return
+
+    def show_stats_optimized(cat, title, icon_class):
+        # 截止之後畫送出當下的紀錄 (已經在記憶體裡)，不再查訂單
+        sub = deadlines.submission(cat)
+        view = sub.view if sub else shared_view(stats_view, cat)
+        if sub: title += f" · 🔒 {hhmm(sub.submitted_at)} 已送出"
+        st.markdown(f'<div class="section-header {icon_class}"><div>{title}</div><div>共 {view["qty"]} 份</div></div>', unsafe_allow_html=True)
+        if view["details"].empty: st.caption("無資料"); return
         c_sum, c_det = st.columns([1, 1.2])
         
         # --- 彙總表 (店家用) ---
         with c_sum:
             st.markdown("**📦 彙總表 (店家用)**")
-            summary = df_source.groupby(['item_name', 'custom'])['quantity'].sum().reset_index()
-            summary.columns = ['餐點', '客製', '總量']
-            for idx, row in summary.iterrows():
-                with st.container(border=True):
-                    c_qty, c_info = st.columns([1, 4])
-                    with c_qty: 
-                        st.markdown(f'<div class="qty-badge">x{row["總量"]}</div>', unsafe_allow_html=True)
-                    with c_info:
-                        st.markdown(f'<div class="card-title">{idx + 1}. {row["餐點"]}</div>', unsafe_allow_html=True)
-                        if row['客製']: 
-                            safe_custom = row['客製'].replace("|", "<span style='color:#FF4B4B; font-weight:bold'>|</span>")
-                            st.markdown(f'<div class="card-meta">{safe_custom}</div>', unsafe_allow_html=True)
-            st.metric("該區總額", f"${df_source['price'].sum()}")
+            st.markdown(render.summary_cards(view["summary"]), unsafe_allow_html=True)
+            st.metric("該區總額", f"${view['price']}")
+            export_buttons("summary", f"summary_{cat}", category=cat)
+            if sub:
+                st.markdown("**💰 應收明細 (送出當下)**")
+                st.dataframe(sub.payments, hide_index=True, width="stretch",
+                             column_config={"name": "姓名", "orders": "筆數",
+                                            "amount": st.column_config.NumberColumn("應付", format="$%d")})
 
         # --- 明細表 (核對用) ---
         with c_det:
             st.markdown("**📋 明細表 (核對用)**")
-            grouped_by_person = df_source.groupby('name')
-            for name, group in grouped_by_person:
-                with st.container(border=True):
-                    st.markdown(f'<div class="card-title">👤 {name}</div>', unsafe_allow_html=True)
-                    for _, row in group.iterrows():
-                        item_str = f'<div class="card-text">• {row["item_name"]} (x{row["quantity"]}) &nbsp;<span class="price-tag-sm">${row["price"]}</span></div>'
-                        st.markdown(item_str, unsafe_allow_html=True)
-                        if row['custom']: 
-                            safe_custom = row['custom'].replace("|", " <span style='color:#FF4B4B; font-weight:bold'>|</span> ")
-                            st.markdown(f'<div class="card-meta" style="margin-left:14px;">└ {safe_custom}</div>', unsafe_allow_html=True)
-
-    show_stats_optimized(df_all[df_all['category'] == '主餐'], f"🍱 {r_name} (主餐)", "header-food")
+            details = view["details"]
+            names = paginate(details['name'].unique(), key=f"page_det_{cat}")
+            if len(names) < details['name'].nunique(): details = details[details['name'].isin(names)]
+            st.markdown(render.person_details(details), unsafe_allow_html=True)
+
+    show_stats_optimized('主餐', f"🍱 {render.esc(r_name)} (主餐)", "header-food")
     st.divider()
-    show_stats_optimized(df_all[df_all['category'] == '飲料'], f"🥤 {d_name} (飲料)", "header-drink")
+    show_stats_optimized('飲料', f"🥤 {render.esc(d_name)} (飲料)", "header-drink")
 
 # ==========================================
 # 5. 收款管理 (Visual Optimized)
 # ==========================================
-# 修正：移除 run_every=10，避免 "Fragment does not exist" 錯誤
-@st.fragment
+# 定時 rerun 這個 fragment；沒有新異動時只比對記憶體中的 revision，彙總直接用共用快取 (shared_view)，不查資料庫
+@st.fragment(run_every=LIVE_REFRESH_EVERY)
+@metrics.timed("payment")
 def render_payment_section():
-    # 新增手動刷新按鈕
-    c_ref_text, c_ref_btn = st.columns([6, 1])
-    with c_ref_text:
-        st.markdown(f'<div class="refresh-text">最後更新 | {datetime.now().strftime("%H:%M:%S")}</div>', unsafe_allow_html=True)
-    with c_ref_btn:
-        if st.button("🔄", help="手動刷新", key="btn_refresh_payment"):
-            st.rerun()
-
-    df_all = get_db("SELECT * FROM orders")
-    if df_all.empty: st.write("尚無訂單。"); return
+    show_notifications()
+    rev = current_revision()  # 先讀版本再讀彙總：按鈕最多只結清這個版本的訂單，不會收到畫面上還沒出現的
+    render_sync_status(rev)
+    if not shared_view(order_count): st.write("尚無訂單。"); return
     
-    total = df_all['price'].sum()
-    paid = df_all[df_all['is_paid'] == 1]['price'].sum()
+    paid, total = shared_view(payment_progress)
     prog = paid / total if total > 0 else 0
     st.markdown(f'<div class="section-header header-money"><div>💰 收款進度</div><div>${paid} / ${total}</div></div>', unsafe_allow_html=True)
     st.progress(prog)
     if prog == 1.0 and total > 0: st.success("🎉 太棒了！款項已全數收齊！")
+    export_buttons("ledger", "ledger")
+    ledger_panel = st.expander("🧾 收款紀錄", key="exp_ledger", on_change="rerun")
+    with ledger_panel:
+        if ledger_panel.open:
+            st.dataframe(shared_view(payment_ledger), hide_index=True, width="stretch",
+                         column_config={"id": None, "time": "時間", "name": "姓名", "kind": "類型",
+                                        "amount": st.column_config.NumberColumn("金額", format="$%d"), "orders": "筆數"})
     
-    t1, t2 = st.tabs(["🍱 主餐收款", "🥤 飲料收款"])
-    with t1: _pay_logic_grouped("主餐", df_all[df_all['category'] == '主餐'], "main")
-    with t2: _pay_logic_grouped("飲料", df_all[df_all['category'] == '飲料'], "drink")
-
-def _pay_logic_grouped(cat, df, k):
-    if df.empty: st.caption("無資料"); return
-    unpaid_df = df[df['is_paid'] == 0]
+    t1, t2 = st.tabs(["🍱 主餐收款", "🥤 飲料收款"], key="pay_tab", on_change="rerun")
+    with t1:
+        if t1.open: _pay_logic_grouped("主餐", "main", rev)
+    with t2:
+        if t2.open: _pay_logic_grouped("飲料", "drink", rev)
+
+def _pay_logic_grouped(cat, k, rev):
+    # rev：按鈕只結清這個版本畫面上看得到的訂單
+    view = shared_view(payment_view, cat)
+    unpaid, paid = view["unpaid"], view["paid"]
+    if unpaid.empty and paid.empty: st.caption("無資料"); return
     
-    if not unpaid_df.empty:
-        grouped_unpaid = unpaid_df.groupby('name')
-        st.markdown(f"**⚠️ 待收款 ({len(grouped_unpaid)} 人)**")
-        for name, group in grouped_unpaid:
-            total_price = group['price'].sum()
-            ids = group['id'].tolist()
+    if not unpaid.empty:
+        items_by_person = view["unpaid_items"].groupby('name', sort=False)
+        c_title, c_all = st.columns([3, 1.2])
+        c_title.markdown(f"**⚠️ 待收款 ({len(unpaid)} 人)**")
+        c_all.button(f"全部收款 (${unpaid['price'].sum()})", key=f"pay_all_{k}", width="stretch",
+                     on_click=settle_everyone, args=(cat, rev))
+        page = set(paginate(unpaid['name'], key=f"page_pay_{k}"))
+        for name, total_price, _ in unpaid.itertuples(index=False):
+            if name not in page: continue
             with st.container(border=True):
                 c_header, c_btn = st.columns([3, 1.2])
                 with c_header:
                     st.markdown(f'<div style="display:flex; justify-content:space-between; align-items:center;">'
-                                f'<span class="card-title">👤 {name}</span>'
+                                f'<span class="card-title">👤 {render.esc(name)}</span>'
                                 f'<span class="price-tag">${total_price}</span>'
                                 f'</div>', unsafe_allow_html=True)
                 with c_btn:
-                    if st.button("收款", key=f"pay_{k}_{name}", width="stretch", type="primary"):
-                        placeholders = ','.join('?' * len(ids))
-                        execute_db(f"UPDATE orders SET is_paid = 1 WHERE id IN ({placeholders})", tuple(ids))
-                        st.toast(f"💰 已收: {name} (${total_price})"); st.rerun()
-                st.markdown("---")
-                for _, row in group.iterrows():
-                    r1, r2 = st.columns([4, 1])
-                    with r1: 
-                        st.markdown(f'<span class="card-text"><b>{row["item_name"]}</b> &nbsp;<span style="color:gray; font-size:0.9rem">x{row["quantity"]}</span></span>', unsafe_allow_html=True)
-                    with r2: 
-                        st.markdown(f'<div style="text-align:right" class="price-tag-sm">${row["price"]}</div>', unsafe_allow_html=True)
-                    if row['custom']: 
-                        safe_custom = row['custom'].replace("|", " <span style='color:#FF4B4B; font-weight:bold'>|</span> ")
-                        st.markdown(f'<div class="card-meta">└ {safe_custom}</div>', unsafe_allow_html=True)
+                    st.button("收款", key=f"pay_{k}_{name}", width="stretch", type="primary",
+                              on_click=settle_person, args=(name, cat, rev, True, total_price))
+                items = items_by_person.get_group(name)[['item_name', 'quantity', 'price', 'custom']]
+                st.markdown(render.payment_items(items.itertuples(index=False)), unsafe_allow_html=True)
     else: st.success("👍 此區全數已付款！")
 
-    paid_df = df[df['is_paid'] == 1]
-    if not paid_df.empty:
-        st.write(""); grouped_paid = paid_df.groupby('name')
-        with st.expander(f"✅ 已付款名單 ({len(grouped_paid)} 人) - 點此展開撤銷"):
-            for name, group in grouped_paid:
-                total_price = group['price'].sum()
-                ids = group['id'].tolist()
+    if not paid.empty:
+        st.write("")
+        paid_panel = st.expander(f"✅ 已付款名單 ({len(paid)} 人) - 點此展開撤銷", key=f"exp_paid_{k}", on_change="rerun")
+        with paid_panel:
+            for name, total_price, _ in (paid.itertuples(index=False) if paid_panel.open else ()):
                 c1, c2 = st.columns([3, 1.2])
                 with c1: st.write(f"~~{name} (${total_price})~~") 
                 with c2:
-                    if st.button("撤銷", key=f"undo_{k}_{name}", width="stretch"):
-                        placeholders = ','.join('?' * len(ids))
-                        execute_db(f"UPDATE orders SET is_paid = 0 WHERE id IN ({placeholders})", tuple(ids))
-                        st.toast(f"↩️ 已撤銷: {name}"); st.rerun()
+                    st.button("撤銷", key=f"undo_{k}_{name}", width="stretch",
+                              on_click=settle_person, args=(name, cat, rev, False, total_price))
+
+# ==========================================
+# 6. 歷史分析
+# ==========================================
+# 只讀每日彙總表 (analytics.py)，不掃訂單，也不需要跟著新訂單即時更新
+def render_analytics_section():
+    period = st.segmented_control("期間", list(analytics.PERIODS), default="近 90 天", key="analytics_period",
+                                  label_visibility="collapsed") or "近 90 天"
+    days = analytics.PERIODS[period]
+    since = analytics.period_start(days)
+    order_count, revenue, people, unpaid = analytics.totals(since)
+    if not order_count: st.info("📈 這段期間還沒有訂單"); return
+    for col, (label, value) in zip(st.columns(4), (("訂單", order_count), ("營業額", f"${revenue}"),
+                                                   ("點餐人數", people), ("未收金額", f"${unpaid}"))):
+        col.metric(label, value)
+
+    st.markdown("**🏪 各店家營業額**")
+    st.bar_chart(analytics.shop_trend(since, analytics.bucket_for(days)), x="period", y="revenue", color="shop",
+                 x_label="", y_label="營業額")
+    for col, (cat, icon) in zip(st.columns(2), (("主餐", "🍱"), ("飲料", "🥤"))):
+        with col:
+            st.markdown(f"**{icon} 熱門{cat}**")
+            items = analytics.top_items(since, cat)
+            if items.empty: st.caption("無資料"); continue
+            st.bar_chart(items, x="item_name", y="quantity", horizontal=True, sort="-quantity", x_label="份數", y_label="")
+            customs = analytics.top_customs(since, cat, limit=5)
+            if not customs.empty:
+                st.dataframe(customs, hide_index=True, width="stretch",
+                             column_config={"custom": "常見客製", "orders": "筆數", "quantity": "份數"})
+
+    st.markdown("**⏰ 付款狀況** (未付筆數多、付款慢的在前)")
+    st.dataframe(analytics.payment_habits(since), hide_index=True, width="stretch",
+        column_config={"name": "姓名", "orders": "筆數", "unpaid_orders": "未付筆數", "unpaid": "未付金額",
+                       "avg_pay_minutes": st.column_config.NumberColumn("平均付款時間 (分鐘)", format="%.1f")})
 
 # ==========================================
-# 6. 主畫面 (Main App)
+# 7. 主畫面 (Main App)
 # ==========================================
-st.title("🍱 點餐哦各位～")
-tab1, tab2, tab3 = st.tabs(["📝 我要點餐", "📊 統計看板", "💰 收款管理"])
+st.title("🍱 點餐哦各位～" + (f" · {group}" if group != DEFAULT_GROUP else ""))
+# 分頁是 lazy 的 (on_change="rerun")：只有開著的那一頁會執行，在點餐頁打字時看板/收款的查詢與
+# 上百個 widget 都不會跑；切換分頁時才 rerun 一次，把新分頁畫出來
+tab1, tab2, tab3, tab4 = st.tabs(["📝 我要點餐", "📊 統計看板", "💰 收款管理", "📈 歷史分析"], key="main_tab", on_change="rerun")
+
+# 看板/收款要在 tab1 的 st.stop() 之前渲染：未登入時 fragment 若沒被註冊，
+# run_every 觸發時就會出現 "Fragment does not exist"
+with tab2:
+    if tab2.open: render_stats_section()
+with tab3:
+    if tab3.open: render_payment_section()
+with tab4, metrics.section("analytics"):
+    if tab4.open: render_analytics_section()
 
 @st.dialog("👤 請選擇你的名字")
 def login_dialog():
@@ -479,14 +657,41 @@ def custom_dialog(key_prefix, tag_options):
         st.session_state[f"{key_prefix}_manual"] = new_manual
         st.rerun()
 
+# --- 菜單記憶：輸入名稱時的建議與自動帶入單價 (menu.py，查詢只要幾 µs) ---
+def fill_price(prefix, cat, shop):
+    # on_change：名稱是這家店點過的品項時，在這次 rerun 畫出單價欄位之前帶入上次的單價
+    hit = menu.lookup(cat, shop, st.session_state.get(f"{prefix}_name", ""))
+    if hit: st.session_state[f"{prefix}_price"] = hit[1]
+
+def pick_suggestion(prefix, cat, shop):
+    picked = st.session_state.get(f"{prefix}_suggest")
+    st.session_state[f"{prefix}_suggest"] = None
+    if picked:
+        st.session_state[f"{prefix}_name"] = picked
+        fill_price(prefix, cat, shop)
+
+def menu_suggestions(prefix, cat, shop, typed):
+    # 還沒輸入時列出最常點的，有輸入時列出名稱以此開頭的；已經完全符合就不再顯示
+    hits = menu.suggest(cat, shop, typed)
+    if not hits or [h[0] for h in hits] == [typed]: return
+    prices = {name: price for name, price, _ in hits}
+    st.pills("點過的品項", list(prices), key=f"{prefix}_suggest", selection_mode="single", label_visibility="collapsed",
+             format_func=lambda n: f"{n} ${prices[n]}", on_change=pick_suggestion, args=(prefix, cat, shop))
+
 if 'user_name' not in st.session_state: st.session_state['user_name'] = None
 if 'm_custom_tags' not in st.session_state: st.session_state['m_custom_tags'] = []
 if 'm_custom_manual' not in st.session_state: st.session_state['m_custom_manual'] = ""
 if 'd_custom_tags' not in st.session_state: st.session_state['d_custom_tags'] = []
 if 'd_custom_manual' not in st.session_state: st.session_state['d_custom_manual'] = ""
 
-with tab1:
-    if st.button("🔄 刷新頁面 (手動同步)", type="secondary", width="stretch"): st.rerun()
+if not tab1.open: metrics.end(); st.stop()
+
+# 點餐頁也是 fragment：打字、選選項、加入/刪除都只重跑這一區，側邊欄與其他分頁不會跟著重畫
+@st.fragment
+@metrics.timed("order_form")
+def render_order_section():
+    show_notifications()
+    st.button("🔄 刷新頁面 (手動同步)", type="secondary", width="stretch")  # 按下就會重跑這一區並同步訂單
     
     with st.container(border=True):
         st.markdown('<h5>👤 請問你是誰？</h5>', unsafe_allow_html=True)
@@ -497,28 +702,26 @@ with tab1:
         with c_btn:
             if st.button("👤 登入/切換", width="stretch", type="primary" if not st.session_state['user_name'] else "secondary"):
                 login_dialog()
-        if not st.session_state['user_name']: st.stop()
+        if not st.session_state['user_name']: return
 
     user_name = st.session_state['user_name']
 
-    my_orders = get_db("SELECT * FROM orders WHERE name = ?", (user_name,))
+    df_orders = load_orders()
+    closed = {cat: deadlines.status(cat).frozen for cat in CATEGORIES}
+    my_orders = df_orders[df_orders['name'] == user_name]
     my_sum = my_orders['price'].sum() if not my_orders.empty else 0
     with st.expander(f"📋 {user_name} 的待點清單 (合計: ${my_sum})", expanded=True if not my_orders.empty else False):
         if my_orders.empty: st.caption("尚未點餐")
         else:
             for _, row in my_orders.iterrows():
-                c1, c2, c3, c4 = st.columns([0.5, 2.5, 1, 1])
-                c1.write("🍱" if row['category'] == '主餐' else "🥤")
-                c2.markdown(f'<span class="card-text"><b>{row["item_name"]}</b> x{row["quantity"]}</span>', unsafe_allow_html=True)
-                c3.markdown(f'<span class="price-tag-sm">${row["price"]}</span>', unsafe_allow_html=True)
-                with c4.popover("🗑️", help="點擊開啟刪除確認"):
+                c_info, c_del = st.columns([4, 1])
+                c_info.markdown(render.my_order_row(row['category'], row['item_name'], row['quantity'], row['price'], row['custom']),
+                                unsafe_allow_html=True)
+                if closed[row['category']]: c_del.caption("🔒"); continue  # 已經送給店家了
+                with c_del.popover("🗑️", help="點擊開啟刪除確認"):
                     st.write(f"確定刪除 **{row['item_name']}**？")
-                    if st.button("⭕ 確認刪除", key=f"confirm_del_{row['id']}", type="primary"):
-                        execute_db("DELETE FROM orders WHERE id = ?", (row['id'],))
-                        st.toast("✅ 已刪除"); st.rerun()
-                if row['custom']:
-                    safe_custom = row['custom'].replace("|", " <span style='color:#FF4B4B; font-weight:bold'>|</span> ")
-                    st.caption(f"└ {safe_custom}", unsafe_allow_html=True)
+                    st.button("⭕ 確認刪除", key=f"confirm_del_{row['id']}", type="primary",
+                              on_click=delete_order, args=(int(row['id']), user_name))
     st.write("") 
 
     current_main_shop = new_main_shop
@@ -526,13 +729,16 @@ with tab1:
 
     c_food, c_drink = st.columns(2)
     with c_food:
-        st.markdown(f'<div class="section-header header-food"><div>🍱 {current_main_shop} (主餐)</div></div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="section-header header-food"><div>🍱 {render.esc(current_main_shop)} (主餐)</div></div>', unsafe_allow_html=True)
         with st.container(border=True):
-            m_name = st.text_input("主餐名稱", placeholder="輸入餐點...", key="m_name")
+            main_closed = cutoff_notice("主餐")
+            m_name = st.text_input("主餐名稱", placeholder="輸入餐點...", key="m_name",
+                                   on_change=fill_price, args=("m", "主餐", current_main_shop))
+            menu_suggestions("m", "主餐", current_main_shop, m_name)
             cp, cq = st.columns(2)
-            m_price_unit = cp.number_input("單價", min_value=0, step=5, format="%d", key="m_price")
-            m_qty = cq.number_input("數量", min_value=1, step=1, value=1, key="m_qty")
-            m_spicy = st.pills("辣度", spicy_levels, default=spicy_levels[0], key="m_spicy", selection_mode="single")
+            cp.number_input("單價", min_value=0, step=5, format="%d", key="m_price")
+            cq.number_input("數量", min_value=1, step=1, value=1, key="m_qty")
+            st.pills("辣度", spicy_levels, default=spicy_levels[0], key="m_spicy", selection_mode="single")
             
             current_tags = st.session_state.get("m_custom_tags", [])
             current_manual = st.session_state.get("m_custom_manual", "")
@@ -548,42 +754,26 @@ with tab1:
                 if st.button(btn_label, type=btn_type, width="stretch", key="btn_m_custom"):
                     custom_dialog("m_custom", custom_tags_main)
             with c_cust_clear:
-                if st.button("❌", help="清空主餐客製", width="stretch", key="clr_m_custom"):
-                    st.session_state["m_custom_tags"] = []
-                    st.session_state["m_custom_manual"] = ""
-                    st.rerun()
+                st.button("❌", help="清空主餐客製", width="stretch", key="clr_m_custom", on_click=clear_custom, args=("m",))
             
             if display_list: st.caption(f"ℹ️ 準備加入: {display_text}")
 
-            if st.button("＋ 加入主餐", type="primary", width="stretch"):
-                if m_price_unit == 0: st.toast("🚫 無法加入：請輸入金額！", icon="⚠️")
-                elif m_name:
-                    parts = []
-                    if m_spicy != "無": parts.append(m_spicy)
-                    if display_list: parts.append(", ".join(display_list))
-                    cust = " | ".join(parts) if parts else ""
-                    
-                    total_p = m_price_unit * m_qty
-                    if execute_db("INSERT INTO orders (name, category, item_name, price, custom, quantity, order_time, is_paid) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
-                                  (user_name, "主餐", m_name, total_p, cust, m_qty, datetime.now().strftime('%Y-%m-%d %H:%M'))):
-                        st.session_state["m_custom_tags"] = []
-                        st.session_state["m_custom_manual"] = ""
-                        st.session_state["d_custom_tags"] = []
-                        st.session_state["d_custom_manual"] = ""
-                        st.toast(f"✅ 已加入：{m_name} x{m_qty}"); st.rerun()
-                else: st.toast("⚠️ 請輸入主餐名稱")
+            st.button("＋ 加入主餐", type="primary", width="stretch", on_click=submit_order, args=("主餐",), disabled=main_closed)
 
     with c_drink:
-        st.markdown(f'<div class="section-header header-drink"><div>🥤 {current_drink_shop} (飲料)</div></div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="section-header header-drink"><div>🥤 {render.esc(current_drink_shop)} (飲料)</div></div>', unsafe_allow_html=True)
         with st.container(border=True):
-            d_name = st.text_input("飲料名稱", placeholder="輸入飲料...", key="d_name")
+            drink_closed = cutoff_notice("飲料")
+            d_name = st.text_input("飲料名稱", placeholder="輸入飲料...", key="d_name",
+                                   on_change=fill_price, args=("d", "飲料", current_drink_shop))
+            menu_suggestions("d", "飲料", current_drink_shop, d_name)
             cp, cq = st.columns(2)
-            d_price_unit = cp.number_input("單價", min_value=0, step=5, format="%d", key="d_price")
-            d_qty = cq.number_input("數量", min_value=1, step=1, value=1, key="d_qty")
+            cp.number_input("單價", min_value=0, step=5, format="%d", key="d_price")
+            cq.number_input("數量", min_value=1, step=1, value=1, key="d_qty")
             
-            d_size = st.pills("尺寸", ["M(中杯)", "L(大杯)", "XL(特大杯)"], default="L(大杯)", key="d_size", selection_mode="single")
-            d_sugar = st.pills("甜度", sugar_levels, default=sugar_levels[0], key="d_sugar", selection_mode="single")
-            d_ice = st.pills("冰塊", ice_levels, default=ice_levels[0], key="d_ice", selection_mode="single")
+            st.pills("尺寸", DRINK_SIZES, default="L(大杯)", key="d_size", selection_mode="single")
+            st.pills("甜度", sugar_levels, default=sugar_levels[0], key="d_sugar", selection_mode="single")
+            st.pills("冰塊", ice_levels, default=ice_levels[0], key="d_ice", selection_mode="single")
             
             d_current_tags = st.session_state.get("d_custom_tags", [])
             d_current_manual = st.session_state.get("d_custom_manual", "")
@@ -599,29 +789,12 @@ with tab1:
                 if st.button(d_btn_label, type=d_btn_type, width="stretch", key="btn_d_custom"):
                     custom_dialog("d_custom", custom_tags_drink)
             with dc_clear:
-                if st.button("❌", help="清空飲料客製", width="stretch", key="clr_d_custom"):
-                    st.session_state["d_custom_tags"] = []
-                    st.session_state["d_custom_manual"] = ""
-                    st.rerun()
+                st.button("❌", help="清空飲料客製", width="stretch", key="clr_d_custom", on_click=clear_custom, args=("d",))
 
             if d_display_list: st.caption(f"ℹ️ 準備加入: {d_display_text}")
 
-            if st.button("＋ 加入飲料", type="primary", width="stretch"):
-                if d_price_unit == 0: st.toast("🚫 無法加入：請輸入金額！", icon="⚠️")
-                elif d_name:
-                    base_config = f"{d_size}/{d_sugar}/{d_ice}"
-                    final_cust = base_config
-                    if d_display_list: final_cust += f" | {', '.join(d_display_list)}"
-
-                    total_p = d_price_unit * d_qty
-                    if execute_db("INSERT INTO orders (name, category, item_name, price, custom, quantity, order_time, is_paid) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
-                                  (user_name, "飲料", d_name, total_p, final_cust, d_qty, datetime.now().strftime('%Y-%m-%d %H:%M'))):
-                        st.session_state["d_custom_tags"] = []
-                        st.session_state["d_custom_manual"] = ""
-                        st.session_state["m_custom_tags"] = []
-                        st.session_state["m_custom_manual"] = ""
-                        st.toast(f"✅ 已加入：{d_name} x{d_qty}"); st.rerun()
-                else: st.toast("⚠️ 請輸入飲料名稱")
-
-with tab2: render_stats_section()
-with tab3: render_payment_section()
+            st.button("＋ 加入飲料", type="primary", width="stretch", on_click=submit_order, args=("飲料",), disabled=drink_closed)
+
+with tab1:
+    render_order_section()
+metrics.end()
@@ -0,0 +1,341 @@
+"""訂餐服務層：下單 / 刪單 / 收款 / 彙總
+
+不依賴 Streamlit 畫面，order.py、壓測腳本、外部整合都呼叫同一組函式。
+寫入一律交給 db.run_write (writer 執行緒)，失敗時直接丟出例外，由呼叫端決定怎麼顯示。
+
+另外附一個很輕的 HTTP/JSON 介面 (標準函式庫 http.server)：
+    python orders.py --port 8600
+或在 Streamlit 裡設定環境變數 ORDER_API_PORT，跟畫面共用同一條 writer 執行緒。
+
+    GET    /orders[?name=]               目前場次的訂單
+    GET    /summary?category=主餐        總份數/總額/(餐點, 客製) 彙總
+    GET    /person_totals?category=主餐&paid=0
+    GET    /menu?category=主餐&prefix=鍋[&shop=]   點過的品項與上次單價 (店家預設為目前設定的店家)
+    POST   /orders    {"name": ..., "category": ..., "item_name": ..., "price": ..., "custom": ..., "quantity": ...}
+                      或 {"orders": [...]}  整批在同一個 transaction 寫入
+                      custom 可以是舊格式字串，或 {"size", "sugar", "ice", "spice", "tags": [...], "note"}
+    GET    /export/<summary|ledger>.<txt|csv|parquet>[?category=&archive=1&since=YYYY-MM-DD&until=YYYY-MM-DD]
+                      店家彙總表 / 每人收款明細，邊從資料庫讀邊送 (見 export.py)；archive=1 匯出已關帳的場次
+    DELETE /orders/<id>
+    POST   /paid      {"ids": [1, 2], "paid": true}
+    GET    /revision                     目前訂單的 revision (結清時帶上，只結清這個版本看得到的訂單)
+    POST   /settle    {"name": ..., "category": 主餐 (省略 = 全部), "rev": 123, "paid": true}   結清某人
+    POST   /settle_all {"category": ..., "rev": 123}  所有人一起結清
+    GET    /payments[?limit=]            收款紀錄與收款進度 (已收金額是收款紀錄的加總)
+    GET    /cutoff?category=主餐         截止狀態；已截止時附上送出當下的彙總表與每人應付金額
+    POST   /cutoff/submit {"category": ...}   立即截止送出 (之後這家店的 POST /orders 回 400)
+    POST   /cutoff/reopen {"category": ...}   重新開放
+
+每個路徑都可以加 ?group=<群組>，操作該群組的資料庫 (預設為預設群組；群組需先在畫面上建立)。
+錯誤一律回 {"error": ...}：參數錯誤 400、找不到 404、違反約束 409、資料庫忙碌 503、其他資料庫錯誤 500。
+"""
+import argparse
+import itertools
+import json
+import os
+import signal
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+import db
+import deadlines
+import export
+import menu
+
+CATEGORIES = db.CATEGORIES
+
+# ?2 是 cat：訂單記下當下設定的店家
+INSERT_SQL = ("INSERT INTO orders (name, cat, item_name, price, quantity, custom_id, ordered_at, is_paid, session_id, shop_id) "
+              f"VALUES (?, ?, ?, ?, ?, ?, ?, 0, {db.CURRENT_SESSION_SQL}, {db.CURRENT_SHOP_SQL.format('?2')})")
+
+
+def _customization(custom, category):
+    if isinstance(custom, db.Customization): return custom
+    if isinstance(custom, dict): return db.Customization(**custom)
+    # 舊格式字串：依目前的設定選項拆回結構，拆不回來就整串當備註
+    opts = db.load_config()["options"]
+    known = {"spice": set(opts.get("spicy", ())), "tags": set(opts.get("tags", ())) | set(opts.get("drink_tags", ()))}
+    return db.Customization.parse(custom, category, known)
+
+def _order_row(name, category, item_name, price, custom=None, quantity=1, ordered_at=None):
+    """檢查並轉成 (INSERT 參數, Customization)；price 是這筆的小計 (單價 x 數量)"""
+    name, item_name = str(name or "").strip(), str(item_name or "").strip()
+    if not name: raise ValueError("缺少點餐人")
+    if not item_name: raise ValueError("缺少品項名稱")
+    if category not in CATEGORIES: raise ValueError(f"不支援的類別: {category}")
+    price, quantity = int(price), int(quantity)
+    if price <= 0: raise ValueError("金額必須大於 0")
+    if quantity <= 0: raise ValueError("數量必須大於 0")
+    return ((name, db.CATEGORY_IDS[category], item_name, price, quantity, int(ordered_at or time.time())),
+            _customization(custom, category))
+
+def _write_new(fn):
+    # 店家截止之後的新訂單會被 trg_orders_cutoff 擋下，轉成 ValueError (HTTP 回 400)
+    try: return db.run_write(fn)
+    except sqlite3.IntegrityError as e:
+        if str(e) != db.CUTOFF_ERROR: raise
+        db.invalidate_config()  # 可能是其他 process 送出的：讓畫面的截止狀態重新讀取
+        raise ValueError("店家已截止點餐，無法再加點") from e
+
+def _insert(conn, order):
+    (name, cat, item_name, price, quantity, ordered_at), cz = order
+    custom_id = db.intern_customization(conn, cz)
+    return conn.execute(INSERT_SQL, (name, cat, item_name, price, quantity, custom_id, ordered_at)).lastrowid
+
+# ==========================================
+# 寫入
+# ==========================================
+def add_order(name: str, category: str, item_name: str, price: int, custom=None, quantity: int = 1) -> int:
+    """新增一筆訂單，回傳訂單 id。custom 是 db.Customization、同欄位的 dict，或舊格式字串"""
+    order = _order_row(name, category, item_name, price, custom, quantity)
+    return _write_new(lambda conn: _insert(conn, order))
+
+def submit_batch(orders: list) -> list:
+    """一次寫入多筆訂單 (dict，欄位同 add_order)；全部成功或全部不寫，回傳訂單 id 清單"""
+    rows = [_order_row(**o) for o in orders]
+    return _write_new(lambda conn: [_insert(conn, row) for row in rows])
+
+def remove_order(order_id: int, name: str | None = None) -> bool:
+    """刪除訂單；有給 name 時只能刪自己的。回傳是否真的有刪掉"""
+    if name is None:
+        query, params = "DELETE FROM orders WHERE id = ?", (int(order_id),)
+    else:
+        query, params = "DELETE FROM orders WHERE id = ? AND name = ?", (int(order_id), name)
+    return db.run_write(lambda conn: conn.execute(query, params).rowcount) > 0
+
+def _settle(conn, paid, name=None, category=None, upto_rev=None, ids=None):
+    # 把還沒是 paid 狀態的訂單改過去，每人記一筆收款紀錄 (payments)；查詢與更新在同一個 transaction。
+    # upto_rev：只動這個 revision 之後沒有異動過的訂單，晚來的新訂單、被別人改過的訂單都不會被一起結清
+    where, params = ["is_paid = ?"], [int(not paid)]
+    if name is not None: where.append("name = ?"); params.append(name)
+    if category is not None: where.append("cat = ?"); params.append(db.CATEGORY_IDS[category])
+    if ids is not None: where.append(f"id IN ({','.join('?' * len(ids))})"); params.extend(ids)
+    if upto_rev is not None:
+        where.append("id NOT IN (SELECT order_id FROM order_changes WHERE rev > ?)"); params.append(int(upto_rev))
+    rows = conn.execute(f"SELECT name, id, price FROM orders WHERE {' AND '.join(where)} ORDER BY name, id", params)
+    kind, sign = ("pay", 1) if paid else ("undo", -1)
+    settled = []
+    for who, group in itertools.groupby(rows.fetchall(), key=lambda r: r[0]):
+        group = list(group)
+        order_ids, amount = [r[1] for r in group], sign * sum(r[2] for r in group)
+        payment_id = conn.execute(f"INSERT INTO payments ({db.PAYMENT_COLUMNS}) VALUES ({db.CURRENT_SESSION_SQL}, "
+                                  f"?, ?, ?, ?, ?, {db.NOW_SQL})",
+                                  (who, kind, amount, ",".join(map(str, order_ids)), upto_rev)).lastrowid
+        # 收款時間給歷史分析算「多久才付款」；已經付過的維持第一次收款的時間
+        conn.execute(f"UPDATE orders SET is_paid = ?1, paid_at = CASE WHEN ?1 THEN COALESCE(paid_at, {db.NOW_SQL}) END, "
+                     f"payment_id = ?2 WHERE id IN ({','.join('?' * len(order_ids))})", (int(paid), payment_id, *order_ids))
+        settled.append({"payment_id": payment_id, "name": who, "amount": amount, "order_ids": order_ids})
+    return settled
+
+def settle(name: str, category: str | None = None, upto_rev: int | None = None, paid: bool = True) -> dict:
+    """結清某人 (某一類，None = 全部) 的未付訂單；paid=False 則是撤銷已付款。
+    upto_rev 是畫面讀到的 revision (OrderSnapshot.rev / GET /revision)：之後才加入或被改過的訂單不算，
+    頁面過期或連按兩次都不會多收。回傳這筆收款紀錄 {"payment_id", "name", "amount", "order_ids"}，
+    沒有可結清的訂單時 payment_id 為 None"""
+    name = str(name or "").strip()
+    if not name: raise ValueError("缺少付款人")
+    settled = db.run_write(lambda conn: _settle(conn, paid, name, category, upto_rev))
+    return settled[0] if settled else {"payment_id": None, "name": name, "amount": 0, "order_ids": []}
+
+def settle_all(category: str | None = None, upto_rev: int | None = None) -> list:
+    """所有人一次結清 (同一個 transaction，全部成功或全部不寫)，回傳每人一筆的收款紀錄 (同 settle)"""
+    return db.run_write(lambda conn: _settle(conn, True, None, category, upto_rev))
+
+def set_paid(ids: list, paid: bool = True) -> int:
+    """把指定的訂單標成已付款 / 未付款 (每人記一筆收款紀錄)，回傳更新筆數"""
+    ids = [int(i) for i in ids]
+    if not ids: return 0
+    settled = db.run_write(lambda conn: _settle(conn, paid, ids=ids))
+    return sum(len(s["order_ids"]) for s in settled)
+
+# ==========================================
+# 讀取
+# ==========================================
+def list_orders(name: str | None = None):
+    """目前場次的訂單 (DataFrame，欄位同舊版：category / custom 為文字，order_time 為 YYYY-mm-dd HH:MM)"""
+    if name is None: return db.get_db("SELECT * FROM orders_legacy ORDER BY id")
+    return db.get_db("SELECT * FROM orders_legacy WHERE name = ? ORDER BY id", (name,))
+
+def summary(category: str) -> dict:
+    """某一類的總份數、總額、(餐點, 客製) 彙總與每人明細，見 db.stats_view"""
+    return db.stats_view(category)
+
+def person_totals(category: str, paid: bool = False):
+    """每人合計金額與訂單 id (DataFrame: name, price, ids)"""
+    return db.person_totals(category, int(paid))
+
+def revision() -> int:
+    """目前訂單的 revision：先取 revision 再讀訂單，結清時帶上它 (settle 的 upto_rev)"""
+    return db.get_manager().read_revision()
+
+def payments(limit: int = 200):
+    """這一場的收款紀錄 (DataFrame: id, time, name, kind, amount, orders)，見 db.payment_ledger"""
+    return db.payment_ledger(limit)
+
+def cutoff_status(category: str) -> dict:
+    """店家的截止狀態；已截止時附上送出當下的彙總與每人應付金額 (見 deadlines.py)"""
+    s = deadlines.status(category)
+    out = {"cutoff": s.cutoff, "deadline_at": s.deadline_at, "submitted_at": s.submitted_at,
+           "reopened_at": s.reopened_at, "frozen": s.frozen}
+    sub = deadlines.submission(category)
+    if sub is not None:
+        out.update(shop=sub.shop, order_count=sub.order_count, quantity=sub.view["qty"], total=sub.view["price"],
+                   summary=sub.view["summary"], payments=sub.payments)
+    return out
+
+def menu_items(category: str, prefix: str = "", shop: str | None = None, limit: int = menu.SUGGEST_LIMIT) -> list:
+    """這家店點過、名稱以 prefix 開頭的品項 [{"item_name", "unit_price", "uses"}]，見 menu.suggest"""
+    if shop is None: shop = db.get_shop_name(db.SHOP_KEYS[db.CATEGORY_IDS[category]])
+    return [{"item_name": n, "unit_price": p, "uses": u} for n, p, u in menu.suggest(category, shop, prefix, limit)]
+
+class Download:
+    """串流下載：HTTP 介面收到時不轉 JSON，直接把 chunks 一塊一塊寫出去"""
+    __slots__ = ("file_name", "content_type", "chunks")
+
+    def __init__(self, file_name, content_type, chunks):
+        self.file_name = file_name
+        self.content_type = content_type
+        self.chunks = chunks
+
+def export_report(report: str, fmt: str, **kwargs) -> Download:
+    """店家彙總表 / 每人收款明細 (參數見 export.file_name)"""
+    chunks = export.stream(report, fmt, **kwargs)  # 先檢查參數
+    return Download(export.file_name(report, fmt, **kwargs), export.FORMATS[fmt][0], chunks)
+
+# ==========================================
+# HTTP/JSON 介面
+# ==========================================
+def _jsonable(obj):
+    if hasattr(obj, "to_dict"): return obj.to_dict(orient="records")
+    if hasattr(obj, "item"): return obj.item()  # numpy 純量
+    raise TypeError(f"無法轉成 JSON: {type(obj)}")
+
+
+class OrderAPIHandler(BaseHTTPRequestHandler):
+    def _send(self, status, payload):
+        if isinstance(payload, Download): return self._send_download(payload)
+        body = json.dumps(payload, ensure_ascii=False, default=_jsonable).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_download(self, download):
+        # HTTP/1.0 不帶 Content-Length：送完關閉連線就是結尾，整份檔案不用先放在記憶體
+        self.send_response(200)
+        self.send_header("Content-Type", download.content_type)
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(download.file_name)}")
+        self.end_headers()
+        for chunk in download.chunks:
+            self.wfile.write(chunk)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _dispatch(self, route):
+        group = parse_qs(urlparse(self.path).query).get("group", [db.DEFAULT_GROUP])[0]
+        try:
+            if not db.group_exists(group):
+                self._send(404, {"error": f"找不到群組: {group}"})
+                return
+            db.use_group(group)  # ThreadingHTTPServer 每個 request 一條執行緒
+            db.ensure_schema()
+            status, payload = route()
+            if isinstance(payload, Download):  # 先讀第一塊：查詢失敗時還來得及回錯誤碼
+                first = next(payload.chunks, b"")
+                payload.chunks = itertools.chain((first,), payload.chunks)
+        except (ValueError, TypeError, KeyError) as e:
+            status, payload = 400, {"error": str(e)}
+        except (sqlite3.OperationalError, TimeoutError) as e:
+            status, payload = 503, {"error": f"資料庫忙碌: {e}"}
+        except sqlite3.IntegrityError as e:  # 截止的已在 _write_new 轉成 ValueError，這裡是其他約束
+            status, payload = 409, {"error": str(e)}
+        except sqlite3.Error as e:  # 例如資料庫檔案損毀：也要回 JSON，不要直接斷線
+            status, payload = 500, {"error": f"資料庫錯誤: {e}"}
+        self._send(status, payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        def route():
+            if url.path == "/orders": return 200, list_orders(q.get("name"))
+            if url.path == "/summary": return 200, summary(q["category"])
+            if url.path == "/person_totals":
+                return 200, person_totals(q["category"], q.get("paid", "0") not in ("0", "false"))
+            if url.path.startswith("/export/"):
+                report, _, fmt = url.path[len("/export/"):].partition(".")
+                return 200, export_report(report, fmt, category=q.get("category"), since=q.get("since"),
+                                          until=q.get("until"), archive=q.get("archive", "0") not in ("0", "false"))
+            if url.path == "/revision": return 200, {"rev": revision()}
+            if url.path == "/cutoff": return 200, cutoff_status(q["category"])
+            if url.path == "/payments":
+                paid, total = db.payment_progress()
+                return 200, {"paid": paid, "total": total, "entries": payments(int(q.get("limit", 200)))}
+            if url.path == "/menu":
+                return 200, menu_items(q["category"], q.get("prefix", ""), q.get("shop"), int(q.get("limit", menu.SUGGEST_LIMIT)))
+            return 404, {"error": "not found"}
+        self._dispatch(route)
+
+    def do_POST(self):
+        def route():
+            data, path = self._body(), urlparse(self.path).path
+            if path == "/orders":
+                if "orders" in data: return 201, {"ids": submit_batch(data["orders"])}
+                return 201, {"id": add_order(**data)}
+            if path == "/paid": return 200, {"updated": set_paid(data["ids"], data.get("paid", True))}
+            if path == "/settle":
+                return 200, settle(data["name"], data.get("category"), data.get("rev"), data.get("paid", True))
+            if path == "/settle_all": return 200, {"payments": settle_all(data.get("category"), data.get("rev"))}
+            if path == "/cutoff/submit": return 200, {"submitted": deadlines.submit(data["category"])}
+            if path == "/cutoff/reopen": return 200, {"reopened": deadlines.reopen(data["category"])}
+            return 404, {"error": "not found"}
+        self._dispatch(route)
+
+    def do_DELETE(self):
+        def route():
+            parts = urlparse(self.path).path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == "orders": return 200, {"deleted": remove_order(int(parts[1]))}
+            return 404, {"error": "not found"}
+        self._dispatch(route)
+
+    def log_message(self, fmt, *args):
+        pass  # 壓測時不要把每個 request 印出來
+
+
+def serve(host="127.0.0.1", port=8600, block=True):
+    """啟動 HTTP 介面 (資料庫需已由 order.py 建好)；block=False 時在背景執行緒跑並回傳 server"""
+    server = ThreadingHTTPServer((host, port), OrderAPIHandler)
+    if block:
+        server.serve_forever()
+    else:
+        threading.Thread(target=server.serve_forever, name="order-api", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="訂餐服務 HTTP/JSON 介面")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8600)
+    ap.add_argument("--db", default=db.DB_FILE)
+    args = ap.parse_args()
+    if not os.path.exists(args.db): raise SystemExit(f"找不到 {args.db}，請先啟動 order.py 建立資料庫")
+    db.DB_FILE = args.db
+    db.ensure_schema()  # 只補跑 migration；預設人員/選項由 order.py 第一次建庫時寫入
+    deadlines.start()  # 跟畫面同時跑也沒關係：同一場同一家店只會送出一次
+    print(f"order API on http://{args.host}:{args.port} ({args.db})")
+    server = serve(args.host, args.port, block=False)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    try: stopping.wait()
+    except KeyboardInterrupt: pass
+    finally:
+        # 依序停掉：不再收 request → 排程 → writer (已排入的寫入做完) 與連線
+        server.shutdown()
+        server.server_close()
+        deadlines.stop()
+        db.close_all()
@@ -0,0 +1,70 @@
+# ==========================================
+# 批次 HTML 區塊
+# ==========================================
+# 統計看板/收款頁的清單一次組成一整段 HTML，用一個 st.markdown 送出，
+# 取代每一列一組 st.container/st.columns/st.markdown (一列就是好幾個 websocket delta)。
+# 只有需要互動的按鈕 (收款/撤銷/刪除) 還保留逐列的 widget。
+# 注意：金額的 $ 一律寫成 &#36;，同一段 markdown 裡出現兩個 $ 會被當成 LaTeX 公式。
+# 使用者輸入的文字 (人名/品項/客製化/店名) 一律經過 esc()，不能直接塞進 unsafe_allow_html 的 HTML。
+# 同樣的品項/客製化字串會在幾十張訂單重複出現，所以轉換結果用 LRU 快取，每種字串只轉一次。
+import html
+from functools import lru_cache
+from itertools import groupby
+
+PIPE_HTML = "<span style='color:#FF4B4B; font-weight:bold'>|</span>"
+CACHE_SIZE = 1024  # 一天不同的品項/客製化字串大約幾十到幾百種
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def esc(text):
+    """使用者輸入的文字 → 可以安全放進 HTML 的字串 ($ 也要轉，換行會切斷 markdown 的 HTML 區塊)"""
+    return html.escape(str(text)).replace("$", "&#36;").replace("\n", " ")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def custom_html(custom, spaced=True):
+    """客製化字串 escape 之後，把分隔用的 | 標成紅色"""
+    if not custom: return ""
+    return esc(custom).replace("|", f" {PIPE_HTML} " if spaced else PIPE_HTML)
+
+
+def summary_cards(summary):
+    """彙總表 (店家用)：summary 欄位為 item_name, custom, quantity"""
+    parts = []
+    for idx, (item, custom, qty) in enumerate(summary.itertuples(index=False), 1):
+        meta = f'<div class="card-meta">{custom_html(custom, spaced=False)}</div>' if custom else ''
+        parts.append(f'<div class="card-box summary-card"><div class="qty-badge">x{qty}</div>'
+                     f'<div class="summary-info"><div class="card-title">{idx}. {esc(item)}</div>{meta}</div></div>')
+    return ''.join(parts)
+
+
+def person_details(details):
+    """明細表 (核對用)：details 欄位為 name, item_name, quantity, price, custom，需依 name 排序"""
+    parts = []
+    for name, rows in groupby(details.itertuples(index=False), key=lambda r: r[0]):
+        parts.append(f'<div class="card-box"><div class="card-title">👤 {esc(name)}</div>')
+        for _, item, qty, price, custom in rows:
+            parts.append(f'<div class="card-text">• {esc(item)} (x{qty}) &nbsp;<span class="price-tag-sm">&#36;{price}</span></div>')
+            if custom: parts.append(f'<div class="card-meta" style="margin-left:14px;">└ {custom_html(custom)}</div>')
+        parts.append('</div>')
+    return ''.join(parts)
+
+
+def payment_items(rows):
+    """收款頁某個人的待收款明細：rows 為 (item_name, quantity, price, custom)"""
+    parts = ['<hr style="margin:0.6em 0">']
+    for item, qty, price, custom in rows:
+        parts.append(f'<div class="pay-row"><span class="card-text"><b>{esc(item)}</b> &nbsp;'
+                     f'<span style="color:gray; font-size:0.9rem">x{qty}</span></span>'
+                     f'<span class="price-tag-sm">&#36;{price}</span></div>')
+        if custom: parts.append(f'<div class="card-meta">└ {custom_html(custom)}</div>')
+    return ''.join(parts)
+
+
+def my_order_row(category, item, qty, price, custom):
+    """我的待點清單其中一列 (刪除按鈕另外放)"""
+    icon = "🍱" if category == '主餐' else "🥤"
+    row_html = (f'<div class="pay-row"><span class="card-text">{icon}&nbsp; <b>{esc(item)}</b>&nbsp;x{qty}</span>'
+                f'<span class="price-tag-sm">&#36;{price}</span></div>')
+    if custom: row_html += f'<div class="card-meta">└ {custom_html(custom)}</div>'
+    return row_html